@@ -0,0 +1,186 @@
+"""
+Benchmark endpointing: SILENCE_DURATION cố định vs AdaptiveEndpointer
+Replay xác suất VAD của từng chunk, đo cho mỗi chiến lược:
+- Độ trễ ngắt câu: từ chunk giọng nói cuối cùng đến lúc endpointer ngắt
+- Tỉ lệ ngắt sớm: endpointer ngắt trong lúc user chỉ đang ngập ngừng (câu bị cắt làm đôi)
+
+    python benchmark_endpointing.py --wav-dir recordings/   # mỗi WAV = một lượt nói trọn vẹn
+    python benchmark_endpointing.py --synthetic 2000        # câu nói giả lập (không cần torch)
+
+WAV: 16-bit mono 16 kHz, mỗi file là MỘT lượt nói (có thể có ngập ngừng giữa câu). File <tên>.txt
+cùng chỗ (nếu có) là transcript, được đưa vào endpointer như transcript tạm của STT streaming
+sau --hint-delay giây kể từ chunk giọng nói cuối.
+"""
+
+import argparse
+import glob
+import os
+import wave
+import colorama
+import numpy as np
+
+from modules.endpointing import AdaptiveEndpointer, FixedEndpointer
+
+colorama.init()
+
+RATE = 16000
+CHUNK = 512
+CHUNK_SECONDS = CHUNK / RATE
+THRESHOLD = 0.5
+
+
+# ==================== DỮ LIỆU ====================
+
+def wav_probs(path, model):
+    """Xác suất Silero của từng chunk trong file WAV (None nếu sai định dạng)"""
+    import torch
+
+    with wave.open(path, 'rb') as wav:
+        if wav.getnchannels() != 1 or wav.getsampwidth() != 2 or wav.getframerate() != RATE:
+            return None
+        audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16).astype(np.float32) / 32768.0
+
+    model.reset_states()
+    probs = []
+    with torch.no_grad():
+        for start in range(0, len(audio) - CHUNK + 1, CHUNK):
+            probs.append(model(torch.from_numpy(audio[start:start + CHUNK]), RATE).item())
+    return probs
+
+
+def load_recordings(directory, hint_delay):
+    from modules.vad import load_silero_model
+
+    model = load_silero_model()
+    turns = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.wav'))):
+        probs = wav_probs(path, model)
+        if probs is None:
+            print(colorama.Fore.YELLOW + f"[SKIP] {path}: need 16-bit mono 16 kHz" + colorama.Style.RESET_ALL)
+            continue
+
+        hints = {}
+        transcript_path = os.path.splitext(path)[0] + '.txt'
+        if os.path.exists(transcript_path):
+            with open(transcript_path, encoding='utf-8') as f:
+                text = f.read().strip()
+            end = last_speech(probs)
+            if end is not None:
+                hints[end + int(hint_delay / CHUNK_SECONDS)] = text
+        turns.append((probs, hints))
+    return turns
+
+
+def synthetic_turns(count, hint_delay, seed):
+    """
+    Lượt nói giả lập: các đoạn nói ngắn xen quãng ngừng; một số quãng là ngập ngừng dài
+    (xác suất VAD lơ lửng nếu là tiếng thở / "ừm"). Transcript tạm: câu trọn thường kết thúc bằng
+    dấu chấm, trước chỗ ngập ngừng thường là "and" / "um" (đôi khi STT cũng đặt dấu chấm sai).
+    """
+    rng = np.random.default_rng(seed)
+    delay = int(hint_delay / CHUNK_SECONDS)
+
+    def chunks(seconds):
+        return max(1, int(seconds / CHUNK_SECONDS))
+
+    turns = []
+    for _ in range(count):
+        kind = rng.choice(['short', 'normal', 'long'], p=[0.35, 0.45, 0.2])
+        bursts = {'short': rng.integers(1, 3), 'normal': rng.integers(3, 9), 'long': rng.integers(6, 15)}[kind]
+        hesitation_rate = {'short': 0.05, 'normal': 0.1, 'long': 0.3}[kind]
+
+        probs, hints = list(rng.uniform(0.0, 0.05, chunks(0.5))), {}
+        for burst in range(bursts):
+            speech = rng.uniform(0.6, 0.99, chunks(rng.uniform(0.15, 0.6)))
+            dips = rng.random(len(speech)) < 0.05
+            speech[dips] = rng.uniform(0.3, 0.5, dips.sum())
+            probs.extend(speech)
+
+            last = burst == bursts - 1
+            if last:
+                text = 'sure thing.' if rng.random() < 0.8 else 'sure thing'
+            elif rng.random() < hesitation_rate:
+                pause = chunks(rng.uniform(0.5, 1.3))
+                low, high = (0.1, 0.4) if rng.random() < 0.5 else (0.0, 0.05)
+                probs.extend(rng.uniform(low, high, pause))
+                roll = rng.random()
+                text = 'i think um' if roll < 0.5 else ('i think.' if roll < 0.7 else 'i think')
+            else:
+                probs.extend(rng.uniform(0.0, 0.3, chunks(rng.uniform(0.05, 0.3))))
+                continue
+            hints[len(probs) - (0 if last else pause) + delay] = text
+
+        probs.extend(rng.uniform(0.0, 0.04, chunks(3.0)))
+        turns.append((probs, hints))
+    return turns
+
+
+def last_speech(probs):
+    speech = [i for i, p in enumerate(probs) if p > THRESHOLD]
+    return speech[-1] if speech else None
+
+
+# ==================== REPLAY ====================
+
+def replay(endpointer, probs, hints):
+    """Index chunk endpointer ngắt câu (None nếu không ngắt)"""
+    endpointer.reset()
+    for index, prob in enumerate(probs):
+        if index in hints:
+            endpointer.hint(hints[index])
+        if endpointer.update(prob):
+            return index
+    return None
+
+
+def evaluate(name, make, turns, use_hints, tail):
+    latencies = []
+    premature = 0
+    for probs, hints in turns:
+        end = last_speech(probs)
+        if end is None:
+            continue
+        # Thêm im lặng để chiến lược nào cũng ngắt được
+        probs = list(probs) + [0.01] * int(tail / CHUNK_SECONDS)
+        cut = replay(make(), probs, hints if use_hints else {})
+        if cut is not None and cut < end:
+            premature += 1
+        elif cut is not None:
+            latencies.append((cut - end) * CHUNK_SECONDS)
+
+    latencies = np.array(latencies) * 1000
+    total = premature + len(latencies)
+    print(f"  {name:<24} {latencies.mean():>8.0f} {np.percentile(latencies, 50):>8.0f} {np.percentile(latencies, 90):>8.0f}"
+          f" {premature / total * 100:>10.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Endpointing benchmark (latency vs premature cut-off)")
+    parser.add_argument('--wav-dir', help="Thư mục WAV, mỗi file là một lượt nói trọn vẹn")
+    parser.add_argument('--synthetic', type=int, default=2000, help="Số lượt nói giả lập khi không có --wav-dir")
+    parser.add_argument('--hint-delay', type=float, default=0.3, help="Độ trễ transcript tạm của STT streaming (giây)")
+    parser.add_argument('--tail', type=float, default=3.0, help="Giây im lặng thêm vào cuối mỗi lượt")
+    parser.add_argument('--fixed', type=float, nargs='+', default=[1.5, 1.0, 0.7, 0.5], help="Các SILENCE_DURATION cố định để so sánh")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.wav_dir:
+        turns = load_recordings(args.wav_dir, args.hint_delay)
+        source = args.wav_dir
+    else:
+        turns = synthetic_turns(args.synthetic, args.hint_delay, args.seed)
+        source = "synthetic"
+    if not turns:
+        print("No turns to replay")
+        return
+
+    print(colorama.Fore.CYAN + f"\n📊 {len(turns)} turns ({source})" + colorama.Style.RESET_ALL)
+    print(f"  {'strategy':<24} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'premature':>11}")
+    for seconds in args.fixed:
+        evaluate(f"fixed {seconds}s", lambda: FixedEndpointer(CHUNK_SECONDS, THRESHOLD, seconds), turns, False, args.tail)
+    evaluate("adaptive", lambda: AdaptiveEndpointer(CHUNK_SECONDS, THRESHOLD), turns, False, args.tail)
+    evaluate("adaptive + STT hints", lambda: AdaptiveEndpointer(CHUNK_SECONDS, THRESHOLD), turns, True, args.tail)
+
+
+if __name__ == "__main__":
+    main()
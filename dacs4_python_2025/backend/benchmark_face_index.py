@@ -0,0 +1,124 @@
+"""
+Benchmark face index: exact (FaceIndex) vs IVF-int8 (IVFFaceIndex)
+Đo thời gian build, latency mỗi truy vấn và recall@1 của IVF so với tìm chính xác
+trên gallery embedding giả lập (không cần DeepFace), hoặc embedding thật trong database (--from-db).
+
+    python benchmark_face_index.py --users 50000 --nlist 256 --nprobe 4 8 16 32
+    python benchmark_face_index.py --clusters 0     # phân bố đều - trường hợp xấu nhất cho IVF
+
+Embedding khuôn mặt thật không phân bố đều (giới tính, tuổi, sắc tộc, ánh sáng...) nên mặc định
+gallery được sinh quanh --clusters tâm ngẫu nhiên.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import colorama
+import numpy as np
+
+from modules.face_index import FaceIndex, IVFFaceIndex
+
+colorama.init()
+
+
+def make_gallery(n_users: int, dim: int, n_clusters: int, spread: float, seed: int) -> np.ndarray:
+    """Embedding giả lập: mỗi user = tâm nhóm + độ lệch riêng (n_clusters=0: phân bố đều)"""
+    rng = np.random.default_rng(seed)
+    gallery = rng.standard_normal((n_users, dim)).astype(np.float32)
+    if n_clusters:
+        centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+        gallery = centers[rng.integers(n_clusters, size=n_users)] + spread * gallery
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def load_gallery_from_db() -> np.ndarray:
+    from modules.database import ChatDatabase
+    users = [user for user in ChatDatabase().get_all_users() if user.get('face_embedding') is not None]
+    gallery = np.array([user['face_embedding'] for user in users], dtype=np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def make_queries(gallery: np.ndarray, n_queries: int, noise: float, seed: int):
+    """Query = embedding của user + nhiễu (giống ảnh webcam khác ảnh lúc đăng ký)"""
+    rng = np.random.default_rng(seed + 1)
+    n_users, dim = gallery.shape
+    n_queries = min(n_queries, n_users)
+
+    targets = rng.choice(n_users, n_queries, replace=False)
+    queries = gallery[targets] + noise * rng.standard_normal((n_queries, dim)).astype(np.float32) / np.sqrt(dim)
+    users = [{'id': i, 'username': f'user{i}', 'face_embedding': gallery[i]} for i in range(n_users)]
+    return users, queries
+
+
+def time_queries(index, queries, **kwargs):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, k=1, **kwargs)[0][0]['id'])
+    return np.array(results), (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face index benchmark")
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=1.0, help="Độ lệch query so với embedding gốc")
+    parser.add_argument('--clusters', type=int, default=1000, help="Số nhóm khuôn mặt giả lập, 0 = phân bố đều")
+    parser.add_argument('--spread', type=float, default=1.0, help="Độ lệch của user so với tâm nhóm")
+    parser.add_argument('--from-db', action='store_true', help="Dùng embedding thật trong MySQL")
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.from_db:
+        gallery = load_gallery_from_db()
+    else:
+        gallery = make_gallery(args.users, args.dim, args.clusters, args.spread, args.seed)
+    users, queries = make_queries(gallery, args.queries, args.noise, args.seed)
+
+    print("=" * 80)
+    print(f"FACE INDEX BENCHMARK - {len(users)} users, {gallery.shape[1]}D, {len(queries)} queries")
+    print("=" * 80)
+
+    # Exact
+    exact = FaceIndex()
+    start = time.perf_counter()
+    exact.build(users)
+    print(f"\n[exact] build: {time.perf_counter() - start:.2f}s")
+    truth, exact_ms = time_queries(exact, queries)
+    print(colorama.Fore.GREEN + f"[exact] {exact_ms:.3f} ms/query" + colorama.Style.RESET_ALL)
+
+    # IVF
+    ivf = IVFFaceIndex(nlist=args.nlist)
+    start = time.perf_counter()
+    ivf.build(users)
+    print(f"\n[ivf] build (k-means + int8): {time.perf_counter() - start:.2f}s, {len(ivf._lists)} lists")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'face_index.npz')
+        start = time.perf_counter()
+        ivf.save(path)
+        save_s = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 1e6
+
+        loaded = IVFFaceIndex(nlist=args.nlist)
+        start = time.perf_counter()
+        loaded.load(path)
+        loaded.set_profiles({'id': user['id']} for user in users)
+        print(f"[ivf] save {save_s:.2f}s | load {time.perf_counter() - start:.2f}s | file {size_mb:.1f} MB")
+
+    print(f"\n{'nprobe':>8} {'ms/query':>10} {'speedup':>9} {'recall@1':>9}")
+    for nprobe in args.nprobe:
+        found, ivf_ms = time_queries(loaded, queries, nprobe=nprobe)
+        recall = float(np.mean(found == truth))
+        color = colorama.Fore.GREEN if recall >= 0.99 else colorama.Fore.YELLOW
+        print(color + f"{nprobe:>8} {ivf_ms:>10.3f} {exact_ms / ivf_ms:>8.1f}x {recall:>9.3f}" + colorama.Style.RESET_ALL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark VAD: chi phí mỗi chunk (512 mẫu = 32ms) của vòng lặp VAD
+- torch.hub JIT: np.frombuffer -> astype -> / 32768 -> torch.from_numpy -> model() -> .item() (cách cũ)
+- ONNX session.run: feed dict numpy mới mỗi chunk (np.concatenate context, state mới...)
+- OnnxSileroVAD.process: IOBinding + buffer cấp sẵn, đổi int16 -> float tại chỗ
+
+    python benchmark_vad.py --model data/onnx/silero_vad.onnx
+    python benchmark_vad.py --model data/onnx/silero_vad.onnx --wav recordings/hello.wav --repeat 5
+    python benchmark_vad.py --model data/onnx/silero_vad.onnx --seconds 120 --no-torch
+
+Báo cáo: µs CPU / chunk (mean, p50, p99), byte cấp phát tạm thời / chunk (tracemalloc)
+và số stream 16 kHz một core CPU gánh được (32ms / chi phí một chunk).
+"""
+
+import argparse
+import time
+import tracemalloc
+import wave
+import colorama
+import numpy as np
+
+from modules.onnx_backends import OnnxSileroVAD, create_session
+
+colorama.init()
+
+RATE = 16000
+CHUNK = 512
+
+
+def load_pcm(path, seconds):
+    """Các chunk PCM int16 (bytes) từ WAV, hoặc tiếng nói giả (tone bật/tắt + nhiễu)"""
+    if path:
+        with wave.open(path, 'rb') as wav:
+            audio = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    else:
+        rng = np.random.default_rng(0)
+        t = np.arange(int(RATE * seconds)) / RATE
+        voiced = (t % 1.0) < 0.6
+        audio = (np.sin(2 * np.pi * 180 * t) * voiced * 6000 + rng.normal(0, 300, len(t))).astype(np.int16)
+    return [audio[i:i + CHUNK].tobytes() for i in range(0, len(audio) - CHUNK + 1, CHUNK)]
+
+
+def torch_step():
+    """Vòng lặp cũ với model JIT của torch.hub (None nếu không có torch)"""
+    try:
+        import torch
+    except ImportError:
+        return None
+    from modules.vad import _hub_source
+
+    repo, source = _hub_source()
+    model, _ = torch.hub.load(repo_or_dir=repo, model='silero_vad', source=source, trust_repo=True)
+    torch.set_num_threads(1)
+
+    def step(pcm):
+        audio_chunk = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        with torch.no_grad():
+            return model(torch.from_numpy(audio_chunk), RATE).item()
+    return step
+
+
+def session_run_step(session):
+    """session.run với feed dict mới mỗi chunk (cách OnnxSileroVAD chạy trước đây)"""
+    v5 = 'state' in {i.name for i in session.get_inputs()}
+    states = {'state': np.zeros((2, 1, 128), dtype=np.float32)} if v5 else \
+        {'h': np.zeros((2, 1, 64), dtype=np.float32), 'c': np.zeros((2, 1, 64), dtype=np.float32)}
+    context = [np.zeros((1, 64), dtype=np.float32)]
+
+    def step(pcm):
+        x = (np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0).reshape(1, -1)
+        if v5:
+            x = np.concatenate([context[0], x], axis=1)
+            context[0] = x[:, -64:]
+        out, *new_states = session.run(None, {'input': x, 'sr': np.array(RATE, dtype=np.int64), **states})
+        states.update(zip(states, new_states))
+        return out.item()
+    return step
+
+
+def measure(name, step, chunks, repeat):
+    # Làm nóng (khởi tạo lười của ONNX Runtime / JIT) rồi mới đo
+    for pcm in chunks[:50]:
+        step(pcm)
+
+    cpu_times = []
+    for _ in range(repeat):
+        for pcm in chunks:
+            start = time.process_time_ns()
+            step(pcm)
+            cpu_times.append(time.process_time_ns() - start)
+    cpu = np.array(cpu_times) / 1000
+
+    # Cấp phát tạm thời: peak - current quanh mỗi lần gọi
+    tracemalloc.start()
+    allocated = []
+    for pcm in chunks[:500]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        step(pcm)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    mean = cpu.mean()
+    print(f"  {name:<26} {mean:>8.1f} {np.percentile(cpu, 50):>8.1f} {np.percentile(cpu, 99):>8.1f}"
+          f" {np.mean(allocated):>10.0f} {CHUNK / RATE * 1e6 / mean:>10.0f}")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Silero VAD per-chunk cost benchmark")
+    parser.add_argument('--model', required=True, help="File silero_vad.onnx (xem convert_to_onnx.py)")
+    parser.add_argument('--wav', help="WAV 16-bit mono 16 kHz (mặc định: audio giả 30 giây)")
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần chạy lại toàn bộ audio")
+    parser.add_argument('--no-torch', action='store_true', help="Bỏ qua model JIT của torch.hub")
+    args = parser.parse_args()
+
+    chunks = load_pcm(args.wav, args.seconds)
+    session = create_session(args.model, threads=1)
+    engine = OnnxSileroVAD(session=session)
+
+    # Cùng session, cùng audio -> hai cách chạy ONNX phải ra cùng xác suất
+    reference = session_run_step(session)
+    diff = max(abs(reference(pcm) - engine.process(pcm, RATE)) for pcm in chunks)
+    engine.reset_states()
+    print(colorama.Fore.CYAN + f"\n📊 {len(chunks)} chunks x {args.repeat}, max |prob diff| session.run vs process: {diff:.2e}" + colorama.Style.RESET_ALL)
+
+    print(f"  {'backend':<26} {'mean µs':>8} {'p50 µs':>8} {'p99 µs':>8} {'alloc B':>10} {'streams':>10}")
+    results = {}
+    step = None if args.no_torch else torch_step()
+    if step is not None:
+        results['torch'] = measure("torch.hub JIT", step, chunks, args.repeat)
+    results['run'] = measure("ONNX session.run", session_run_step(session), chunks, args.repeat)
+    results['process'] = measure("OnnxSileroVAD.process", lambda pcm: engine.process(pcm, RATE), chunks, args.repeat)
+
+    for key, label in (('torch', "torch.hub JIT"), ('run', "session.run")):
+        if key in results:
+            print(colorama.Fore.GREEN + f"  process vs {label}: {results[key] / results['process']:.2f}x less CPU per chunk" + colorama.Style.RESET_ALL)
+
+
+if __name__ == "__main__":
+    main()
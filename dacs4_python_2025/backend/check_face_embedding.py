@@ -1,5 +1,5 @@
 """Check if face embedding exists for users"""
-from modules.database import ChatDatabase
+from modules.database import ChatDatabase, decode_embedding
 import json
 
 db = ChatDatabase()
@@ -9,16 +9,21 @@ print("\n" + "="*70)
 print("FACE EMBEDDING CHECK")
 print("="*70)
 
-cursor.execute("SELECT id, username, face_embedding FROM users")
+columns = "face_embedding, face_embedding_f32" if db.embedding_blob else "face_embedding"
+cursor.execute(f"SELECT id, username, {columns} FROM users")
 users = cursor.fetchall()
 
 for user in users:
     print(f"\nUser #{user['id']}: {user['username']}")
     
-    if user['face_embedding']:
+    if user.get('face_embedding_f32'):
+        embedding = decode_embedding(user['face_embedding_f32'])
+        print(f"  ✅ Face embedding (float32 BLOB, {len(user['face_embedding_f32'])} bytes): {len(embedding)} dimensions")
+        print(f"  Sample values: {embedding[:5].tolist()}...")
+    elif user['face_embedding']:
         try:
             embedding = json.loads(user['face_embedding'])
-            print(f"  ✅ Face embedding: {len(embedding)} dimensions")
+            print(f"  ✅ Face embedding (JSON, not migrated): {len(embedding)} dimensions")
             print(f"  Sample values: {embedding[:5]}...")
         except:
             print(f"  ❌ Invalid JSON")
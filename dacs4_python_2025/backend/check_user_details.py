@@ -21,6 +21,6 @@ for user in users:
     print(f"  Gender: {user.get('gender', 'N/A')}")
     print(f"  Age: {user.get('age', 'N/A')}")
     print(f"  Avatar: {user.get('avatar_url', 'N/A')}")
-    print(f"  Has Face Embedding: {bool(user.get('face_embedding'))}")
+    print(f"  Has Face Embedding: {user.get('face_embedding') is not None}")
 
 print("\n" + "=" * 80)
@@ -0,0 +1,348 @@
+"""
+Convert ArcFace / emotion (DeepFace, Keras) và Silero VAD sang ONNX + quantize int8, rồi kiểm tra
+độ lệch so với model gốc trên ảnh / WAV mẫu. Kết quả dùng bởi backend USE_ONNX=1 (modules/onnx_backends.py)
+
+    python convert_to_onnx.py convert [--out data/onnx] [--models arcface emotion silero_vad] [--no-quantize]
+    python convert_to_onnx.py verify --images samples/faces --audio samples/wav [--out data/onnx]
+
+Cần thêm: onnxruntime, tf2onnx (chỉ lúc convert), DeepFace + torch (model gốc để so sánh).
+"""
+
+import argparse
+import glob
+import os
+import resource
+import shutil
+import sys
+import time
+import wave
+import colorama
+import cv2
+import numpy as np
+
+# Verify phải so với model gốc, không được tự chạy backend ONNX
+os.environ['USE_ONNX'] = '0'
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+from modules.onnx_backends import (
+    MODEL_NAMES, OnnxArcFace, OnnxEmotion, OnnxSileroVAD, OpenCVFaceDetector, model_paths
+)
+
+colorama.init()
+
+SILERO_HUB_DIR = 'snakers4_silero-vad_master'
+
+
+def info(message):
+    print(colorama.Fore.CYAN + message + colorama.Style.RESET_ALL)
+
+
+def ok(message):
+    print(colorama.Fore.GREEN + message + colorama.Style.RESET_ALL)
+
+
+def warn(message):
+    print(colorama.Fore.YELLOW + message + colorama.Style.RESET_ALL)
+
+
+def rss_mb():
+    """Max RSS của process (MB) - chỉ tăng, dùng để đo phần tăng thêm sau mỗi bước load"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+# ==================== CONVERT ====================
+
+def build_keras_model(name):
+    """Model Keras bên trong client DeepFace (API build_model khác nhau giữa các version)"""
+    from deepface import DeepFace
+
+    task, model_name = {'arcface': ('facial_recognition', 'ArcFace'), 'emotion': ('facial_attribute', 'Emotion')}[name]
+    try:
+        client = DeepFace.build_model(task=task, model_name=model_name)
+    except TypeError:
+        client = DeepFace.build_model(model_name)
+    return getattr(client, 'model', client)
+
+
+def convert_keras(name, path):
+    import tensorflow as tf
+    import tf2onnx
+
+    model = build_keras_model(name)
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=path)
+
+
+def silero_repo_dir():
+    """Repo Silero trong cache torch.hub (tải về nếu chưa có)"""
+    import torch
+
+    local_dir = os.getenv('SILERO_VAD_DIR') or os.path.join(torch.hub.get_dir(), SILERO_HUB_DIR)
+    if not os.path.isdir(local_dir):
+        torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', trust_repo=True)
+    return local_dir
+
+
+def convert_silero(path):
+    """Silero đã phát hành sẵn bản ONNX trong repo -> chỉ copy ra"""
+    repo = silero_repo_dir()
+    candidates = [os.path.join(repo, 'files', 'silero_vad.onnx'),
+                  os.path.join(repo, 'src', 'silero_vad', 'data', 'silero_vad.onnx')]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            shutil.copyfile(candidate, path)
+            return
+    raise FileNotFoundError(f"silero_vad.onnx not found in {repo}")
+
+
+def quantize(fp32_path, int8_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+
+def convert(args):
+    os.makedirs(args.out, exist_ok=True)
+    for name in args.models:
+        fp32, int8 = model_paths(name, args.out)
+        info(f"[CONVERT] {name} -> {fp32}")
+        start = time.time()
+        try:
+            if name == 'silero_vad':
+                convert_silero(fp32)
+            else:
+                convert_keras(name, fp32)
+        except Exception as e:
+            print(colorama.Fore.RED + f"[CONVERT] ❌ {name}: {e}" + colorama.Style.RESET_ALL)
+            continue
+        ok(f"[CONVERT] ✅ {name}: {os.path.getsize(fp32) / 1e6:.1f} MB in {time.time() - start:.1f}s")
+
+        if args.no_quantize:
+            continue
+        try:
+            quantize(fp32, int8)
+            ok(f"[CONVERT] ✅ {name} int8: {os.path.getsize(int8) / 1e6:.1f} MB")
+        except Exception as e:
+            # Vd: một số version Silero có subgraph không quantize được -> runtime dùng bản fp32
+            warn(f"[CONVERT] ⚠️ {name}: int8 quantization failed ({e}), fp32 only")
+
+    print("\nRun `python convert_to_onnx.py verify --images ... --audio ...` before enabling USE_ONNX=1")
+
+
+# ==================== VERIFY ====================
+
+def onnx_variants(name, out, cls):
+    """{'fp32': backend, 'int8': backend} cho các file đã có"""
+    variants = {}
+    for label, path in zip(('fp32', 'int8'), model_paths(name, out)):
+        if os.path.exists(path):
+            variants[label] = cls(path)
+    return variants
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def cosine(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+
+
+def report(label, values, fmt='{:.4f}'):
+    values = np.asarray(values, dtype=np.float64)
+    return f"{label} mean " + fmt.format(values.mean()) + ", min " + fmt.format(values.min())
+
+
+def verify_faces(args, images):
+    from modules.face_emotion import FaceEmotionDetector, emotion_input
+
+    before = rss_mb()
+    arcface = onnx_variants('arcface', args.out, OnnxArcFace)
+    emotion = onnx_variants('emotion', args.out, OnnxEmotion)
+    onnx_rss = rss_mb() - before
+    if not arcface and not emotion:
+        warn("[VERIFY] No face models in " + args.out)
+        return True
+
+    before = rss_mb()
+    reference = FaceEmotionDetector(database=None)
+    reference.warmup()
+    deepface_rss = rss_mb() - before
+    cv_detector = OpenCVFaceDetector()
+
+    arc = {label: {'cos': [], 'e2e': [], 'ms': []} for label in arcface}
+    emo = {label: {'agree': [], 'diff': [], 'ms': []} for label in emotion}
+    ref_ms = {'arcface': [], 'emotion': []}
+
+    for path in images:
+        img = cv2.imread(path)
+        if img is None:
+            warn(f"[VERIFY] Cannot read {path}")
+            continue
+        face = reference.detect_face(img)
+        if face is None:
+            continue
+        cv_face = cv_detector.detect(img)
+
+        ref_embedding, ms = timed(reference.embed_face, face)
+        ref_ms['arcface'].append(ms)
+        for label, backend in arcface.items():
+            embedding, ms = timed(backend.embed, face)
+            arc[label]['cos'].append(cosine(ref_embedding, embedding))
+            arc[label]['ms'].append(ms)
+            # Toàn pipeline ONNX (detector OpenCV riêng) so với pipeline DeepFace
+            arc[label]['e2e'].append(cosine(ref_embedding, backend.embed(cv_face)))
+
+        faces = emotion_input(face)[None]
+        ref_scores, ms = timed(reference.emotion_scores_batch, faces)
+        ref_ms['emotion'].append(ms)
+        ref_probs = np.array(list(ref_scores[0].values())) / 100
+        for label, backend in emotion.items():
+            probs, ms = timed(backend.predict, faces)
+            emo[label]['agree'].append(float(np.argmax(probs[0]) == np.argmax(ref_probs)))
+            emo[label]['diff'].append(float(np.abs(probs[0] - ref_probs).max() * 100))
+            emo[label]['ms'].append(ms)
+
+    if not ref_ms['arcface']:
+        warn("[VERIFY] No usable face image")
+        return False
+
+    passed = True
+    info(f"\n📊 Faces ({len(ref_ms['arcface'])} images)")
+    print(f"  Memory: ONNX sessions +{onnx_rss:.0f} MB, DeepFace/TensorFlow +{deepface_rss:.0f} MB")
+    print(f"  ArcFace  DeepFace: {np.mean(ref_ms['arcface']):.1f} ms")
+    for label, m in arc.items():
+        good = min(m['cos']) >= args.min_cosine
+        passed &= good
+        print(f"  ArcFace  {label}: {np.mean(m['ms']):.1f} ms | {report('cosine', m['cos'])} | "
+              f"end-to-end (OpenCV detector) {report('cosine', m['e2e'])} | {'PASS' if good else 'FAIL'}")
+    print(f"  Emotion  DeepFace: {np.mean(ref_ms['emotion']):.1f} ms")
+    for label, m in emo.items():
+        agreement = float(np.mean(m['agree']))
+        good = agreement >= args.min_agreement
+        passed &= good
+        print(f"  Emotion  {label}: {np.mean(m['ms']):.1f} ms | top-1 agreement {agreement:.1%} | "
+              f"max diff {max(m['diff']):.1f}% | {'PASS' if good else 'FAIL'}")
+    return passed
+
+
+def read_wav(path):
+    """WAV 16-bit mono 16 kHz -> float32 [-1, 1], None nếu khác định dạng"""
+    with wave.open(path, 'rb') as wav:
+        if wav.getnchannels() != 1 or wav.getsampwidth() != 2 or wav.getframerate() != 16000:
+            return None
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def verify_audio(args, files, chunk=512, rate=16000):
+    import torch
+
+    before = rss_mb()
+    variants = onnx_variants('silero_vad', args.out, OnnxSileroVAD)
+    onnx_rss = rss_mb() - before
+    if not variants:
+        warn("[VERIFY] No silero_vad model in " + args.out)
+        return True
+
+    before = rss_mb()
+    reference, _ = torch.hub.load(repo_or_dir=silero_repo_dir(), model='silero_vad', source='local', trust_repo=True)
+    torch_rss = rss_mb() - before
+
+    ref_probs, ref_ms = [], []
+    probs = {label: [] for label in variants}
+    ms = {label: [] for label in variants}
+    for path in files:
+        audio = read_wav(path)
+        if audio is None:
+            warn(f"[VERIFY] {path}: need 16-bit mono 16 kHz WAV, skipped")
+            continue
+
+        reference.reset_states()
+        for model in variants.values():
+            model.reset_states()
+        for start in range(0, len(audio) - chunk + 1, chunk):
+            x = audio[start:start + chunk]
+            with torch.no_grad():
+                prob, elapsed = timed(lambda: reference(torch.from_numpy(x), rate).item())
+            ref_probs.append(prob)
+            ref_ms.append(elapsed)
+            for label, model in variants.items():
+                prob, elapsed = timed(lambda: model(x, rate).item())
+                probs[label].append(prob)
+                ms[label].append(elapsed)
+
+    if not ref_probs:
+        warn("[VERIFY] No usable WAV file")
+        return False
+
+    ref_probs = np.array(ref_probs)
+    passed = True
+    info(f"\n📊 Silero VAD ({len(ref_probs)} chunks of {chunk} samples)")
+    print(f"  Memory: ONNX session +{onnx_rss:.0f} MB, torch model +{torch_rss:.0f} MB")
+    print(f"  torch: {np.mean(ref_ms):.3f} ms/chunk")
+    for label in variants:
+        p = np.array(probs[label])
+        agreement = float(np.mean((p > 0.5) == (ref_probs > 0.5)))
+        good = agreement >= args.min_vad_agreement
+        passed &= good
+        print(f"  {label}: {np.mean(ms[label]):.3f} ms/chunk | speech/silence agreement {agreement:.2%} | "
+              f"max prob diff {np.abs(p - ref_probs).max():.3f} | {'PASS' if good else 'FAIL'}")
+    return passed
+
+
+def list_files(directory, patterns):
+    files = []
+    for pattern in patterns:
+        files.extend(glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+    return sorted(files)
+
+
+def verify(args):
+    if not args.images and not args.audio:
+        print("Give --images and/or --audio")
+        return 2
+
+    passed = True
+    if args.images:
+        passed &= verify_faces(args, list_files(args.images, ('*.jpg', '*.jpeg', '*.png')))
+    if args.audio:
+        passed &= verify_audio(args, list_files(args.audio, ('*.wav',)))
+
+    if passed:
+        ok("\n✅ ONNX models match the originals, enable with USE_ONNX=1")
+        return 0
+    print(colorama.Fore.RED + "\n❌ Parity check failed (try ONNX_QUANTIZED=0 for the fp32 models)" + colorama.Style.RESET_ALL)
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert models to ONNX (int8) and check parity")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('convert', help="Export + quantize")
+    p.add_argument('--out', default=os.path.join('data', 'onnx'))
+    p.add_argument('--models', nargs='+', choices=MODEL_NAMES, default=list(MODEL_NAMES))
+    p.add_argument('--no-quantize', action='store_true', help="Chỉ export fp32")
+
+    p = sub.add_parser('verify', help="So sánh với DeepFace / torch trên dữ liệu mẫu")
+    p.add_argument('--out', default=os.path.join('data', 'onnx'))
+    p.add_argument('--images', help="Thư mục ảnh có khuôn mặt (jpg/png)")
+    p.add_argument('--audio', help="Thư mục WAV 16-bit mono 16 kHz")
+    p.add_argument('--min-cosine', type=float, default=0.98, help="Cosine tối thiểu giữa embedding ONNX và DeepFace")
+    p.add_argument('--min-agreement', type=float, default=0.9, help="Tỉ lệ trùng cảm xúc top-1 tối thiểu")
+    p.add_argument('--min-vad-agreement', type=float, default=0.98, help="Tỉ lệ trùng quyết định nói/im lặng tối thiểu")
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        convert(args)
+        return 0
+    return verify(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
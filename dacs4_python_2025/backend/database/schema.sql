@@ -14,7 +14,8 @@ CREATE TABLE IF NOT EXISTS users (
     birth_year INT,
     age INT,
     avatar_url VARCHAR(500),
-    face_embedding JSON NOT NULL,
+    face_embedding JSON NULL,  -- Định dạng cũ, chỉ còn cho dữ liệu chưa migrate
+    face_embedding_f32 BLOB,  -- ArcFace 512D float32 little-endian (2 KB)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     last_login TIMESTAMP NULL,
@@ -0,0 +1,108 @@
+"""
+Fake Deepgram live server - test STT streaming không cần API key / mạng
+
+    python fake_deepgram_server.py [--port 8766] [--latency 0.05]
+    DEEPGRAM_STREAM_URL=ws://localhost:8766/v1/listen python server_rag.py
+
+Transcript giả: mỗi 0.25s audio là một từ ("word1 word2 ..."), đánh số liên tục trong một kết nối.
+- Interim mỗi 0.5s audio, final mỗi 2s audio (giống endpointing của Deepgram)
+- Finalize: trả phần còn lại với is_final + from_finalize sau `latency` giây
+- KeepAlive: bỏ qua; CloseStream: gửi Metadata rồi đóng
+"""
+
+import argparse
+import asyncio
+import json
+import colorama
+import websockets
+
+BYTES_PER_SECOND = 16000 * 2
+WORD_SECONDS = 0.25
+INTERIM_SECONDS = 0.5
+FINAL_SECONDS = 2.0
+
+
+def results(words, is_final, from_finalize=False):
+    return json.dumps({
+        'type': 'Results',
+        'is_final': is_final,
+        'speech_final': is_final,
+        'from_finalize': from_finalize,
+        'channel': {'alternatives': [{'transcript': ' '.join(words), 'confidence': 0.99}]},
+    })
+
+
+class FakeConnection:
+    def __init__(self, websocket, latency):
+        self.websocket = websocket
+        self.latency = latency
+        self.received = 0  # Bytes audio
+        self.segment_start = 0  # Byte bắt đầu segment chưa final
+        self.next_word = 1
+        self.last_interim = 0
+
+    def words(self, until):
+        count = int((until - self.segment_start) / BYTES_PER_SECOND / WORD_SECONDS)
+        return [f'word{self.next_word + i}' for i in range(count)]
+
+    async def final(self, from_finalize=False):
+        words = self.words(self.received)
+        self.next_word += len(words)
+        self.segment_start = self.received
+        self.last_interim = self.received
+        await self.websocket.send(results(words, True, from_finalize))
+
+    async def on_audio(self, data):
+        self.received += len(data)
+        if self.received - self.segment_start >= FINAL_SECONDS * BYTES_PER_SECOND:
+            await self.final()
+        elif self.received - self.last_interim >= INTERIM_SECONDS * BYTES_PER_SECOND:
+            self.last_interim = self.received
+            await self.websocket.send(results(self.words(self.received), False))
+
+    async def run(self):
+        try:
+            await self._serve()
+        except websockets.exceptions.ConnectionClosed:
+            pass  # Client đóng ngay sau CloseStream, không chờ Metadata
+
+    async def _serve(self):
+        async for message in self.websocket:
+            if isinstance(message, bytes):
+                await self.on_audio(message)
+                continue
+
+            kind = json.loads(message).get('type')
+            if kind == 'Finalize':
+                await asyncio.sleep(self.latency)
+                await self.final(from_finalize=True)
+            elif kind == 'CloseStream':
+                await self.websocket.send(json.dumps({'type': 'Metadata', 'duration': self.received / BYTES_PER_SECOND}))
+                await self.websocket.close()
+
+
+def serve(port: int = 8766, latency: float = 0.05, host: str = 'localhost'):
+    """websockets server (dùng với `async with`)"""
+    async def handler(websocket, *_):
+        await FakeConnection(websocket, latency).run()
+
+    return websockets.serve(handler, host, port, subprotocols=['token'])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake Deepgram live transcription server")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.05, help="Thời gian xử lý Finalize (giây)")
+    args = parser.parse_args()
+
+    async with serve(args.port, args.latency):
+        print(colorama.Fore.GREEN + f"[FAKE DEEPGRAM] Listening on ws://localhost:{args.port}/v1/listen" + colorama.Style.RESET_ALL)
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    colorama.init()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,141 @@
+"""
+Migration Script: face_embedding JSON -> face_embedding_f32 BLOB (float32 little-endian)
+
+1. Thêm cột face_embedding_f32 và cho phép face_embedding (JSON) NULL
+2. Chuyển từng chunk user (theo id tăng dần), mỗi chunk một transaction
+3. Xóa bản JSON sau khi chuyển (trừ khi --keep-json) để get_all_users không phải tải lại
+
+Chạy lại được nhiều lần: chỉ xử lý các dòng chưa có BLOB.
+
+    python migrate_embeddings_to_blob.py [--chunk-size 500] [--keep-json] [--dry-run]
+"""
+
+import argparse
+import json
+import time
+import colorama
+import numpy as np
+
+from modules.database import ChatDatabase, encode_embedding
+
+colorama.init()
+
+
+def column_exists(cursor, database_name, column):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'users' AND COLUMN_NAME = %s",
+        (database_name, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def migrate_schema(db, dry_run):
+    """Thêm cột BLOB (ALTER TABLE tự commit trong MySQL). Trả về True nếu cột đã có"""
+    cursor = db.connection.cursor()
+    try:
+        if column_exists(cursor, db.config['database'], 'face_embedding_f32'):
+            print(colorama.Fore.GREEN + "[MIGRATE] Column face_embedding_f32 already exists" + colorama.Style.RESET_ALL)
+            return True
+
+        if dry_run:
+            print(colorama.Fore.YELLOW + "[MIGRATE] (dry run) Would add column face_embedding_f32 BLOB" + colorama.Style.RESET_ALL)
+            return False
+
+        print(colorama.Fore.CYAN + "[MIGRATE] Adding column face_embedding_f32..." + colorama.Style.RESET_ALL)
+        cursor.execute("ALTER TABLE users MODIFY face_embedding JSON NULL")
+        cursor.execute("ALTER TABLE users ADD COLUMN face_embedding_f32 BLOB AFTER face_embedding")
+        print(colorama.Fore.GREEN + "[MIGRATE] ✅ Schema updated" + colorama.Style.RESET_ALL)
+        return True
+    finally:
+        cursor.close()
+
+
+def migrate_rows(db, chunk_size, keep_json, dry_run, has_blob_column):
+    """Chuyển JSON -> BLOB theo chunk; trả về (đã chuyển, lỗi, tổng bytes JSON, tổng bytes BLOB)"""
+    converted = failed = 0
+    json_bytes = blob_bytes = 0
+    last_id = 0
+    pending = "face_embedding_f32 IS NULL AND " if has_blob_column else ""
+
+    while True:
+        cursor = db.connection.cursor()
+        try:
+            cursor.execute(
+                f"SELECT id, face_embedding FROM users "
+                f"WHERE {pending}face_embedding IS NOT NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, chunk_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for user_id, embedding_json in rows:
+                try:
+                    embedding = np.asarray(json.loads(embedding_json), dtype=np.float32)
+                    if embedding.ndim != 1 or not embedding.size:
+                        raise ValueError(f"shape {embedding.shape}")
+                except (ValueError, TypeError) as e:
+                    print(colorama.Fore.RED + f"[MIGRATE] User {user_id}: invalid embedding ({e}), skipped" + colorama.Style.RESET_ALL)
+                    failed += 1
+                    continue
+
+                blob = encode_embedding(embedding)
+                json_bytes += len(embedding_json)
+                blob_bytes += len(blob)
+                updates.append((blob, user_id))
+
+            if updates and not dry_run:
+                if keep_json:
+                    query = "UPDATE users SET face_embedding_f32 = %s WHERE id = %s"
+                else:
+                    query = "UPDATE users SET face_embedding_f32 = %s, face_embedding = NULL WHERE id = %s"
+                cursor.executemany(query, updates)
+                db.connection.commit()
+
+            converted += len(updates)
+            print(colorama.Fore.CYAN + f"[MIGRATE] ... {converted} users converted (last id {last_id})" + colorama.Style.RESET_ALL)
+        except Exception:
+            db.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    return converted, failed, json_bytes, blob_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert face embeddings from JSON to float32 BLOB")
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--keep-json', action='store_true', help="Giữ lại cột JSON (để rollback)")
+    parser.add_argument('--dry-run', action='store_true', help="Chỉ đếm, không ghi gì")
+    args = parser.parse_args()
+
+    print(colorama.Fore.CYAN + "=" * 60 + colorama.Style.RESET_ALL)
+    print(colorama.Fore.CYAN + "  MIGRATION: face_embedding JSON → float32 BLOB" + colorama.Style.RESET_ALL)
+    print(colorama.Fore.CYAN + "=" * 60 + colorama.Style.RESET_ALL)
+
+    db = ChatDatabase()
+    if db.connection is None:
+        return
+
+    start = time.time()
+    has_blob_column = migrate_schema(db, args.dry_run)
+    converted, failed, json_bytes, blob_bytes = migrate_rows(db, args.chunk_size, args.keep_json, args.dry_run, has_blob_column)
+
+    print(colorama.Fore.YELLOW + f"\n📊 Result{' (dry run)' if args.dry_run else ''}:" + colorama.Style.RESET_ALL)
+    print(f"  - Converted: {converted} users")
+    print(f"  - Failed: {failed} users")
+    if converted:
+        print(f"  - Size: {json_bytes / 1024:.0f} KB JSON → {blob_bytes / 1024:.0f} KB BLOB ({json_bytes / blob_bytes:.1f}x smaller)")
+    print(f"  - Time: {time.time() - start:.1f}s")
+
+    if converted and not args.dry_run:
+        print(colorama.Fore.GREEN + "\n✅ Done! Restart the server to load embeddings from BLOB" + colorama.Style.RESET_ALL)
+        print(colorama.Fore.YELLOW + "   (with FACE_INDEX_BACKEND=ivf the saved index stays valid, no rebuild needed)" + colorama.Style.RESET_ALL)
+
+
+if __name__ == "__main__":
+    main()
@@ -49,7 +49,7 @@ def main():
     no_embedding_users = []
     
     for user in users:
-        if not user.get('face_embedding'):
+        if user.get('face_embedding') is None:
             no_embedding_users.append(user)
         else:
             embedding_dim = len(user['face_embedding'])
@@ -0,0 +1,52 @@
+"""
+Async Database - Bọc ChatDatabase thành các method awaitable
+Mọi truy vấn MySQL chạy trong thread pool riêng cho DB, event loop không bị chặn bởi I/O database.
+"""
+
+import asyncio
+import functools
+import os
+import colorama
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.database import ChatDatabase
+
+
+class AsyncChatDatabase:
+    """
+    Cùng các operation với ChatDatabase, nhưng phải await:
+
+        user = await adb.get_user_by_id(user_id)
+        await adb.add_message(conv_id, 'user', text)
+    """
+
+    def __init__(self, database: ChatDatabase, max_workers: int = None):
+        """
+        Args:
+            database: ChatDatabase dùng chung (face detector / script vẫn gọi trực tiếp được)
+            max_workers: Số thread DB. Mặc định DB_THREADS hoặc bằng MYSQL_POOL_SIZE
+                (thêm thread cũng chỉ chờ connection trong pool)
+        """
+        self.database = database
+        self.max_workers = max_workers or int(os.getenv('DB_THREADS', '0')) or getattr(database, 'pool_size', 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+
+        print(colorama.Fore.GREEN + f"[DB] Async access via {self.max_workers} DB thread(s)" + colorama.Style.RESET_ALL)
+
+    def __getattr__(self, name):
+        attr = getattr(self.database, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        # Cache để lần gọi sau không phải tạo wrapper lại
+        setattr(self, name, call)
+        return call
+
+    def shutdown(self):
+        """Chờ các truy vấn đang chạy xong rồi đóng thread pool"""
+        self._executor.shutdown(wait=True)
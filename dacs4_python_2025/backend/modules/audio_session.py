@@ -0,0 +1,236 @@
+"""
+Audio Session - Nhận audio PCM 16kHz từ browser qua WebSocket
+Mỗi connection có ring buffer + trạng thái VAD riêng, không dùng chung micro của server
+"""
+
+import asyncio
+import collections
+import numpy as np
+import colorama
+from typing import Optional
+
+from modules.silence_trim import trim_silence
+from modules.endpointing import FixedEndpointer
+from modules.vad import speech_prob
+
+
+class AudioSession:
+    def __init__(self, model, rate: int = 16000, chunk: int = 512,
+                 speech_threshold: float = 0.5, silence_duration: float = 1.5,
+                 max_speech_duration: float = 30.0, pre_buffer_duration: float = 0.5,
+                 max_backlog_duration: float = 5.0, barge_in_duration: float = 0.3,
+                 transcriber=None, trim_padding: Optional[float] = 0.15, endpointer=None):
+        """
+        Args:
+            model: Silero VAD model riêng cho session (xem VoiceDetector.create_stream_model)
+            transcriber: StreamingTranscriber (đã start) - nhận audio ngay trong lúc user nói
+            trim_padding: Cắt khoảng lặng khỏi câu nói, giữ lại số giây này quanh giọng nói (None = không cắt)
+            endpointer: Quyết định ngắt câu (xem VoiceDetector.create_endpointer), mặc định chờ silence_duration cố định
+            max_backlog_duration: Số giây audio tối đa chờ VAD xử lý, cũ hơn thì bị bỏ
+            barge_in_duration: Số giây giọng nói liên tục để tính là user nói chen (barge-in)
+        """
+        self.model = model
+        self.transcriber = transcriber
+
+        # Cấu hình giống VoiceDetector để hành vi ngắt câu không đổi
+        self.RATE = rate
+        self.CHUNK = chunk
+        self.SPEECH_THRESHOLD = speech_threshold
+        self.SILENCE_DURATION = silence_duration
+        self.MAX_SPEECH_DURATION = max_speech_duration
+
+        # Tính theo số chunk (thời gian của audio, không phải đồng hồ server)
+        self.chunk_bytes = chunk * 2  # 16-bit PCM
+        self.pre_buffer_frames = int((rate * pre_buffer_duration) / chunk)
+        self.max_speech_frames = int((rate * max_speech_duration) / chunk)
+        self.barge_in_frames = max(1, int((rate * barge_in_duration) / chunk))
+        self.trim_padding_frames = None if trim_padding is None else max(1, int((rate * trim_padding) / chunk))
+        self.endpointer = endpointer or FixedEndpointer(chunk / rate, speech_threshold, silence_duration)
+        if transcriber is not None and transcriber.on_interim is None:
+            # Transcript tạm từ STT streaming giúp endpointer đoán câu đã trọn ý chưa
+            transcriber.on_interim = self.endpointer.hint
+
+        # Ring buffer: các chunk đã nhận nhưng chưa qua VAD
+        self.ring = collections.deque(maxlen=int((rate * max_backlog_duration) / chunk))
+        self._partial = bytearray()  # Phần lẻ chưa đủ 1 chunk
+        self._data_ready = asyncio.Event()
+        self._vad_job = None  # Job VAD đang chạy trong executor (có thể sống lâu hơn task đã bị hủy)
+
+        self.is_muted = False
+        self._reset_pending = False
+        self.dropped_chunks = 0
+        self.last_volume = 0
+
+        self.is_speaking = False
+        self._reset_utterance()
+
+    def _reset_utterance(self):
+        """Xóa trạng thái câu nói hiện tại"""
+        if self.transcriber and self.is_speaking:
+            self.transcriber.abort()  # Câu nói dở bị bỏ
+        self.frames = []
+        self.probs = []  # Xác suất VAD của từng frame (dùng để cắt khoảng lặng)
+        self.pre_buffer = collections.deque(maxlen=self.pre_buffer_frames)
+        self.is_speaking = False
+        self.endpointer.reset()
+        self.speech_count = 0
+        self.voiced_count = 0  # Chỉ đếm chunk có giọng nói (không tính khoảng lặng)
+
+    def feed(self, pcm) -> None:
+        """Nhận PCM int16 từ WebSocket (gọi trên event loop, không block)"""
+        if self.is_muted:
+            return
+
+        self._partial.extend(pcm)
+        usable = len(self._partial) - len(self._partial) % self.chunk_bytes
+        if not usable:
+            return
+
+        for start in range(0, usable, self.chunk_bytes):
+            if len(self.ring) == self.ring.maxlen:
+                self.dropped_chunks += 1
+            self.ring.append(bytes(self._partial[start:start + self.chunk_bytes]))
+        del self._partial[:usable]
+
+        self._data_ready.set()
+
+    def mute(self):
+        """Tắt mic của session này (không ảnh hưởng session khác)"""
+        self.is_muted = True
+        self._reset_pending = True
+        self.ring.clear()
+        self._partial.clear()
+
+    def unmute(self):
+        """Mở lại mic của session này"""
+        self.is_muted = False
+
+    def discard(self):
+        """Bỏ audio đang chờ và câu nói dở nhưng vẫn tiếp tục nhận audio (dùng khi giữ mic mở để barge-in)"""
+        self._reset_pending = True
+        self.ring.clear()
+        self._partial.clear()
+
+    async def listen(self) -> Optional[bytes]:
+        """Chờ đến khi có một câu nói hoàn chỉnh và trả về PCM bytes"""
+        return await self._run(onset_only=False)
+
+    async def wait_for_speech(self) -> bool:
+        """
+        Chờ đến khi user bắt đầu nói (đủ barge_in_duration giây giọng nói)
+        
+        Câu nói đang dở được giữ lại, lần listen() tiếp theo nhận tiếp từ đầu câu.
+        """
+        return await self._run(onset_only=True)
+
+    async def _run(self, onset_only: bool):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._data_ready.wait()
+            self._data_ready.clear()
+
+            if self._reset_pending:
+                self._reset_pending = False
+                self._reset_utterance()
+
+            chunks = list(self.ring)
+            self.ring.clear()
+            if not chunks:
+                continue
+
+            # Task trước bị hủy giữa chừng -> chờ job VAD cũ chạy xong để không dùng chung model
+            if self._vad_job is not None and not self._vad_job.done():
+                await asyncio.wait([self._vad_job])
+
+            self._vad_job = loop.run_in_executor(None, self._process_chunks, chunks, onset_only)
+            utterance, consumed, onset = await asyncio.shield(self._vad_job)
+
+            # Bị mute trong lúc VAD đang chạy -> bỏ câu nói dở
+            if self.is_muted or self._reset_pending:
+                continue
+
+            if utterance is not None or onset:
+                # Trả lại phần audio sau điểm ngắt câu cho lần listen tiếp theo
+                rest = chunks[consumed:]
+                if rest:
+                    self.ring.extendleft(reversed(rest))
+                    self._data_ready.set()
+                return True if onset_only else utterance
+
+    def _process_chunks(self, chunks, onset_only: bool = False) -> tuple:
+        """
+        Chạy VAD trên các chunk (trong executor)
+        
+        Returns:
+            (utterance, số chunk đã dùng, đã phát hiện bắt đầu nói hay chưa)
+        """
+        for index, data in enumerate(chunks):
+            prob = speech_prob(self.model, data, self.RATE)
+            end_of_utterance = self.endpointer.update(prob)
+
+            if prob > self.SPEECH_THRESHOLD:
+                onset = not self.is_speaking
+                if onset:
+                    self.is_speaking = True
+                    self.speech_count = 0
+                    for buffered, buffered_prob in self.pre_buffer:
+                        self.frames.append(buffered)
+                        self.probs.append(buffered_prob)
+                    self.pre_buffer.clear()
+
+                self.frames.append(data)
+                self.probs.append(prob)
+                if self.transcriber:
+                    # Gửi STT ngay, không chờ hết câu
+                    if onset:
+                        self.transcriber.begin(b''.join(self.frames))
+                    else:
+                        self.transcriber.audio(data)
+                self.speech_count += 1
+                self.voiced_count += 1
+
+                # Barge-in: chỉ cần biết user đã nói đủ lâu, giữ nguyên câu nói dở
+                if onset_only and self.voiced_count >= self.barge_in_frames:
+                    return None, index + 1, True
+
+            elif self.is_speaking:
+                self.frames.append(data)
+                self.probs.append(prob)
+                if self.transcriber:
+                    self.transcriber.audio(data)
+                self.speech_count += 1
+
+                # Ngắt câu nếu im lặng đủ lâu (thời gian chờ do endpointer quyết định)
+                if end_of_utterance:
+                    if onset_only:
+                        # Tiếng động ngắn (không đủ để barge-in) -> bỏ
+                        self._reset_utterance()
+                        continue
+                    return self._finish_utterance(), index + 1, False
+            else:
+                self.pre_buffer.append((data, prob))
+
+            # Ngắt cưỡng ép nếu nói quá dài
+            if self.is_speaking and self.speech_count > self.max_speech_frames:
+                print(colorama.Fore.YELLOW + f"\n[VAD] >> Đã ngắt câu (Quá dài > {self.MAX_SPEECH_DURATION}s)" + colorama.Style.RESET_ALL)
+                return self._finish_utterance(), index + 1, False
+
+        self.last_volume = np.abs(np.frombuffer(chunks[-1], dtype=np.int16)).mean()
+        return None, len(chunks), False
+
+    def _finish_utterance(self) -> bytes:
+        if self.trim_padding_frames is None:
+            audio_data = b''.join(self.frames)
+        else:
+            audio_data = trim_silence(self.frames, self.probs, self.SPEECH_THRESHOLD, self.trim_padding_frames)
+        if self.transcriber:
+            self.transcriber.end()
+        self.is_speaking = False
+        self._reset_utterance()
+        return audio_data
+
+    def close(self):
+        """Session kết thúc: đóng kết nối STT streaming"""
+        if self.transcriber:
+            self.transcriber.close()
@@ -0,0 +1,106 @@
+"""
+Audio Utils - Đọc thời lượng chính xác từ header của audio (WAV / MP3)
+Dùng để biết audio TTS phát trong bao lâu thay vì ước lượng theo số ký tự
+"""
+
+import struct
+from typing import Optional
+
+# Bảng bitrate (kbps) của MPEG Layer III
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2 / 2.5
+}
+
+# Sample rate (Hz) theo version: 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+def get_audio_duration(audio_bytes: bytes) -> Optional[float]:
+    """
+    Thời lượng (giây) của audio WAV hoặc MP3
+
+    Returns:
+        Số giây, hoặc None nếu không nhận dạng được định dạng
+    """
+    if not audio_bytes or len(audio_bytes) < 12:
+        return None
+
+    if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+        return _wav_duration(audio_bytes)
+
+    return _mp3_duration(audio_bytes)
+
+
+def _wav_duration(data: bytes) -> Optional[float]:
+    byte_rate = None
+    offset = 12
+
+    # Duyệt các chunk RIFF: 'fmt ' chứa byte rate, 'data' chứa PCM
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from('<I', data, offset + 4)[0]
+
+        if chunk_id == b'fmt ' and chunk_size >= 16:
+            byte_rate = struct.unpack_from('<I', data, offset + 16)[0]
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Header streaming có thể ghi size = 0xFFFFFFFF -> dùng độ dài thực
+            data_size = min(chunk_size, len(data) - offset - 8)
+            return data_size / byte_rate
+
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+def _mp3_duration(data: bytes) -> Optional[float]:
+    offset = 0
+
+    # Bỏ qua ID3v2 tag (size dạng syncsafe 4 x 7 bit)
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size
+
+    duration = 0.0
+    frames = 0
+
+    # Duyệt từng frame MP3 và cộng thời lượng
+    while offset + 4 <= len(data):
+        header = struct.unpack_from('>I', data, offset)[0]
+
+        if (header >> 21) & 0x7FF != 0x7FF:
+            if frames:
+                break  # Hết frame (ID3v1 tag / rác ở cuối)
+            offset += 1
+            continue
+
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        sample_rate_index = (header >> 10) & 0x3
+        padding = (header >> 9) & 0x1
+
+        # Chỉ hỗ trợ Layer III (ElevenLabs trả MP3)
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            if frames:
+                break
+            offset += 1
+            continue
+
+        bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+        samples_per_frame = 1152 if version == 3 else 576
+
+        frame_length = (samples_per_frame // 8) * bitrate // sample_rate + padding
+
+        duration += samples_per_frame / sample_rate
+        frames += 1
+        offset += frame_length
+
+    return duration if frames else None
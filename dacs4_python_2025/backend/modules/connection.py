@@ -0,0 +1,36 @@
+"""
+Connection - Vòng đời các task của một WebSocket connection
+Task nhận message kết thúc (client ngắt kết nối) thì hủy các task còn lại (face, voice):
+voice chat có thể đang chờ audio / lượt hội thoại mãi mãi, không tự biết client đã đi.
+"""
+
+import asyncio
+
+from modules.dispatcher import cancel_tasks
+
+
+async def run_connection(receiver, *workers):
+    """
+    Chạy receiver cùng các worker; receiver kết thúc -> hủy và chờ các worker dừng hẳn
+
+    Lỗi của từng task không làm dừng task khác (giống gather(return_exceptions=True) trước đây).
+    """
+    receiver_task = asyncio.create_task(receiver)
+    tasks = [receiver_task] + [asyncio.create_task(worker) for worker in workers]
+    try:
+        await asyncio.wait([receiver_task])
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def close_session(state: dict):
+    """
+    Dọn dẹp session sau khi các task đã dừng: hủy task nền (lệnh, LLM/TTS, barge-in),
+    đóng AudioSession (kết nối Deepgram live, nếu không sẽ mở tới khi Deepgram tự timeout)
+    """
+    await cancel_tasks(state)
+    audio_session = state.pop('audio_session', None)
+    if audio_session:
+        audio_session.close()
@@ -4,10 +4,16 @@ MySQL/MariaDB connection and operations
 """
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import PoolError, OperationalError, InterfaceError
 import colorama
 import os
 import json
+import numpy as np
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 from datetime import datetime
 from dotenv import load_dotenv
@@ -15,10 +21,156 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Mất connection: CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED
+LOST_CONNECTION_ERRORS = (
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_SERVER_LOST_EXTENDED,
+    errorcode.ER_CLIENT_INTERACTION_TIMEOUT,  # MySQL 8.0.24+: server báo trước khi đóng connection rảnh quá wait_timeout
+)
+
+# Mất connection chắc chắn TRƯỚC khi server chạy câu lệnh -> câu lệnh ghi chạy lại không sợ ghi trùng
+UNSENT_QUERY_ERRORS = (
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.ER_CLIENT_INTERACTION_TIMEOUT,
+)
+
+
+def encode_embedding(embedding) -> bytes:
+    """Face embedding -> BLOB float32 little-endian (512D ArcFace = 2 KB)"""
+    return np.asarray(embedding, dtype='<f4').tobytes()
+
+
+def decode_embedding(blob) -> np.ndarray:
+    """BLOB float32 -> numpy array (không tạo object Python cho từng phần tử)"""
+    return np.frombuffer(blob, dtype='<f4')
+
+
+class ConnectionPool:
+    """
+    Pool connection MySQL thread-safe
+    
+    Dùng chung giữa DB threads (AsyncChatDatabase), executor của face recognition và scripts.
+    Mỗi operation mượn một connection rồi trả lại; connection hỏng bị bỏ, lần mượn sau tạo mới.
+    Connection vừa dùng không ping trước (không tốn round trip); connection rảnh lâu hơn `recycle` giây
+    (có thể đã bị server đóng vì wait_timeout) được ping khi mượn, chết thì bỏ và lấy cái khác.
+    """
+    
+    def __init__(self, config: Dict, size: int = 5, timeout: float = 10.0, recycle: float = 60.0):
+        """
+        Args:
+            config: Tham số cho mysql.connector.connect
+            size: Số connection tối đa mở cùng lúc
+            timeout: Số giây chờ khi mọi connection đều đang bận
+            recycle: Connection rảnh lâu hơn chừng này giây phải ping trước khi dùng (nhỏ hơn wait_timeout của server)
+        """
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        
+        self._idle = queue.LifoQueue()  # (connection, lúc trả về pool) - LIFO để dùng lại connection "nóng"
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.discarded = 0
+        self.recycled = 0  # Connection rảnh quá lâu bị phát hiện đã chết khi ping
+    
+    def _create(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._lock:
+            self.created += 1
+        return conn
+    
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except Error:
+            pass
+    
+    def _checkout(self):
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._create()
+            
+            if time.monotonic() - returned_at <= self.recycle:
+                return conn
+            try:
+                conn.ping(reconnect=False, attempts=1)
+                return conn
+            except Error:
+                with self._lock:
+                    self.recycled += 1
+                self._discard(conn)
+    
+    def discard_idle(self):
+        """
+        Bỏ mọi connection đang rảnh (vd: sau khi server restart / wait_timeout,
+        các connection rảnh cũng chết như connection vừa lỗi)
+        """
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+    
+    @contextmanager
+    def connection(self, fresh: bool = False):
+        """
+        Mượn một connection (block tối đa `timeout` giây nếu pool đã hết)
+        
+        Args:
+            fresh: True = luôn mở connection mới, không lấy connection rảnh
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No MySQL connection available after {self.timeout}s (pool size {self.size})")
+        
+        conn = None
+        try:
+            conn = self._create() if fresh else self._checkout()
+            yield conn
+        except Error as e:
+            # Lỗi ở tầng connection / mất connection -> có thể đã hỏng, không trả lại pool
+            # (lỗi SQL thông thường như sai cú pháp/trùng khóa thì connection vẫn dùng được)
+            if conn is not None and (isinstance(e, (OperationalError, InterfaceError)) or e.errno in LOST_CONNECTION_ERRORS):
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            self._slots.release()
+    
+    def close(self):
+        """Đóng mọi connection đang rảnh"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Error:
+                pass
+    
+    def stats(self) -> Dict:
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'created': self.created,
+            'discarded': self.discarded,
+            'recycled': self.recycled,
+        }
+
 
 class ChatDatabase:
     def __init__(self):
-        """Initialize database connection"""
+        """Initialize database connection pool"""
         print(colorama.Fore.CYAN + "[DB] Connecting to MySQL..." + colorama.Style.RESET_ALL)
         
         self.config = {
@@ -30,52 +182,201 @@ class ChatDatabase:
             'charset': 'utf8mb4',
             'collation': 'utf8mb4_unicode_ci'
         }
+        self.pool_size = int(os.getenv('MYSQL_POOL_SIZE', '5'))
+        
+        self.pool = None
+        self._script_connection = None
+        
+        # Bộ đếm cho _execute
+        self._stats_lock = threading.Lock()
+        self.queries = 0
+        self.reconnects = 0  # Query chạy lại thành công sau khi mất connection
+        self.failed_reconnects = 0
+        
+        # Callback khi user được tạo / cập nhật (vd: face index trong RAM)
+        self._user_listeners = []
+        
+        # True khi bảng users đã có cột face_embedding_f32 (xem migrate_embeddings_to_blob.py)
+        self.embedding_blob = False
         
-        self.connection = None
-        self.conn = None  # Alias for compatibility
         self.connect()
     
     def connect(self):
-        """Establish database connection"""
+        """Create the connection pool and verify the server is reachable"""
+        # autocommit: mỗi câu lệnh là một transaction, connection trả về pool không giữ snapshot cũ
+        self.pool = ConnectionPool(
+            dict(self.config, autocommit=True),
+            size=self.pool_size,
+            timeout=float(os.getenv('MYSQL_POOL_TIMEOUT', '10')),
+            recycle=float(os.getenv('MYSQL_POOL_RECYCLE', '60'))
+        )
         try:
-            self.connection = mysql.connector.connect(**self.config)
-            self.conn = self.connection  # Alias for compatibility
-            if self.connection.is_connected():
-                print(colorama.Fore.GREEN + "[DB] ✅ Connected to MySQL!" + colorama.Style.RESET_ALL)
+            with self.pool.connection():
+                pass
+            print(colorama.Fore.GREEN + f"[DB] ✅ Connected to MySQL! (pool size {self.pool_size})" + colorama.Style.RESET_ALL)
+            self._limit_recycle()
+            self._detect_embedding_column()
         except Error as e:
             print(colorama.Fore.RED + f"[DB] ❌ Connection failed: {e}" + colorama.Style.RESET_ALL)
             print(colorama.Fore.YELLOW + "[DB] Chat history will not be saved." + colorama.Style.RESET_ALL)
     
-    def ensure_connection(self):
-        """Ensure connection is alive"""
+    def _limit_recycle(self):
+        """Server đặt wait_timeout ngắn hơn MYSQL_POOL_RECYCLE -> ping sớm hơn (trước khi server kịp đóng)"""
+        row = self._execute("SELECT @@SESSION.wait_timeout AS wait_timeout", fetch='one')
+        if row and row['wait_timeout'] and self.pool.recycle > row['wait_timeout'] / 2:
+            self.pool.recycle = row['wait_timeout'] / 2
+            print(colorama.Fore.YELLOW + f"[DB] wait_timeout is {row['wait_timeout']}s, pinging connections idle > {self.pool.recycle:.0f}s" + colorama.Style.RESET_ALL)
+    
+    def _detect_embedding_column(self):
+        """Dùng cột BLOB nếu schema đã migrate, ngược lại đọc/ghi JSON như cũ"""
+        row = self._execute(
+            "SELECT COUNT(*) AS n FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'users' AND COLUMN_NAME = 'face_embedding_f32'",
+            (self.config['database'],), fetch='one'
+        )
+        self.embedding_blob = bool(row and row['n'])
+        if not self.embedding_blob:
+            print(colorama.Fore.YELLOW + "[DB] Face embeddings stored as JSON - run migrate_embeddings_to_blob.py to switch to float32 BLOB" + colorama.Style.RESET_ALL)
+    
+    @staticmethod
+    def _decode_user(user: Optional[Dict]) -> Optional[Dict]:
+        """Gộp face_embedding_f32 (BLOB) / face_embedding (JSON cũ) thành user['face_embedding'] kiểu numpy"""
+        if not user:
+            return user
+        blob = user.pop('face_embedding_f32', None)
+        if blob is not None:
+            user['face_embedding'] = decode_embedding(blob)
+        elif user.get('face_embedding'):
+            user['face_embedding'] = np.asarray(json.loads(user['face_embedding']), dtype=np.float32)
+        else:
+            user['face_embedding'] = None
+        return user
+    
+    @contextmanager
+    def _cursor(self, dictionary: bool = False, fresh: bool = False):
+        """Cursor trên một connection mượn từ pool, trả connection khi xong"""
+        with self.pool.connection(fresh=fresh) as conn:
+            cursor = conn.cursor(dictionary=dictionary)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    def _execute(self, query: str, params=(), fetch: Optional[str] = None):
+        """
+        Chạy một câu lệnh, không kiểm tra connection trước (không tốn round trip ping)
+        
+        Nếu connection đã chết (server restart, wait_timeout...) thì bỏ connection đó cùng mọi
+        connection đang rảnh trong pool (cũng đã chết), mở connection mới và chạy lại đúng một lần.
+        Chỉ chạy lại khi chắc không ghi trùng: SELECT (fetch != None) với mọi lỗi mất connection,
+        câu lệnh ghi chỉ với UNSENT_QUERY_ERRORS (connection chết trước khi server chạy query);
+        CR_SERVER_LOST giữa chừng thì INSERT có thể đã được ghi -> ném lỗi cho caller.
+        Connection bị server đóng vì rảnh quá lâu thường không tới được đây: pool ping connection
+        rảnh lâu hơn MYSQL_POOL_RECYCLE trước khi đưa ra (xem ConnectionPool._checkout).
+        
+        Args:
+            fetch: None (INSERT/UPDATE/DELETE, trả lastrowid), 'one' hoặc 'all' (SELECT, trả dict)
+        
+        Raises:
+            Error: Lỗi MySQL khác, hoặc lần chạy lại vẫn lỗi
+        """
+        with self._stats_lock:
+            self.queries += 1
+        
+        for attempt in (1, 2):
+            try:
+                with self._cursor(dictionary=fetch is not None, fresh=attempt == 2) as cursor:
+                    cursor.execute(query, params)
+                    if fetch == 'one':
+                        return cursor.fetchone()
+                    if fetch == 'all':
+                        return cursor.fetchall()
+                    return cursor.lastrowid
+            except Error as e:
+                if e.errno not in LOST_CONNECTION_ERRORS:
+                    raise
+                self.pool.discard_idle()
+                if fetch is None and e.errno not in UNSENT_QUERY_ERRORS:
+                    print(colorama.Fore.YELLOW + f"[DB] Lost connection ({e.errno}) during a write, not retrying (may have been applied)" + colorama.Style.RESET_ALL)
+                    raise
+                if attempt == 2:
+                    with self._stats_lock:
+                        self.failed_reconnects += 1
+                    raise
+                print(colorama.Fore.YELLOW + f"[DB] Lost connection ({e.errno}), reconnecting..." + colorama.Style.RESET_ALL)
+                with self._stats_lock:
+                    self.reconnects += 1
+    
+    def stats(self) -> Dict:
+        """Bộ đếm query / reconnect và trạng thái pool"""
+        with self._stats_lock:
+            stats = {
+                'queries': self.queries,
+                'reconnects': self.reconnects,
+                'failed_reconnects': self.failed_reconnects,
+            }
+        stats['pool'] = self.pool.stats()
+        return stats
+    
+    @property
+    def connection(self):
+        """
+        Connection riêng (ngoài pool, không autocommit) cho các script bảo trì
+        dùng cursor/commit/rollback trực tiếp. Server không dùng connection này.
+        """
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-        except Error:
-            self.connect()
+            if self._script_connection is None or not self._script_connection.is_connected():
+                self._script_connection = mysql.connector.connect(**self.config)
+        except Error as e:
+            print(colorama.Fore.RED + f"[DB] ❌ Connection failed: {e}" + colorama.Style.RESET_ALL)
+            return None
+        return self._script_connection
+    
+    @property
+    def conn(self):
+        """Alias for compatibility"""
+        return self.connection
     
     # ==================== USER MANAGEMENT ====================
     
+    def add_user_listener(self, callback):
+        """
+        Đăng ký callback(user) được gọi sau khi create_user / update_user_profile thành công.
+        `user` chỉ gồm 'id' và các field vừa ghi (create_user có kèm 'face_embedding').
+        """
+        self._user_listeners.append(callback)
+    
+    def _notify_user_changed(self, user: Dict):
+        for callback in self._user_listeners:
+            try:
+                callback(user)
+            except Exception as e:
+                print(colorama.Fore.YELLOW + f"[DB] User listener error: {e}" + colorama.Style.RESET_ALL)
+    
     def create_user(self, username: str, full_name: str, face_embedding: list, 
                    gender: str = 'other', birth_year: int = None, age: int = None, 
                    avatar_url: str = None) -> Optional[int]:
         """Create a new user with profile"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
         try:
-            cursor = self.connection.cursor()
-            query = """
-                INSERT INTO users (username, full_name, gender, birth_year, age, avatar_url, face_embedding) 
+            if self.embedding_blob:
+                column, embedding_value = 'face_embedding_f32', encode_embedding(face_embedding)
+            else:
+                column, embedding_value = 'face_embedding', json.dumps([float(x) for x in face_embedding])
+            query = f"""
+                INSERT INTO users (username, full_name, gender, birth_year, age, avatar_url, {column}) 
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
             """
-            embedding_json = json.dumps(face_embedding)
-            cursor.execute(query, (username, full_name, gender, birth_year, age, avatar_url, embedding_json))
-            self.connection.commit()
-            user_id = cursor.lastrowid
-            cursor.close()
+            user_id = self._execute(query, (username, full_name, gender, birth_year, age, avatar_url, embedding_value))
             print(colorama.Fore.GREEN + f"[DB] Created user #{user_id}: {username}" + colorama.Style.RESET_ALL)
+            self._notify_user_changed({
+                'id': user_id,
+                'username': username,
+                'full_name': full_name,
+                'gender': gender,
+                'age': age,
+                'avatar_url': avatar_url,
+                'face_embedding': face_embedding
+            })
             return user_id
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error creating user: {e}" + colorama.Style.RESET_ALL)
@@ -83,104 +384,64 @@ class ChatDatabase:
     
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         """Get user by username"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = "SELECT * FROM users WHERE username = %s"
-            cursor.execute(query, (username,))
-            user = cursor.fetchone()
-            cursor.close()
-            
-            if user and user.get('face_embedding'):
-                user['face_embedding'] = json.loads(user['face_embedding'])
-            
-            return user
+            return self._decode_user(self._execute(query, (username,), fetch='one'))
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting user: {e}" + colorama.Style.RESET_ALL)
             return None
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
         """Get user by ID"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = "SELECT * FROM users WHERE id = %s"
-            cursor.execute(query, (user_id,))
-            user = cursor.fetchone()
-            cursor.close()
-            
-            if user and user.get('face_embedding'):
-                user['face_embedding'] = json.loads(user['face_embedding'])
-            
-            return user
+            return self._decode_user(self._execute(query, (user_id,), fetch='one'))
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting user: {e}" + colorama.Style.RESET_ALL)
             return None
     
     def get_all_users(self) -> List[Dict]:
         """Get all users (for face recognition matching)"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
+        try:
+            columns = "face_embedding, face_embedding_f32" if self.embedding_blob else "face_embedding"
+            query = f"SELECT id, username, full_name, gender, age, avatar_url, {columns} FROM users"
+            return [self._decode_user(user) for user in self._execute(query, fetch='all')]
+        except Error as e:
+            print(colorama.Fore.RED + f"[DB] Error getting users: {e}" + colorama.Style.RESET_ALL)
             return []
+    
+    def get_user_profiles(self) -> Optional[List[Dict]]:
+        """
+        Get all users without face embeddings (cheap listing, e.g. to sync a saved face index)
         
+        Trả None (không phải []) khi lỗi DB: caller đồng bộ index không được hiểu là "không còn user nào"
+        """
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            query = "SELECT id, username, full_name, gender, age, avatar_url, face_embedding FROM users"
-            cursor.execute(query)
-            users = cursor.fetchall()
-            cursor.close()
-            
-            for user in users:
-                if user.get('face_embedding'):
-                    user['face_embedding'] = json.loads(user['face_embedding'])
-            
-            return users
+            query = "SELECT id, username, full_name, gender, age, avatar_url FROM users"
+            return self._execute(query, fetch='all')
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting users: {e}" + colorama.Style.RESET_ALL)
-            return []
+            return None
     
     def update_user_profile(self, user_id: int, full_name: str = None, gender: str = None,
                            birth_year: int = None, age: int = None, avatar_url: str = None) -> bool:
         """Update user profile"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
+        fields = {
+            'full_name': full_name,
+            'gender': gender,
+            'birth_year': birth_year,
+            'age': age,
+            'avatar_url': avatar_url
+        }
+        fields = {column: value for column, value in fields.items() if value is not None}
+        
+        if not fields:
             return False
         
         try:
-            cursor = self.connection.cursor()
-            updates = []
-            params = []
-            
-            if full_name is not None:
-                updates.append("full_name = %s")
-                params.append(full_name)
-            if gender is not None:
-                updates.append("gender = %s")
-                params.append(gender)
-            if birth_year is not None:
-                updates.append("birth_year = %s")
-                params.append(birth_year)
-            if age is not None:
-                updates.append("age = %s")
-                params.append(age)
-            if avatar_url is not None:
-                updates.append("avatar_url = %s")
-                params.append(avatar_url)
-            
-            if not updates:
-                return False
-            
-            params.append(user_id)
-            query = f"UPDATE users SET {', '.join(updates)} WHERE id = %s"
-            cursor.execute(query, params)
-            self.connection.commit()
-            cursor.close()
+            query = f"UPDATE users SET {', '.join(f'{column} = %s' for column in fields)} WHERE id = %s"
+            self._execute(query, (*fields.values(), user_id))
+            self._notify_user_changed(dict(fields, id=user_id))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error updating user: {e}" + colorama.Style.RESET_ALL)
@@ -188,16 +449,8 @@ class ChatDatabase:
     
     def update_last_login(self, user_id: int) -> bool:
         """Update user's last login time"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "UPDATE users SET last_login = NOW() WHERE id = %s"
-            cursor.execute(query, (user_id,))
-            self.connection.commit()
-            cursor.close()
+            self._execute("UPDATE users SET last_login = NOW() WHERE id = %s", (user_id,))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error updating last login: {e}" + colorama.Style.RESET_ALL)
@@ -207,17 +460,9 @@ class ChatDatabase:
     
     def create_conversation(self, user_id: int, title: str = "New Chat") -> Optional[int]:
         """Create a new conversation for user"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
         try:
-            cursor = self.connection.cursor()
             query = "INSERT INTO conversations (user_id, title) VALUES (%s, %s)"
-            cursor.execute(query, (user_id, title))
-            self.connection.commit()
-            conversation_id = cursor.lastrowid
-            cursor.close()
+            conversation_id = self._execute(query, (user_id, title))
             print(colorama.Fore.GREEN + f"[DB] Created conversation #{conversation_id}" + colorama.Style.RESET_ALL)
             return conversation_id
         except Error as e:
@@ -226,16 +471,9 @@ class ChatDatabase:
     
     def add_message(self, conversation_id: int, role: str, content: str, user_emotion: Optional[str] = None) -> bool:
         """Add a message to conversation"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
             query = "INSERT INTO messages (conversation_id, role, content, user_emotion) VALUES (%s, %s, %s, %s)"
-            cursor.execute(query, (conversation_id, role, content, user_emotion))
-            self.connection.commit()
-            cursor.close()
+            self._execute(query, (conversation_id, role, content, user_emotion))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error adding message: {e}" + colorama.Style.RESET_ALL)
@@ -243,12 +481,7 @@ class ChatDatabase:
     
     def get_conversations(self, user_id: int, limit: int = 50) -> List[Dict]:
         """Get list of conversations for a user"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)  # ✅ FIX: self.connection.cursor
             query = """
                 SELECT id, user_id, title, created_at, updated_at 
                 FROM conversations 
@@ -256,48 +489,29 @@ class ChatDatabase:
                 ORDER BY updated_at DESC 
                 LIMIT %s
             """
-            cursor.execute(query, (user_id, limit))
-            conversations = cursor.fetchall()
-            cursor.close()
-            return conversations
+            return self._execute(query, (user_id, limit), fetch='all')
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting conversations: {e}" + colorama.Style.RESET_ALL)
             return []
     
     def get_messages(self, conversation_id: int) -> List[Dict]:
         """Get all messages in a conversation"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = """
                 SELECT id, role, content, user_emotion, created_at 
                 FROM messages 
                 WHERE conversation_id = %s 
                 ORDER BY created_at ASC
             """
-            cursor.execute(query, (conversation_id,))
-            messages = cursor.fetchall()
-            cursor.close()
-            return messages
+            return self._execute(query, (conversation_id,), fetch='all')
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting messages: {e}" + colorama.Style.RESET_ALL)
             return []
     
     def update_conversation_title(self, conversation_id: int, title: str) -> bool:
         """Update conversation title"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "UPDATE conversations SET title = %s WHERE id = %s"
-            cursor.execute(query, (title, conversation_id))
-            self.connection.commit()
-            cursor.close()
+            self._execute("UPDATE conversations SET title = %s WHERE id = %s", (title, conversation_id))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error updating title: {e}" + colorama.Style.RESET_ALL)
@@ -305,16 +519,8 @@ class ChatDatabase:
     
     def delete_conversation(self, conversation_id: int) -> bool:
         """Delete a conversation (cascade delete messages)"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "DELETE FROM conversations WHERE id = %s"
-            cursor.execute(query, (conversation_id,))
-            self.connection.commit()
-            cursor.close()
+            self._execute("DELETE FROM conversations WHERE id = %s", (conversation_id,))
             print(colorama.Fore.YELLOW + f"[DB] Deleted conversation #{conversation_id}" + colorama.Style.RESET_ALL)
             return True
         except Error as e:
@@ -322,26 +528,20 @@ class ChatDatabase:
             return False
     
     def close(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print(colorama.Fore.YELLOW + "[DB] Connection closed" + colorama.Style.RESET_ALL)
+        """Close database connections"""
+        if self.pool:
+            self.pool.close()
+        if self._script_connection is not None and self._script_connection.is_connected():
+            self._script_connection.close()
+        print(colorama.Fore.YELLOW + "[DB] Connection closed" + colorama.Style.RESET_ALL)
     
     # ==================== REMINDER MANAGEMENT ====================
     
     def create_reminder(self, user_id: int, title: str, reminder_time: str, description: str = None) -> Optional[int]:
         """Create a new reminder"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
         try:
-            cursor = self.connection.cursor()
             query = "INSERT INTO reminders (user_id, title, description, reminder_time) VALUES (%s, %s, %s, %s)"
-            cursor.execute(query, (user_id, title, description, reminder_time))
-            self.connection.commit()
-            reminder_id = cursor.lastrowid
-            cursor.close()
+            reminder_id = self._execute(query, (user_id, title, description, reminder_time))
             print(colorama.Fore.GREEN + f"[DB] Created reminder #{reminder_id}" + colorama.Style.RESET_ALL)
             return reminder_id
         except Error as e:
@@ -350,32 +550,19 @@ class ChatDatabase:
     
     def get_reminders(self, user_id: int, include_completed: bool = False) -> List[Dict]:
         """Get reminders for a user"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)
             if include_completed:
                 query = "SELECT * FROM reminders WHERE user_id = %s ORDER BY reminder_time ASC"
             else:
                 query = "SELECT * FROM reminders WHERE user_id = %s AND is_completed = FALSE ORDER BY reminder_time ASC"
-            cursor.execute(query, (user_id,))
-            reminders = cursor.fetchall()
-            cursor.close()
-            return reminders
+            return self._execute(query, (user_id,), fetch='all')
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting reminders: {e}" + colorama.Style.RESET_ALL)
             return []
     
     def get_pending_reminders(self) -> List[Dict]:
         """Get all pending reminders that need to be triggered"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
         try:
-            cursor = self.connection.cursor(dictionary=True)
             query = """
                 SELECT r.*, u.username, u.full_name 
                 FROM reminders r
@@ -384,26 +571,15 @@ class ChatDatabase:
                 AND r.is_notified = FALSE 
                 AND r.reminder_time <= NOW()
             """
-            cursor.execute(query)
-            reminders = cursor.fetchall()
-            cursor.close()
-            return reminders
+            return self._execute(query, fetch='all')
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error getting pending reminders: {e}" + colorama.Style.RESET_ALL)
             return []
     
     def mark_reminder_notified(self, reminder_id: int) -> bool:
         """Mark reminder as notified"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "UPDATE reminders SET is_notified = TRUE WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
+            self._execute("UPDATE reminders SET is_notified = TRUE WHERE id = %s", (reminder_id,))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error marking reminder: {e}" + colorama.Style.RESET_ALL)
@@ -411,16 +587,8 @@ class ChatDatabase:
     
     def complete_reminder(self, reminder_id: int) -> bool:
         """Mark reminder as completed"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "UPDATE reminders SET is_completed = TRUE WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
+            self._execute("UPDATE reminders SET is_completed = TRUE WHERE id = %s", (reminder_id,))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error completing reminder: {e}" + colorama.Style.RESET_ALL)
@@ -428,20 +596,27 @@ class ChatDatabase:
     
     def delete_reminder(self, reminder_id: int) -> bool:
         """Delete a reminder"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
         try:
-            cursor = self.connection.cursor()
-            query = "DELETE FROM reminders WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
+            self._execute("DELETE FROM reminders WHERE id = %s", (reminder_id,))
             return True
         except Error as e:
             print(colorama.Fore.RED + f"[DB] Error deleting reminder: {e}" + colorama.Style.RESET_ALL)
             return False
+    
+    def get_missed_reminders(self, user_id: int) -> List[Dict]:
+        """Get all missed reminders for a user (notified but not completed)"""
+        try:
+            query = """
+                SELECT * FROM reminders
+                WHERE user_id = %s 
+                AND is_completed = FALSE 
+                AND is_notified = TRUE
+                ORDER BY reminder_time DESC
+            """
+            return self._execute(query, (user_id,), fetch='all')
+        except Error as e:
+            print(colorama.Fore.RED + f"[DB] Error getting missed reminders: {e}" + colorama.Style.RESET_ALL)
+            return []
 
 
 # Test
@@ -454,7 +629,7 @@ if __name__ == "__main__":
     
     db = ChatDatabase()
     
-    if db.connection and db.connection.is_connected():
+    if db.pool.stats()['created']:
         # Test create conversation
         conv_id = db.create_conversation(user_name="John", title="Test Chat")
         
@@ -478,144 +653,3 @@ if __name__ == "__main__":
         db.close()
     else:
         print("Database connection failed. Check your MySQL settings.")
-
-    
-    # ==================== REMINDER MANAGEMENT ====================
-    
-    def create_reminder(self, user_id: int, title: str, reminder_time: str, description: str = None) -> Optional[int]:
-        """Create a new reminder"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return None
-        
-        try:
-            cursor = self.connection.cursor()
-            query = "INSERT INTO reminders (user_id, title, description, reminder_time) VALUES (%s, %s, %s, %s)"
-            cursor.execute(query, (user_id, title, description, reminder_time))
-            self.connection.commit()
-            reminder_id = cursor.lastrowid
-            cursor.close()
-            print(colorama.Fore.GREEN + f"[DB] Created reminder #{reminder_id}" + colorama.Style.RESET_ALL)
-            return reminder_id
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error creating reminder: {e}" + colorama.Style.RESET_ALL)
-            return None
-    
-    def get_reminders(self, user_id: int, include_completed: bool = False) -> List[Dict]:
-        """Get reminders for a user"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            if include_completed:
-                query = "SELECT * FROM reminders WHERE user_id = %s ORDER BY reminder_time ASC"
-            else:
-                query = "SELECT * FROM reminders WHERE user_id = %s AND is_completed = FALSE ORDER BY reminder_time ASC"
-            cursor.execute(query, (user_id,))
-            reminders = cursor.fetchall()
-            cursor.close()
-            return reminders
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error getting reminders: {e}" + colorama.Style.RESET_ALL)
-            return []
-    
-    def get_pending_reminders(self) -> List[Dict]:
-        """Get all pending reminders that need to be triggered"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT r.*, u.username, u.full_name 
-                FROM reminders r
-                JOIN users u ON r.user_id = u.id
-                WHERE r.is_completed = FALSE 
-                AND r.is_notified = FALSE 
-                AND r.reminder_time <= NOW()
-            """
-            cursor.execute(query)
-            reminders = cursor.fetchall()
-            cursor.close()
-            return reminders
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error getting pending reminders: {e}" + colorama.Style.RESET_ALL)
-            return []
-    
-    def mark_reminder_notified(self, reminder_id: int) -> bool:
-        """Mark reminder as notified"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
-        try:
-            cursor = self.connection.cursor()
-            query = "UPDATE reminders SET is_notified = TRUE WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
-            return True
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error marking reminder: {e}" + colorama.Style.RESET_ALL)
-            return False
-    
-    def complete_reminder(self, reminder_id: int) -> bool:
-        """Mark reminder as completed"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
-        try:
-            cursor = self.connection.cursor()
-            query = "UPDATE reminders SET is_completed = TRUE WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
-            return True
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error completing reminder: {e}" + colorama.Style.RESET_ALL)
-            return False
-    
-    def delete_reminder(self, reminder_id: int) -> bool:
-        """Delete a reminder"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return False
-        
-        try:
-            cursor = self.connection.cursor()
-            query = "DELETE FROM reminders WHERE id = %s"
-            cursor.execute(query, (reminder_id,))
-            self.connection.commit()
-            cursor.close()
-            return True
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error deleting reminder: {e}" + colorama.Style.RESET_ALL)
-            return False
-            return False
-
-    def get_missed_reminders(self, user_id: int) -> List[Dict]:
-        """Get all missed reminders for a user (notified but not completed)"""
-        self.ensure_connection()
-        if not self.connection or not self.connection.is_connected():
-            return []
-        
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT * FROM reminders
-                WHERE user_id = %s 
-                AND is_completed = FALSE 
-                AND is_notified = TRUE
-                ORDER BY reminder_time DESC
-            """
-            cursor.execute(query, (user_id,))
-            reminders = cursor.fetchall()
-            cursor.close()
-            return reminders
-        except Error as e:
-            print(colorama.Fore.RED + f"[DB] Error getting missed reminders: {e}" + colorama.Style.RESET_ALL)
-            return []
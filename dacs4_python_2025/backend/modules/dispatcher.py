@@ -0,0 +1,121 @@
+"""
+Command Dispatcher - Registry các lệnh JSON từ WebSocket
+Mỗi lệnh là một async handler với schema payload khai báo sẵn.
+Handler chậm (DB, LLM, TTS) được chạy thành task riêng để vòng nhận message không bị chặn.
+"""
+
+import asyncio
+import json
+import traceback
+import colorama
+from typing import Callable, Dict, NamedTuple, Optional
+
+# Dùng trong schema cho field không bắt buộc, vd: {'description': (str, OPTIONAL)}
+OPTIONAL = type(None)
+
+
+class Command(NamedTuple):
+    handler: Callable
+    schema: Dict[str, object]
+    spawn: bool
+
+
+class CommandDispatcher:
+    def __init__(self):
+        self._commands: Dict[str, Command] = {}
+
+    def command(self, name: str, schema: Optional[Dict[str, object]] = None, spawn: bool = False):
+        """
+        Decorator đăng ký handler cho một loại lệnh
+
+        Args:
+            name: Giá trị field 'type' của message
+            schema: {field: type hoặc tuple type}. Field bắt buộc trừ khi tuple có OPTIONAL
+            spawn: True = chạy thành task riêng (handler có I/O chậm)
+        """
+        def register(handler: Callable) -> Callable:
+            if name in self._commands:
+                raise ValueError(f"Command already registered: {name}")
+            self._commands[name] = Command(handler, schema or {}, spawn)
+            return handler
+        return register
+
+    @property
+    def commands(self):
+        return list(self._commands)
+
+    @staticmethod
+    def _validate(schema: Dict[str, object], data: dict) -> Optional[str]:
+        """Trả về mô tả lỗi, hoặc None nếu payload hợp lệ"""
+        for field, types in schema.items():
+            types = types if isinstance(types, tuple) else (types,)
+            value = data.get(field)
+
+            if value is None:
+                if OPTIONAL not in types:
+                    return f"missing field '{field}'"
+                continue
+
+            # bool là subclass của int -> không chấp nhận True/False cho field số
+            if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+                expected = '/'.join(t.__name__ for t in types if t is not OPTIONAL)
+                return f"field '{field}' must be {expected}"
+        return None
+
+    async def dispatch(self, websocket, state: dict, data: dict) -> Optional[asyncio.Task]:
+        """
+        Chạy handler của lệnh. Handler có spawn=True được tạo task và trả về ngay.
+
+        Task được lưu trong state['tasks'] để hủy khi client ngắt kết nối.
+        """
+        cmd_type = data.get('type')
+        command = self._commands.get(cmd_type)
+        if command is None:
+            print(colorama.Fore.YELLOW + f"[WS] Unknown command: {cmd_type}" + colorama.Style.RESET_ALL)
+            return None
+
+        error = self._validate(command.schema, data)
+        if error:
+            print(colorama.Fore.YELLOW + f"[WS] Invalid '{cmd_type}' payload: {error}" + colorama.Style.RESET_ALL)
+            await websocket.send(json.dumps({
+                'type': 'command_error',
+                'command': cmd_type,
+                'message': error
+            }))
+            return None
+
+        if not command.spawn:
+            await command.handler(websocket, state, data)
+            return None
+
+        return track_task(state, self._run(cmd_type, command.handler, websocket, state, data))
+
+    @staticmethod
+    async def _run(cmd_type: str, handler: Callable, websocket, state: dict, data: dict):
+        # Lỗi trong task không có ai await -> log tại đây
+        try:
+            await handler(websocket, state, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if "ConnectionClosed" not in type(e).__name__:
+                print(colorama.Fore.RED + f"[WS] Command '{cmd_type}' failed: {e}" + colorama.Style.RESET_ALL)
+                traceback.print_exc()
+
+
+def track_task(state: dict, coro) -> asyncio.Task:
+    """Tạo task thuộc session (lưu trong state['tasks']) để cancel_tasks hủy được khi client ngắt kết nối"""
+    task = asyncio.create_task(coro)
+    tasks = state.setdefault('tasks', set())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
+async def cancel_tasks(state: dict):
+    """Hủy các task còn chạy của session (lệnh, pipeline LLM/TTS, task nghe barge-in)"""
+    tasks = list(state.get('tasks', ()))
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,100 @@
+"""
+Emotion Batcher - Gom crop khuôn mặt của mọi session thành batch cho emotion model
+Request đầu tiên mở một cửa sổ ngắn (vd: 15ms); các crop tới trong cửa sổ đó (tối đa max_batch)
+được chạy chung một lần model, kết quả trả về đúng future của từng session.
+Độ trễ thêm tối đa = window; dưới tải, mỗi lần chạy model phục vụ nhiều session.
+"""
+
+import asyncio
+import colorama
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from modules.face_emotion import emotion_input
+
+
+class EmotionBatcher:
+    def __init__(self, backend, window: float = 0.015, max_batch: int = 16, report_every: int = 500):
+        """
+        Args:
+            backend: Có `async emotion_scores_batch(faces)` (LocalFaceInference / FaceWorkerPool)
+            window: Thời gian gom batch tối đa (giây)
+            max_batch: Đủ số crop này thì chạy ngay, không chờ hết window
+            report_every: In thống kê sau mỗi N batch (0 = không in)
+        """
+        self.backend = backend
+        self.window = window
+        self.max_batch = max_batch
+        self.report_every = report_every
+
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = set()  # Giữ reference tới các batch đang chạy
+
+        # Thống kê
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+
+    async def submit(self, crop: np.ndarray) -> Optional[Dict[str, float]]:
+        """Điểm cảm xúc (%) của một crop BGR, chạy chung batch với các session khác"""
+        if crop is None or crop.size == 0:
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((emotion_input(crop), future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = [(face, future) for face, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        faces = np.stack([face for face, _ in batch])
+        try:
+            results = await self.backend.emotion_scores_batch(faces)
+        except Exception as e:
+            # Không gọi được model trực tiếp (khác version DeepFace...) -> chạy từng crop qua DeepFace.analyze
+            print(colorama.Fore.YELLOW + f"[EMOTION] Batch of {len(batch)} failed ({e}), falling back to per-face inference" + colorama.Style.RESET_ALL)
+            results = await asyncio.gather(
+                *(self.backend.emotion_scores(cv2.cvtColor(face, cv2.COLOR_GRAY2BGR)) for face, _ in batch),
+                return_exceptions=True
+            )
+            results = [None if isinstance(r, BaseException) else r for r in results]
+
+        for (_, future), scores in zip(batch, results):
+            if not future.done():
+                future.set_result(scores)
+
+        self.batches += 1
+        self.items += len(batch)
+        self.max_seen = max(self.max_seen, len(batch))
+        if self.report_every and self.batches % self.report_every == 0:
+            stats = self.stats()
+            print(colorama.Fore.CYAN + f"[EMOTION] {stats['batches']} batches, avg size {stats['avg_batch']}, max {stats['max_batch']}" + colorama.Style.RESET_ALL)
+
+    def stats(self) -> Dict:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch': self.max_seen,
+        }
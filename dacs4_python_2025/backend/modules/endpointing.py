@@ -0,0 +1,175 @@
+"""
+Endpointing - Quyết định khi nào câu nói đã kết thúc (thay cho SILENCE_DURATION cố định 1.5s)
+Thời gian chờ im lặng thay đổi theo từng câu:
+- Độ dài câu: câu lệnh ngắn ("yes", "stop") chờ ngắn, câu dài (hay ngập ngừng) chờ lâu hơn
+- Nhịp nói: không ngắt khi khoảng lặng còn ngắn hơn quãng ngừng dài nhất user đã có trong câu
+- Xác suất VAD trong khoảng lặng: lơ lửng (thở, "ừm", nói nhỏ) -> chờ thêm
+- Gợi ý từ transcript tạm của STT streaming: kết thúc bằng dấu câu -> chờ ít; bằng "and", "um"... -> chờ thêm
+
+Tắt mặc định (ADAPTIVE_ENDPOINTING=1 để bật): trên benchmark chỉ nhanh hơn khi có STT streaming
+(~1.0s thay vì 1.5s) và đổi lại ~4-5% câu bị ngắt sớm khi transcript tạm đặt dấu chấm giữa chừng.
+
+Tính theo số chunk audio (không theo đồng hồ) nên replay WAV cho kết quả giống chạy thật
+(xem benchmark_endpointing.py).
+"""
+
+import os
+from typing import Optional
+
+# Từ cuối câu cho thấy user chưa nói xong
+CONTINUATION_WORDS = {
+    'and', 'but', 'or', 'so', 'because', 'if', 'then', 'that', 'which', 'when', 'while',
+    'the', 'a', 'an', 'to', 'of', 'for', 'with', 'in', 'on', 'at', 'my', 'your', 'is', 'are', 'i',
+    'um', 'uh', 'uhm', 'er', 'erm', 'hmm', 'like',
+}
+
+COMPLETE = 'complete'
+CONTINUE = 'continue'
+
+
+def classify_transcript(text: str) -> Optional[str]:
+    """COMPLETE / CONTINUE / None (không rõ) cho transcript tạm của câu đang nói"""
+    text = text.strip()
+    if not text:
+        return None
+    words = text.lower().rstrip('.?!,;:').split()
+    if text.endswith((',', '...')) or (words and words[-1] in CONTINUATION_WORDS):
+        return CONTINUE
+    if text.endswith(('.', '?', '!')):
+        return COMPLETE
+    return None
+
+
+class FixedEndpointer:
+    """Hành vi cũ: ngắt sau đúng `silence_duration` giây im lặng"""
+
+    def __init__(self, chunk_seconds: float, threshold: float = 0.5, silence_duration: float = 1.5):
+        self.chunk_seconds = chunk_seconds
+        self.threshold = threshold
+        self.silence_duration = silence_duration
+        self.reset()
+
+    def reset(self):
+        self.voiced = 0  # Số chunk có giọng nói trong câu
+        self.silence_run = 0  # Số chunk im lặng liên tiếp hiện tại
+
+    def hint(self, text: str):
+        pass
+
+    def timeout(self) -> float:
+        return self.silence_duration
+
+    def update(self, prob: float) -> bool:
+        """
+        Thêm xác suất VAD của chunk tiếp theo
+
+        Returns:
+            True nếu câu nói đã kết thúc ở chunk này
+        """
+        if prob > self.threshold:
+            self._on_speech()
+            self.voiced += 1
+            self.silence_run = 0
+            return False
+        if not self.voiced:
+            return False
+        self.silence_run += 1
+        self._on_silence(prob)
+        return self.silence_run * self.chunk_seconds > self.timeout()
+
+    def _on_speech(self):
+        pass
+
+    def _on_silence(self, prob: float):
+        pass
+
+
+class AdaptiveEndpointer(FixedEndpointer):
+    def __init__(self, chunk_seconds: float, threshold: float = 0.5,
+                 min_silence: float = 0.5, max_silence: float = 2.0,
+                 short_speech: float = 1.0, long_speech: float = 3.0,
+                 short_silence: float = 1.4, long_silence: float = 1.6,
+                 rhythm_factor: float = 1.3, quiet_factor: float = 1.0, hover_factor: float = 1.3,
+                 complete_factor: float = 0.6, continue_factor: float = 1.3):
+        """
+        Mặc định chỉnh theo benchmark_endpointing.py để không ngắt sớm hơn SILENCE_DURATION 1.5s cũ:
+        không có transcript tạm thì thời gian chờ gần như cũ (chỉ chờ thêm khi ngập ngừng),
+        chỉ rút ngắn khi transcript tạm của STT streaming kết thúc bằng dấu câu.
+        Im lặng "hẳn" (quiet_factor < 1) không phân biệt được ngập ngừng lặng với hết câu -> không rút ngắn.
+
+        Args:
+            min_silence / max_silence: Giới hạn thời gian chờ im lặng (giây)
+            short_speech / long_speech: Câu có ít / nhiều hơn chừng này giây giọng nói là câu ngắn / dài
+            short_silence / long_silence: Thời gian chờ gốc cho câu ngắn / dài (nội suy ở giữa)
+            rhythm_factor: Chờ ít nhất rhythm_factor x quãng ngừng dài nhất đã có trong câu
+            quiet_factor / hover_factor: Nhân thời gian chờ khi xác suất VAD trong khoảng lặng gần 0 / lơ lửng
+            complete_factor / continue_factor: Nhân thời gian chờ khi transcript tạm trọn câu / còn dở
+        """
+        self.min_silence = min_silence
+        self.max_silence = max_silence
+        self.short_speech = short_speech
+        self.long_speech = long_speech
+        self.short_silence = short_silence
+        self.long_silence = long_silence
+        self.rhythm_factor = rhythm_factor
+        self.quiet_factor = quiet_factor
+        self.hover_factor = hover_factor
+        self.complete_factor = complete_factor
+        self.continue_factor = continue_factor
+        super().__init__(chunk_seconds, threshold)
+
+    def reset(self):
+        super().reset()
+        self.longest_pause = 0  # Quãng ngừng dài nhất giữa hai đoạn nói (chunk)
+        self.silence_prob_sum = 0.0
+        self.semantic: Optional[str] = None
+
+    def hint(self, text: str):
+        """Transcript tạm (interim) của câu đang nói, có thể gọi từ thread khác"""
+        self.semantic = classify_transcript(text)
+
+    def _on_speech(self):
+        if self.silence_run:
+            # Nói tiếp sau quãng ngừng: gợi ý cũ không còn đúng, chờ transcript mới
+            self.longest_pause = max(self.longest_pause, self.silence_run)
+            self.semantic = None
+        self.silence_prob_sum = 0.0
+
+    def _on_silence(self, prob: float):
+        self.silence_prob_sum += prob
+
+    def timeout(self) -> float:
+        # Độ dài câu
+        voiced_seconds = self.voiced * self.chunk_seconds
+        ratio = (voiced_seconds - self.short_speech) / (self.long_speech - self.short_speech)
+        ratio = min(1.0, max(0.0, ratio))
+        timeout = self.short_silence + ratio * (self.long_silence - self.short_silence)
+
+        # Nhịp nói của user trong câu này
+        timeout = max(timeout, self.rhythm_factor * self.longest_pause * self.chunk_seconds)
+
+        # Xu hướng xác suất trong khoảng lặng hiện tại (cần vài chunk mới đủ tin)
+        if self.silence_run >= 3:
+            mean_prob = self.silence_prob_sum / self.silence_run
+            if mean_prob < 0.05:
+                timeout *= self.quiet_factor
+            elif mean_prob > 0.2:
+                timeout *= self.hover_factor
+
+        # Gợi ý từ transcript
+        if self.semantic == COMPLETE:
+            timeout *= self.complete_factor
+        elif self.semantic == CONTINUE:
+            timeout = max(timeout, self.long_silence) * self.continue_factor
+
+        return min(self.max_silence, max(self.min_silence, timeout))
+
+
+def create_endpointer(chunk_seconds: float, threshold: float = 0.5, silence_duration: float = 1.5):
+    """
+    Mặc định ngắt sau silence_duration cố định như trước; ADAPTIVE_ENDPOINTING=1 để bật AdaptiveEndpointer
+    (chỉ nhanh hơn rõ khi có STT streaming, đổi lại đôi khi ngắt sớm - xem benchmark_endpointing.py)
+    """
+    if os.getenv('ADAPTIVE_ENDPOINTING', '0') == '0':
+        return FixedEndpointer(chunk_seconds, threshold, silence_duration)
+    return AdaptiveEndpointer(chunk_seconds, threshold)
@@ -1,7 +1,7 @@
 """
 Face Recognition + Emotion Detection Module
-- Nhận diện khuôn mặt (DeepFace)
-- Phát hiện cảm xúc từ khuôn mặt (DeepFace)
+- Nhận diện khuôn mặt (DeepFace, hoặc ONNX Runtime khi USE_ONNX=1)
+- Phát hiện cảm xúc từ khuôn mặt (DeepFace, hoặc ONNX Runtime khi USE_ONNX=1)
 - Lưu và load user profiles từ MySQL database
 """
 
@@ -10,12 +10,32 @@ import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
+import time
 import numpy as np
-from deepface import DeepFace
 import colorama
 from typing import Optional, Dict, List
 import cv2
 
+from modules.face_index import create_face_index
+from modules.onnx_backends import create_face_backends
+from modules.warmup import warmup_step
+
+# Thứ tự output của emotion model DeepFace (FER-2013)
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+EMOTION_INPUT_SIZE = 48
+
+
+def _deepface():
+    """Import DeepFace (kéo theo TensorFlow) chỉ khi thật sự cần - backend ONNX không import"""
+    from deepface import DeepFace
+    return DeepFace
+
+
+def emotion_input(face: np.ndarray) -> np.ndarray:
+    """Crop BGR -> đầu vào emotion model: grayscale 48x48 uint8"""
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+
 
 class FaceEmotionDetector:
     def __init__(self, database=None):
@@ -26,6 +46,20 @@ class FaceEmotionDetector:
         
         print(colorama.Fore.YELLOW + "[FACE] Using ArcFace model (highest accuracy)" + colorama.Style.RESET_ALL)
         
+        # Detector chạy một lần mỗi frame, crop dùng chung cho ArcFace + emotion
+        self.detector_backend = os.getenv('FACE_DETECTOR_BACKEND', 'opencv')
+        self._emotion_model = None  # Load khi cần (emotion_scores_batch)
+        
+        # Model chạy bằng ONNX Runtime (USE_ONNX=1); thiếu key nào thì phần đó dùng DeepFace
+        self.onnx = create_face_backends()
+        
+        # Embedding của tất cả user nằm sẵn trong RAM, load từ DB (hoặc file index) một lần
+        self.face_index = create_face_index()
+        self.face_index_path = os.getenv('FACE_INDEX_PATH', os.path.join('data', 'face_index.npz'))
+        if self.database:
+            self.reload_index()
+            self.database.add_user_listener(self._on_user_changed)
+        
         # Emotion mapping - Phong cách vui vẻ, cợt nhã
         self.emotion_responses = {
             'happy': "Yooo, someone's in a good mood! Love the energy!",
@@ -39,32 +73,210 @@ class FaceEmotionDetector:
         
         print(colorama.Fore.GREEN + "[FACE] ✅ Ready!" + colorama.Style.RESET_ALL)
     
+    @staticmethod
+    def decode_image(image_bytes: bytes) -> Optional[np.ndarray]:
+        """JPEG bytes -> ảnh BGR (None nếu không decode được)"""
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    def detect_face(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Detect + align khuôn mặt lớn nhất MỘT lần, crop dùng chung cho ArcFace và emotion
+        
+        Returns:
+            Crop BGR uint8 (không thấy mặt thì trả về cả ảnh, giống enforce_detection=False)
+        """
+        if 'detector' in self.onnx:
+            return self.onnx['detector'].detect(img)
+        
+        faces = _deepface().extract_faces(
+            img_path=img,
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            align=True
+        )
+        if not faces:
+            return None
+        
+        face = max(faces, key=lambda f: f['facial_area']['w'] * f['facial_area']['h'])['face']
+        # extract_faces trả về RGB float [0, 1]; represent/analyze nhận ảnh như cv2 đọc (BGR uint8)
+        return np.ascontiguousarray((face[:, :, ::-1] * 255).astype(np.uint8))
+    
+    def embed_face(self, face: np.ndarray) -> Optional[List[float]]:
+        """ArcFace embedding của crop đã detect (bỏ qua bước detect)"""
+        if 'arcface' in self.onnx:
+            return self.onnx['arcface'].embed(face)
+        
+        embedding_objs = _deepface().represent(
+            img_path=face,
+            model_name="ArcFace",  # ✅ Changed from Facenet to ArcFace for better accuracy
+            detector_backend='skip',
+            enforce_detection=False
+        )
+        
+        if not embedding_objs:
+            return None
+        
+        return embedding_objs[0]["embedding"]
+    
+    def emotion_scores(self, face: np.ndarray) -> Optional[Dict[str, float]]:
+        """Điểm (%) của từng cảm xúc cho crop đã detect (bỏ qua bước detect)"""
+        if 'emotion' in self.onnx:
+            return self.emotion_scores_batch(emotion_input(face)[None])[0]
+        
+        result = _deepface().analyze(
+            img_path=face,
+            actions=['emotion'],
+            detector_backend='skip',
+            enforce_detection=False,
+            silent=True
+        )
+        
+        if not result:
+            return None
+        return {emotion: float(score) for emotion, score in result[0]['emotion'].items()}
+    
+    def _load_emotion_model(self):
+        """Keras model của DeepFace Emotion (API build_model khác nhau giữa các version)"""
+        if self._emotion_model is None:
+            try:
+                client = _deepface().build_model(task="facial_attribute", model_name="Emotion")
+            except TypeError:
+                client = _deepface().build_model("Emotion")
+            self._emotion_model = getattr(client, 'model', client)
+        return self._emotion_model
+    
+    def emotion_scores_batch(self, faces: np.ndarray) -> List[Dict[str, float]]:
+        """
+        Emotion model chạy MỘT lần cho cả batch
+        
+        Args:
+            faces: (n, 48, 48) uint8 grayscale (xem emotion_input)
+        
+        Returns:
+            [{emotion: %}] theo đúng thứ tự đầu vào
+        """
+        if 'emotion' in self.onnx:
+            predictions = self.onnx['emotion'].predict(faces)
+        else:
+            x = faces.astype(np.float32)[..., None] / 255.0
+            predictions = np.asarray(self._load_emotion_model()(x, training=False))
+        return [
+            {label: float(p) * 100 for label, p in zip(EMOTION_LABELS, row)}
+            for row in predictions
+        ]
+    
+    def classify_emotion(self, face: np.ndarray) -> Optional[str]:
+        """Cảm xúc chủ đạo của crop đã detect"""
+        scores = self.emotion_scores(face)
+        if not scores:
+            return None
+        
+        emotion = max(scores, key=scores.get)
+        print(colorama.Fore.CYAN + f"[EMOTION] {emotion} ({scores[emotion]:.1f}%)" + colorama.Style.RESET_ALL)
+        return emotion
+    
+    def warmup(self, tag: str = 'FACE') -> Dict[str, Optional[float]]:
+        """
+        Chạy thử từng model trên ảnh trống để chúng được load/build trước request đầu tiên
+        
+        Returns:
+            {tên model: số giây (None nếu lỗi)}
+        """
+        blank = np.zeros((112, 112, 3), dtype=np.uint8)
+        return {
+            'detector': warmup_step(tag, f"Face detector ({self.detector_backend})", lambda: self.detect_face(blank)),
+            'arcface': warmup_step(tag, "ArcFace", lambda: self.embed_face(blank)),
+            'emotion': warmup_step(tag, "Emotion", lambda: self.emotion_scores(blank)),
+            'emotion_batch': warmup_step(tag, "Emotion (batch)", lambda: self.emotion_scores_batch(
+                np.zeros((1, EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE), dtype=np.uint8))),
+        }
+    
     def extract_face_embedding(self, image_bytes: bytes) -> Optional[List[float]]:
         """Extract face embedding from image"""
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Extract face embedding using ArcFace (most accurate model)
-            embedding_objs = DeepFace.represent(
-                img_path=img,
-                model_name="ArcFace",  # ✅ Changed from Facenet to ArcFace for better accuracy
-                enforce_detection=False
-            )
-            
-            if not embedding_objs:
+            img = self.decode_image(image_bytes)
+            face = self.detect_face(img) if img is not None else None
+            if face is None:
                 return None
-            
-            return embedding_objs[0]["embedding"]
+            return self.embed_face(face)
             
         except Exception as e:
             print(colorama.Fore.YELLOW + f"[FACE] Error extracting embedding: {e}" + colorama.Style.RESET_ALL)
             return None
     
+    def reload_index(self, rebuild: bool = False) -> int:
+        """
+        Dựng lại face index từ database (vd: sau khi chạy script migrate embedding)
+        
+        Backend có lưu file (IVF): load file rồi chỉ đồng bộ phần chênh lệch với DB,
+        trừ khi rebuild=True hoặc file chưa có / hỏng.
+        """
+        persistent = hasattr(self.face_index, 'save')
+        
+        if persistent and not rebuild and os.path.exists(self.face_index_path):
+            try:
+                self.face_index.load(self.face_index_path)
+                profiles = self.database.get_user_profiles()
+                if profiles is None:
+                    # DB lỗi: giữ index vừa load (set_profiles([]) sẽ xóa hết user), đồng bộ lần reload sau
+                    print(colorama.Fore.YELLOW + f"[FACE] Database unavailable, using face index from {self.face_index_path} without syncing: {len(self.face_index)} user(s)" + colorama.Style.RESET_ALL)
+                    return len(self.face_index)
+                missing = self.face_index.set_profiles(profiles)
+                for user_id in missing:
+                    user = self.database.get_user_by_id(user_id)
+                    if user:
+                        self.face_index.upsert(user)
+                if missing:
+                    self.face_index.save(self.face_index_path)
+                print(colorama.Fore.GREEN + f"[FACE] Face index loaded from {self.face_index_path}: {len(self.face_index)} user(s), {len(missing)} synced" + colorama.Style.RESET_ALL)
+                return len(self.face_index)
+            except Exception as e:
+                print(colorama.Fore.YELLOW + f"[FACE] Cannot load face index file ({e}), rebuilding..." + colorama.Style.RESET_ALL)
+        
+        count = self.face_index.build(self.database.get_all_users())
+        if persistent:
+            self.face_index.save(self.face_index_path)
+        print(colorama.Fore.GREEN + f"[FACE] Face index loaded: {count} user(s)" + colorama.Style.RESET_ALL)
+        return count
+    
+    def _on_user_changed(self, user: Dict):
+        """Listener của ChatDatabase: cập nhật index ngay khi user được tạo / sửa profile"""
+        if user.get('face_embedding') is not None:
+            self.face_index.upsert(user)
+            if hasattr(self.face_index, 'save'):
+                self.face_index.save(self.face_index_path)
+        else:
+            self.face_index.update_profile(user)
+    
+    def match_embedding(self, embedding) -> Optional[Dict]:
+        """
+        So khớp embedding với face index trong RAM (không truy vấn database)
+        
+        Returns:
+            User dict nếu match, None nếu không match (user mới)
+        """
+        if not len(self.face_index):
+            print(colorama.Fore.YELLOW + "[FACE] No users in database" + colorama.Style.RESET_ALL)
+            return None
+        
+        # Cosine similarity với tất cả user: một phép nhân ma trận-vector
+        matches = self.face_index.search(embedding, k=1)
+        if not matches:
+            return None
+        best_match, best_similarity = matches[0]
+        
+        # Check threshold (cosine similarity: higher is better, typical threshold: 0.4-0.6)
+        if best_similarity > self.recognition_threshold:
+            print(colorama.Fore.GREEN + f"[FACE] ✅ Recognized: {best_match['username']} (similarity: {best_similarity:.3f})" + colorama.Style.RESET_ALL)
+            return best_match
+        else:
+            print(colorama.Fore.YELLOW + f"[FACE] ❌ No match (best similarity: {best_similarity:.3f} < {self.recognition_threshold})" + colorama.Style.RESET_ALL)
+            return None
+    
     def recognize_user(self, image_bytes: bytes) -> Optional[Dict]:
         """
-        Nhận diện user từ database
+        Nhận diện user từ ảnh
         
         Returns:
             User dict nếu match, None nếu không match (user mới)
@@ -79,44 +291,7 @@ class FaceEmotionDetector:
             if current_embedding is None:
                 return None
             
-            current_embedding = np.array(current_embedding)
-            
-            # Normalize for cosine similarity
-            current_embedding = current_embedding / np.linalg.norm(current_embedding)
-            
-            # Lấy tất cả users từ database
-            users = self.database.get_all_users()
-            if not users:
-                print(colorama.Fore.YELLOW + "[FACE] No users in database" + colorama.Style.RESET_ALL)
-                return None
-            
-            # So sánh với từng user
-            best_match = None
-            best_similarity = -1  # Cosine similarity: -1 to 1 (higher is better)
-            
-            for user in users:
-                if not user.get('face_embedding'):
-                    continue
-                
-                known_embedding = np.array(user['face_embedding'])
-                
-                # Normalize for cosine similarity
-                known_embedding = known_embedding / np.linalg.norm(known_embedding)
-                
-                # Calculate cosine similarity (dot product of normalized vectors)
-                similarity = np.dot(current_embedding, known_embedding)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = user
-            
-            # Check threshold (cosine similarity: higher is better, typical threshold: 0.4-0.6)
-            if best_similarity > self.recognition_threshold:
-                print(colorama.Fore.GREEN + f"[FACE] ✅ Recognized: {best_match['username']} (similarity: {best_similarity:.3f})" + colorama.Style.RESET_ALL)
-                return best_match
-            else:
-                print(colorama.Fore.YELLOW + f"[FACE] ❌ No match (best similarity: {best_similarity:.3f} < {self.recognition_threshold})" + colorama.Style.RESET_ALL)
-                return None
+            return self.match_embedding(current_embedding)
                 
         except Exception as e:
             print(colorama.Fore.RED + f"[FACE] Recognition error: {e}" + colorama.Style.RESET_ALL)
@@ -124,10 +299,13 @@ class FaceEmotionDetector:
     
     def register_new_user(self, username: str, full_name: str, image_bytes: bytes,
                          gender: str = 'other', birth_year: int = None, 
-                         age: int = None, avatar_url: str = None) -> Optional[int]:
+                         age: int = None, avatar_url: str = None, embedding=None) -> Optional[int]:
         """
         Đăng ký user mới vào database
         
+        Args:
+            embedding: Embedding đã tính sẵn (vd: từ face worker), None = tự extract từ image_bytes
+        
         Returns:
             user_id nếu thành công, None nếu thất bại
         """
@@ -137,7 +315,8 @@ class FaceEmotionDetector:
         
         try:
             # Extract face embedding
-            embedding = self.extract_face_embedding(image_bytes)
+            if embedding is None:
+                embedding = self.extract_face_embedding(image_bytes)
             if embedding is None:
                 print(colorama.Fore.RED + "[FACE] No face detected" + colorama.Style.RESET_ALL)
                 return None
@@ -173,33 +352,52 @@ class FaceEmotionDetector:
             Emotion string (happy, sad, angry, etc.)
         """
         try:
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Analyze emotion
-            result = DeepFace.analyze(
-                img_path=img,
-                actions=['emotion'],
-                enforce_detection=False,
-                silent=True
-            )
-            
-            if result:
-                emotion = result[0]['dominant_emotion']
-                confidence = result[0]['emotion'][emotion]
-                print(colorama.Fore.CYAN + f"[EMOTION] {emotion} ({confidence:.1f}%)" + colorama.Style.RESET_ALL)
-                return emotion
-            
-            return None
+            img = self.decode_image(image_bytes)
+            face = self.detect_face(img) if img is not None else None
+            if face is None:
+                return None
+            return self.classify_emotion(face)
             
         except Exception as e:
             print(colorama.Fore.YELLOW + f"[EMOTION] Detection error: {e}" + colorama.Style.RESET_ALL)
             return None
     
-    def analyze_frame(self, image_bytes: bytes) -> Dict:
+    def analyze_face(self, image_bytes: bytes):
+        """
+        Phần inference của analyze_frame (chạy được trong worker process, không cần database):
+        decode + detect một lần, cùng crop cho ArcFace và emotion model
+        
+        Returns:
+            (embedding hoặc None, {emotion: %} hoặc None)
+        """
+        embedding = None
+        scores = None
+        start = time.time()
+        
+        try:
+            img = self.decode_image(image_bytes)
+            face = self.detect_face(img) if img is not None else None
+        except Exception as e:
+            print(colorama.Fore.YELLOW + f"[FACE] Face detection error: {e}" + colorama.Style.RESET_ALL)
+            face = None
+        
+        if face is not None:
+            try:
+                embedding = self.embed_face(face)
+            except Exception as e:
+                print(colorama.Fore.RED + f"[FACE] Recognition error: {e}" + colorama.Style.RESET_ALL)
+            
+            try:
+                scores = self.emotion_scores(face)
+            except Exception as e:
+                print(colorama.Fore.YELLOW + f"[EMOTION] Detection error: {e}" + colorama.Style.RESET_ALL)
+        
+        print(colorama.Fore.CYAN + f"[FACE] Frame analyzed in {(time.time() - start) * 1000:.0f}ms" + colorama.Style.RESET_ALL)
+        return embedding, scores
+    
+    def frame_result(self, embedding, scores: Optional[Dict[str, float]]) -> Dict:
         """
-        Phân tích đầy đủ: Face Recognition + Emotion
+        Phần còn lại của analyze_frame: so khớp face index + chọn cảm xúc + câu chào
         
         Returns:
             {
@@ -209,12 +407,22 @@ class FaceEmotionDetector:
                 'greeting': 'Hello John! You look cheerful today!'
             }
         """
+        user = None
+        emotion = None
+        
         # Recognize user
-        user = self.recognize_user(image_bytes)
-        is_new_user = (user is None)
+        if embedding is not None:
+            if self.database:
+                user = self.match_embedding(embedding)
+            else:
+                print(colorama.Fore.YELLOW + "[FACE] No database connected" + colorama.Style.RESET_ALL)
         
         # Detect emotion
-        emotion = self.detect_emotion(image_bytes)
+        if scores:
+            emotion = max(scores, key=scores.get)
+            print(colorama.Fore.CYAN + f"[EMOTION] {emotion} ({scores[emotion]:.1f}%)" + colorama.Style.RESET_ALL)
+        
+        is_new_user = (user is None)
         
         # Build greeting
         greeting = ""
@@ -231,6 +439,10 @@ class FaceEmotionDetector:
             'emotion': emotion,
             'greeting': greeting
         }
+    
+    def analyze_frame(self, image_bytes: bytes) -> Dict:
+        """Phân tích đầy đủ: Face Recognition + Emotion (xem frame_result)"""
+        return self.frame_result(*self.analyze_face(image_bytes))
 
 
 # Test
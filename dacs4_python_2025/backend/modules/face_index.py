@@ -0,0 +1,499 @@
+"""
+Face Index - Chỉ mục embedding khuôn mặt nằm sẵn trong RAM
+- FaceIndex: ma trận float32 liên tục (đã chuẩn hóa L2) + mảng user_id song song.
+  Nhận diện = một phép nhân ma trận-vector + chọn top-k, kết quả chính xác.
+- IVFFaceIndex: tìm gần đúng (ANN) cho gallery lớn. Vector chia vào `nlist` cụm (k-means),
+  lưu dạng int8; mỗi lần tìm chỉ quét `nprobe` cụm gần nhất. Lưu ra file .npz để khởi động không phải dựng lại.
+
+Chọn backend bằng FACE_INDEX_BACKEND=exact|ivf (xem create_face_index).
+"""
+
+import os
+import threading
+import colorama
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def normalize(embedding) -> Optional[np.ndarray]:
+    """Chuẩn hóa L2 về float32 (None nếu không có vector / vector rỗng / toàn 0)"""
+    if embedding is None:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if vector.size == 0 or not np.isfinite(norm) or norm == 0:
+        return None
+    return vector / norm
+
+
+class FaceIndex:
+    def __init__(self, dim: Optional[int] = None, capacity: int = 64):
+        """
+        Args:
+            dim: Số chiều embedding (ArcFace = 512). None = lấy theo vector đầu tiên
+            capacity: Số dòng cấp phát trước, tăng gấp đôi khi đầy
+        """
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._capacity = capacity
+        self._vectors = None  # (capacity, dim) float32, chỉ dùng [:_size]
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._users: List[Dict] = []  # Profile user (không kèm embedding), song song với _ids
+        self._rows: Dict[int, int] = {}  # user_id -> dòng trong ma trận
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._rows
+
+    def _ensure_capacity(self, rows: int):
+        if self._vectors is None:
+            self._capacity = max(self._capacity, rows)
+            self._vectors = np.empty((self._capacity, self.dim), dtype=np.float32)
+            self._ids = np.empty(self._capacity, dtype=np.int64)
+            return
+
+        if rows <= self._capacity:
+            return
+
+        while self._capacity < rows:
+            self._capacity *= 2
+        vectors = np.empty((self._capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.empty(self._capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def build(self, users: Iterable[Dict]) -> int:
+        """Dựng lại toàn bộ chỉ mục từ danh sách user (vd: database.get_all_users())"""
+        with self._lock:
+            self._vectors = None
+            self._users = []
+            self._rows = {}
+            self._size = 0
+            for user in users:
+                self.upsert(user)
+            return self._size
+
+    def upsert(self, user: Dict) -> bool:
+        """
+        Thêm user mới hoặc cập nhật embedding/profile của user đã có
+
+        Returns:
+            False nếu user không có embedding hợp lệ
+        """
+        vector = normalize(user.get('face_embedding'))
+        if vector is None:
+            return False
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.size
+            if vector.size != self.dim:
+                raise ValueError(f"Embedding dim {vector.size} != index dim {self.dim}")
+
+            profile = {key: value for key, value in user.items() if key != 'face_embedding'}
+            row = self._rows.get(user['id'])
+            if row is None:
+                self._ensure_capacity(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._rows[user['id']] = row
+                self._users.append(profile)
+            else:
+                self._users[row] = profile
+
+            self._vectors[row] = vector
+            self._ids[row] = user['id']
+            return True
+
+    def update_profile(self, user: Dict):
+        """Gộp các field profile mới (tên, tuổi, avatar...) vào user đã có, không đổi embedding"""
+        with self._lock:
+            row = self._rows.get(user['id'])
+            if row is not None:
+                self._users[row].update((key, value) for key, value in user.items() if key != 'face_embedding')
+
+    def remove(self, user_id: int) -> bool:
+        """Xóa user (đưa dòng cuối vào chỗ trống để ma trận luôn liên tục)"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._users[row] = self._users[last]
+                self._rows[int(self._ids[row])] = row
+            self._users.pop()
+            self._size = last
+            return True
+
+    def search(self, embedding, k: int = 1) -> List[Tuple[Dict, float]]:
+        """
+        Tìm k user gần nhất theo cosine similarity
+
+        Returns:
+            [(user profile, similarity)] sắp xếp giảm dần
+        """
+        query = normalize(embedding)
+        if query is None:
+            return []
+
+        with self._lock:
+            if self._size == 0:
+                return []
+            if query.size != self.dim:
+                raise ValueError(f"Query dim {query.size} != index dim {self.dim}")
+
+            scores = self._vectors[:self._size] @ query
+            k = min(k, self._size)
+            if k == 1:
+                top = np.array([int(np.argmax(scores))])
+            else:
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+
+            return [(dict(self._users[row]), float(scores[row])) for row in top]
+
+
+class _InvertedList:
+    """Một cụm của IVF: code int8 + scale + user_id, cấp phát tăng gấp đôi"""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.codes = np.empty((capacity, dim), dtype=np.int8)
+        self.scales = np.empty(capacity, dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def append(self, code: np.ndarray, scale: float, user_id: int) -> int:
+        if self.size == len(self.ids):
+            capacity = 2 * len(self.ids)
+            self.codes = np.resize(self.codes, (capacity, self.codes.shape[1]))
+            self.scales = np.resize(self.scales, capacity)
+            self.ids = np.resize(self.ids, capacity)
+        row = self.size
+        self.codes[row] = code
+        self.scales[row] = scale
+        self.ids[row] = user_id
+        self.size += 1
+        return row
+
+    def pop(self, row: int) -> Optional[int]:
+        """Xóa dòng `row` bằng cách đưa dòng cuối vào; trả về user_id của dòng bị dời (nếu có)"""
+        last = self.size - 1
+        moved = None
+        if row != last:
+            self.codes[row] = self.codes[last]
+            self.scales[row] = self.scales[last]
+            self.ids[row] = self.ids[last]
+            moved = int(self.ids[row])
+        self.size = last
+        return moved
+
+
+def quantize(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Lượng tử hóa int8 đối xứng theo từng vector: vector ~= code * scale"""
+    scale = float(np.abs(vector).max()) / 127.0 or 1.0
+    return np.round(vector / scale).astype(np.int8), scale
+
+
+class IVFFaceIndex:
+    """
+    Inverted File index + vector int8 (tìm gần đúng, chỉ dùng CPU/numpy)
+
+    Cùng interface với FaceIndex (build / upsert / update_profile / remove / search).
+    Recall/latency điều chỉnh bằng nprobe: càng nhiều cụm được quét thì càng gần kết quả chính xác.
+    """
+
+    FILE_VERSION = 1
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, dim: Optional[int] = None,
+                 kmeans_iterations: int = 10, seed: int = 0):
+        """
+        Args:
+            nlist: Số cụm tối đa (gallery nhỏ tự dùng ít cụm hơn, ~1 cụm / 64 user)
+            nprobe: Số cụm quét mỗi lần tìm
+            dim: Số chiều embedding. None = lấy theo vector đầu tiên
+            kmeans_iterations: Số vòng k-means khi train centroid
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.dim = dim
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self._lock = threading.RLock()
+        self._centroids = None  # (n_lists, dim) float32, đã chuẩn hóa
+        self._lists: List[_InvertedList] = []
+        self._location: Dict[int, Tuple[int, int]] = {}  # user_id -> (cụm, dòng)
+        self._users: Dict[int, Dict] = {}  # user_id -> profile (không kèm embedding)
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._location)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._location
+
+    # ---------- Train / build ----------
+
+    def _train(self, vectors: np.ndarray):
+        """Spherical k-means trên (tối đa nlist*64 vector mẫu)"""
+        n_lists = max(1, min(self.nlist, len(vectors) // 64))
+        rng = np.random.default_rng(self.seed)
+
+        sample = vectors
+        if len(vectors) > n_lists * 64:
+            sample = vectors[rng.choice(len(vectors), n_lists * 64, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # Cụm rỗng -> lấy ngẫu nhiên một điểm khác làm tâm
+                    centroids[c] = sample[rng.integers(len(sample))]
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+
+        self._centroids = centroids.astype(np.float32)
+        self._lists = [_InvertedList(self.dim) for _ in range(n_lists)]
+        self._location = {}
+        self._trained_size = len(vectors)
+
+    def _add(self, user_id: int, vector: np.ndarray):
+        cluster = int(np.argmax(self._centroids @ vector))
+        code, scale = quantize(vector)
+        row = self._lists[cluster].append(code, scale, user_id)
+        self._location[user_id] = (cluster, row)
+
+    def _all_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(user_ids, vector đã giải lượng tử) của toàn bộ index - dùng khi train lại"""
+        ids = [lst.ids[:lst.size] for lst in self._lists]
+        vectors = [lst.codes[:lst.size].astype(np.float32) * lst.scales[:lst.size, None] for lst in self._lists]
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(vectors)
+
+    def build(self, users: Iterable[Dict]) -> int:
+        """Train centroid và dựng lại toàn bộ index từ danh sách user"""
+        ids, vectors, profiles = [], [], {}
+        for user in users:
+            vector = normalize(user.get('face_embedding'))
+            if vector is None:
+                continue
+            if self.dim is None:
+                self.dim = vector.size
+            if vector.size != self.dim:
+                raise ValueError(f"Embedding dim {vector.size} != index dim {self.dim}")
+            ids.append(user['id'])
+            vectors.append(vector)
+            profiles[user['id']] = {key: value for key, value in user.items() if key != 'face_embedding'}
+
+        with self._lock:
+            self._users = profiles
+            self._centroids = None
+            self._lists = []
+            self._location = {}
+            self._trained_size = 0
+            if vectors:
+                matrix = np.stack(vectors)
+                self._train(matrix)
+                for user_id, vector in zip(ids, matrix):
+                    self._add(user_id, vector)
+            return len(self._location)
+
+    def _retrain(self):
+        """Gallery đã lớn gấp 4 lúc train -> chia lại cụm cho cân bằng"""
+        ids, vectors = self._all_vectors()
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._train(vectors)
+        for user_id, vector in zip(ids, vectors):
+            self._add(int(user_id), vector)
+
+    # ---------- Cập nhật từng user ----------
+
+    def upsert(self, user: Dict) -> bool:
+        vector = normalize(user.get('face_embedding'))
+        if vector is None:
+            return False
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = vector.size
+            if vector.size != self.dim:
+                raise ValueError(f"Embedding dim {vector.size} != index dim {self.dim}")
+
+            self._users[user['id']] = {key: value for key, value in user.items() if key != 'face_embedding'}
+            self.remove(user['id'], keep_profile=True)
+
+            if self._centroids is None:
+                self._train(vector[None, :])
+            self._add(user['id'], vector)
+
+            if len(self._location) >= 4 * self._trained_size and len(self._location) >= 128:
+                self._retrain()
+            return True
+
+    def update_profile(self, user: Dict):
+        with self._lock:
+            profile = self._users.get(user['id'])
+            if profile is not None:
+                profile.update((key, value) for key, value in user.items() if key != 'face_embedding')
+
+    def remove(self, user_id: int, keep_profile: bool = False) -> bool:
+        with self._lock:
+            location = self._location.pop(user_id, None)
+            if not keep_profile:
+                self._users.pop(user_id, None)
+            if location is None:
+                return False
+
+            cluster, row = location
+            moved = self._lists[cluster].pop(row)
+            if moved is not None:
+                self._location[moved] = (cluster, row)
+            return True
+
+    def set_profiles(self, profiles: Iterable[Dict]) -> List[int]:
+        """
+        Đồng bộ profile với database sau khi load từ file:
+        xóa user không còn trong DB, trả về id các user có trong DB nhưng chưa có trong index
+        """
+        with self._lock:
+            profiles = {profile['id']: dict(profile) for profile in profiles}
+            for user_id in [uid for uid in self._location if uid not in profiles]:
+                self.remove(user_id)
+            self._users = {uid: profile for uid, profile in profiles.items() if uid in self._location}
+            return [uid for uid in profiles if uid not in self._location]
+
+    # ---------- Tìm kiếm ----------
+
+    def search(self, embedding, k: int = 1, nprobe: Optional[int] = None) -> List[Tuple[Dict, float]]:
+        """
+        Tìm k user gần nhất (gần đúng) trong `nprobe` cụm có tâm gần query nhất
+
+        Returns:
+            [(user profile, similarity)] sắp xếp giảm dần
+        """
+        query = normalize(embedding)
+        if query is None:
+            return []
+
+        with self._lock:
+            if not self._location:
+                return []
+            if query.size != self.dim:
+                raise ValueError(f"Query dim {query.size} != index dim {self.dim}")
+
+            nprobe = min(nprobe or self.nprobe, len(self._lists))
+            centroid_scores = self._centroids @ query
+            if nprobe < len(self._lists):
+                probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            else:
+                probes = range(len(self._lists))
+
+            ids, scores = [], []
+            for cluster in probes:
+                lst = self._lists[cluster]
+                if lst.size:
+                    ids.append(lst.ids[:lst.size])
+                    scores.append((lst.codes[:lst.size] @ query) * lst.scales[:lst.size])
+            if not ids:
+                return []
+
+            ids = np.concatenate(ids)
+            scores = np.concatenate(scores)
+            k = min(k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            return [(dict(self._users.get(int(ids[i]), {'id': int(ids[i])})), float(scores[i])) for i in top]
+
+    # ---------- Lưu / load ----------
+
+    def save(self, path: str):
+        """Ghi centroid + code int8 ra file .npz (profile không lưu, luôn lấy từ database)"""
+        with self._lock:
+            if self._centroids is None:
+                return
+            sizes = np.array([lst.size for lst in self._lists], dtype=np.int64)
+            arrays = {
+                'version': np.array(self.FILE_VERSION),
+                'centroids': self._centroids,
+                'sizes': sizes,
+                'codes': np.concatenate([lst.codes[:lst.size] for lst in self._lists]),
+                'scales': np.concatenate([lst.scales[:lst.size] for lst in self._lists]),
+                'ids': np.concatenate([lst.ids[:lst.size] for lst in self._lists]),
+                'trained_size': np.array(self._trained_size),
+            }
+
+        # Ghi file tạm rồi đổi tên -> không bao giờ để lại file hỏng nếu bị kill giữa chừng
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """
+        Load index đã lưu. Profile rỗng cho tới khi gọi set_profiles()
+
+        Raises:
+            ValueError: File không đúng version / số chiều
+        """
+        with np.load(path) as data:
+            if int(data['version']) != self.FILE_VERSION:
+                raise ValueError(f"Unsupported face index file version: {int(data['version'])}")
+            centroids = data['centroids']
+            if self.dim is not None and centroids.shape[1] != self.dim:
+                raise ValueError(f"Index file dim {centroids.shape[1]} != {self.dim}")
+
+            with self._lock:
+                self.dim = centroids.shape[1]
+                self._centroids = centroids.astype(np.float32)
+                self._lists = []
+                self._location = {}
+                self._users = {}
+                self._trained_size = int(data['trained_size'])
+
+                codes, scales, ids = data['codes'], data['scales'], data['ids']
+                offset = 0
+                for cluster, size in enumerate(data['sizes']):
+                    lst = _InvertedList(self.dim, capacity=max(16, int(size)))
+                    lst.codes[:size] = codes[offset:offset + size]
+                    lst.scales[:size] = scales[offset:offset + size]
+                    lst.ids[:size] = ids[offset:offset + size]
+                    lst.size = int(size)
+                    for row, user_id in enumerate(lst.ids[:size]):
+                        self._location[int(user_id)] = (cluster, row)
+                    self._lists.append(lst)
+                    offset += size
+
+                return len(self._location)
+
+
+def create_face_index():
+    """
+    Tạo face index theo biến môi trường:
+        FACE_INDEX_BACKEND  exact (mặc định) | ivf
+        FACE_INDEX_NLIST    Số cụm IVF (mặc định 256)
+        FACE_INDEX_NPROBE   Số cụm quét mỗi lần tìm (mặc định 8, tăng = recall cao hơn, chậm hơn)
+    """
+    backend = os.getenv('FACE_INDEX_BACKEND', 'exact').lower()
+    if backend == 'ivf':
+        index = IVFFaceIndex(
+            nlist=int(os.getenv('FACE_INDEX_NLIST', '256')),
+            nprobe=int(os.getenv('FACE_INDEX_NPROBE', '8'))
+        )
+        print(colorama.Fore.CYAN + f"[FACE] Face index: IVF-int8 (nlist={index.nlist}, nprobe={index.nprobe})" + colorama.Style.RESET_ALL)
+        return index
+
+    if backend != 'exact':
+        print(colorama.Fore.YELLOW + f"[FACE] Unknown FACE_INDEX_BACKEND '{backend}', using exact search" + colorama.Style.RESET_ALL)
+    return FaceIndex()
@@ -0,0 +1,179 @@
+"""
+Face Tracker - Theo dõi khuôn mặt giữa các frame của một session
+- Detect nhẹ bằng Haar cascade (OpenCV) trên ảnh decode ở 1/2 độ phân giải
+- Ghép bounding box theo IoU: cùng track = cùng người, giữ identity + emotion đã biết
+- Chạy emotion model theo nhịp thích ứng: cảm xúc không đổi thì giãn dần, đổi thì dày lại
+- Làm mượt điểm cảm xúc (EMA), chỉ báo khi cảm xúc chủ đạo thay đổi
+"""
+
+import time
+import cv2
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+
+def iou(a: Box, b: Box) -> float:
+    """Intersection over Union của hai bounding box"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold: float = 0.3, min_interval: float = 0.5, max_interval: float = 4.0,
+                 backoff: float = 1.5, smoothing: float = 0.5, lost_after: float = 1.5):
+        """
+        Args:
+            iou_threshold: IoU tối thiểu giữa hai frame để coi là cùng một khuôn mặt
+            min_interval: Khoảng cách ngắn nhất giữa hai lần chạy model (giây)
+            max_interval: Khoảng cách dài nhất khi track ổn định (giây)
+            backoff: Hệ số giãn nhịp mỗi lần kết quả không đổi
+            smoothing: Trọng số của kết quả mới trong EMA điểm cảm xúc
+            lost_after: Không thấy mặt quá lâu thì bỏ track (giây)
+        """
+        self.iou_threshold = iou_threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.lost_after = lost_after
+
+        self._cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+        self.track_id = 0
+        self.box: Optional[Box] = None
+        self.last_seen = 0.0
+        self._reset_track()
+
+        # Thống kê
+        self.frames = 0
+        self.inferences = 0
+
+    def _reset_track(self):
+        self.identity: Optional[Dict] = None  # User đã nhận diện trên track này
+        self.emotion: Optional[str] = None  # Cảm xúc chủ đạo sau khi làm mượt
+        self._scores: Optional[Dict[str, float]] = None
+        self._interval = self.min_interval
+        self._next_inference = 0.0
+
+    # ---------- Detect + track ----------
+
+    @staticmethod
+    def decode(image_bytes: bytes) -> Optional[np.ndarray]:
+        """Decode JPEG ở 1/2 độ phân giải (nhanh hơn, đủ cho tracking + emotion)"""
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_COLOR_2)
+
+    def detect(self, img: np.ndarray) -> Optional[Box]:
+        """Khuôn mặt lớn nhất trong ảnh (Haar cascade), None nếu không có"""
+        gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+        min_side = max(24, min(gray.shape[:2]) // 8)
+        faces = self._cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(min_side, min_side))
+        if len(faces) == 0:
+            return None
+        return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+
+    def update(self, img: np.ndarray, now: Optional[float] = None) -> Optional[Box]:
+        """
+        Cập nhật track với frame mới
+
+        Returns:
+            Bounding box hiện tại, None nếu frame không có mặt
+        """
+        now = now if now is not None else time.time()
+        self.frames += 1
+
+        box = self.detect(img)
+        if box is None:
+            if self.box is not None and now - self.last_seen > self.lost_after:
+                self.box = None
+                self._reset_track()
+            return None
+
+        if self.box is None or iou(self.box, box) < self.iou_threshold:
+            # Khuôn mặt mới (người khác / vừa quay lại) -> track mới, chạy model ngay
+            self.track_id += 1
+            self._reset_track()
+
+        self.box = box
+        self.last_seen = now
+        return box
+
+    def process(self, image_bytes: bytes, now: Optional[float] = None) -> Tuple[Optional[np.ndarray], Optional[Box]]:
+        """decode + update (gọi trong executor)"""
+        img = self.decode(image_bytes)
+        if img is None:
+            return None, None
+        return img, self.update(img, now)
+
+    def crop(self, img: np.ndarray, margin: float = 0.15) -> Optional[np.ndarray]:
+        """Crop khuôn mặt của track (nới thêm margin mỗi phía)"""
+        if self.box is None:
+            return None
+        x, y, w, h = self.box
+        dx, dy = int(w * margin), int(h * margin)
+        height, width = img.shape[:2]
+        return img[max(0, y - dy):min(height, y + h + dy), max(0, x - dx):min(width, x + w + dx)]
+
+    # ---------- Nhịp chạy model ----------
+
+    def should_infer(self, now: Optional[float] = None) -> bool:
+        """Có mặt trong khung hình và đã tới lượt chạy model"""
+        now = now if now is not None else time.time()
+        return self.box is not None and now >= self._next_inference
+
+    def _schedule(self, changed: bool, now: float):
+        self._interval = self.min_interval if changed else min(self._interval * self.backoff, self.max_interval)
+        self._next_inference = now + self._interval
+
+    def set_identity(self, user: Optional[Dict], now: Optional[float] = None):
+        """Kết quả nhận diện cho track hiện tại (None = chưa khớp ai, thử lại với nhịp giãn dần)"""
+        now = now if now is not None else time.time()
+        self.inferences += 1
+        self.identity = user
+        self._schedule(changed=False, now=now)
+
+    def add_emotion(self, scores: Optional[Dict[str, float]], now: Optional[float] = None) -> Optional[str]:
+        """
+        Gộp điểm cảm xúc mới vào EMA
+
+        Args:
+            scores: {emotion: xác suất hoặc %} từ emotion model
+
+        Returns:
+            Cảm xúc chủ đạo mới nếu vừa thay đổi, None nếu không đổi
+        """
+        now = now if now is not None else time.time()
+        self.inferences += 1
+        if not scores:
+            self._schedule(changed=False, now=now)
+            return None
+
+        total = sum(scores.values()) or 1.0
+        scores = {emotion: value / total for emotion, value in scores.items()}
+        if self._scores is None:
+            self._scores = scores
+        else:
+            a = self.smoothing
+            self._scores = {emotion: a * scores.get(emotion, 0.0) + (1 - a) * self._scores.get(emotion, 0.0)
+                            for emotion in set(scores) | set(self._scores)}
+
+        dominant = max(self._scores, key=self._scores.get)
+        changed = dominant != self.emotion
+        self.emotion = dominant
+        self._schedule(changed, now)
+        return dominant if changed else None
+
+    def stats(self) -> Dict:
+        return {
+            'frames': self.frames,
+            'inferences': self.inferences,
+            'track_id': self.track_id,
+            'interval': round(self._interval, 2),
+        }
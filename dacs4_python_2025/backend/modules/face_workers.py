@@ -0,0 +1,311 @@
+"""
+Face Workers - Pool process chạy DeepFace/TensorFlow ngoài process của server
+- Mỗi worker load sẵn ArcFace + emotion model một lần (warm) rồi chờ request
+- Frame/crop đi qua một slot multiprocessing.shared_memory riêng của worker (không pickle bytes)
+- Pipe chỉ mang request/kết quả nhỏ; embedding trả về qua vùng kết quả của cùng slot
+
+Bật bằng FACE_WORKERS=<số process>. FACE_WORKERS=0 (mặc định): chạy trong thread pool của server như cũ.
+"""
+
+import asyncio
+import atexit
+import os
+import sys
+import time
+import colorama
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+INPUT_SIZE = 4 * 1024 * 1024  # JPEG webcam ~50-200 KB, crop thô 640x480x3 ~ 0.9 MB
+RESULT_SIZE = 16 * 1024  # Embedding float32 (ArcFace 512D = 2 KB)
+
+# Loại request
+ANALYZE = 'analyze'  # JPEG -> (embedding, điểm cảm xúc)
+EMBED = 'embed'      # JPEG -> embedding (đăng ký user)
+EMOTION = 'emotion'  # Crop BGR uint8 -> điểm cảm xúc
+EMOTION_BATCH = 'emotion_batch'  # (n, 48, 48) uint8 grayscale -> [điểm cảm xúc] (xem EmotionBatcher)
+
+
+# ==================== WORKER PROCESS ====================
+
+def _worker_main(slot_name: str, conn, threads: int):
+    """Vòng lặp của worker process: nhận (op, size, shape) -> trả (ok, dim, scores / lỗi)"""
+    # Chia core giữa các worker, tránh mỗi process TF dùng hết core
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['ONNX_THREADS'] = str(threads)
+
+    from modules.face_emotion import FaceEmotionDetector
+
+    colorama.init()
+    slot = shared_memory.SharedMemory(name=slot_name)
+    detector = FaceEmotionDetector(database=None)
+
+    # Warm-up: chạy thử từng model để chúng được load trước request đầu tiên
+    start = time.time()
+    timings = detector.warmup(tag=f'FACE-WORKER {os.getpid()}')
+    conn.send(('ready', os.getpid(), time.time() - start, timings))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        op, size, shape = request
+        try:
+            embedding = scores = None
+            if op == EMOTION:
+                crop = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+                scores = detector.emotion_scores(crop)
+                del crop
+            elif op == EMOTION_BATCH:
+                faces = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+                scores = detector.emotion_scores_batch(faces)
+                del faces
+            else:
+                data = slot.buf[:size]
+                if op == ANALYZE:
+                    embedding, scores = detector.analyze_face(data)
+                else:
+                    embedding = detector.extract_face_embedding(data)
+                data.release()
+
+            dim = 0
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype='<f4')
+                dim = embedding.size
+                slot.buf[INPUT_SIZE:INPUT_SIZE + embedding.nbytes] = embedding.tobytes()
+            conn.send((True, dim, scores))
+        except Exception as e:
+            conn.send((False, 0, str(e)))
+
+    slot.close()
+
+
+@contextmanager
+def _main_not_reimported():
+    """
+    Spawn mặc định import lại script chính trong process con. server_rag.py khởi tạo toàn bộ
+    model ở top-level nên worker sẽ load lại VAD/STT/TTS... -> tạm ẩn __main__.__file__ khi start.
+    """
+    main = sys.modules.get('__main__')
+    main_file = getattr(main, '__file__', None)
+    if main_file is not None and getattr(main, '__spec__', None) is None:
+        del main.__file__
+        try:
+            yield
+        finally:
+            main.__file__ = main_file
+    else:
+        yield
+
+
+class _Worker:
+    def __init__(self, index: int, threads: int):
+        self.index = index
+        self.threads = threads
+        self.slot = shared_memory.SharedMemory(create=True, size=INPUT_SIZE + RESULT_SIZE)
+        self.process = None
+        self.conn = None
+        self.timings = {}  # Thời gian warm-up từng model (báo về từ worker)
+
+    def start(self):
+        """Spawn process và chờ model load xong (blocking)"""
+        ctx = mp.get_context('spawn')
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.slot.name, child_conn, self.threads),
+            name=f'face-worker-{self.index}',
+            daemon=True
+        )
+        with _main_not_reimported():
+            self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+        _, pid, load_time, self.timings = self.conn.recv()
+        print(colorama.Fore.GREEN + f"[FACE-WORKER] #{self.index} ready (pid {pid}, models loaded in {load_time:.1f}s)" + colorama.Style.RESET_ALL)
+
+    def request(self, op: str, size: int, shape=None):
+        """
+        Gửi request và chờ kết quả (chạy trong thread, không chạy trên event loop)
+
+        Returns:
+            (embedding hoặc None, scores hoặc None)
+        """
+        try:
+            self.conn.send((op, size, shape))
+            ok, dim, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            print(colorama.Fore.RED + f"[FACE-WORKER] #{self.index} died ({e}), restarting..." + colorama.Style.RESET_ALL)
+            self.stop()
+            self.start()
+            return None, None
+
+        if not ok:
+            print(colorama.Fore.YELLOW + f"[FACE-WORKER] #{self.index} error: {payload}" + colorama.Style.RESET_ALL)
+            return None, None
+
+        embedding = None
+        if dim:
+            embedding = np.frombuffer(self.slot.buf, dtype='<f4', count=dim, offset=INPUT_SIZE).copy()
+        return embedding, payload
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+
+# ==================== POOL ====================
+
+class FaceWorkerPool:
+    """
+    Cùng interface async với LocalFaceInference:
+
+        embedding, scores = await pool.analyze(jpeg_bytes)
+        scores = await pool.emotion_scores(crop)
+        embedding = await pool.embed(jpeg_bytes)
+    """
+
+    def __init__(self, workers: int):
+        self.size = workers
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self._workers = [_Worker(i, threads) for i in range(workers)]
+        self._idle = asyncio.Queue()
+        # Mỗi request đang chạy giữ một thread chờ Pipe
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='face-ipc')
+
+        print(colorama.Fore.CYAN + f"[FACE-WORKER] Starting {workers} worker process(es), {threads} thread(s) each..." + colorama.Style.RESET_ALL)
+        for worker in self._workers:
+            worker.start()
+            self._idle.put_nowait(worker)
+        atexit.register(self.close)
+
+    async def _call(self, op: str, write, size: int, shape=None):
+        worker = await self._idle.get()
+        try:
+            write(worker.slot.buf)
+        except BaseException:
+            self._idle.put_nowait(worker)
+            raise
+
+        # Worker chỉ về lại pool khi đã trả kết quả, kể cả khi task gọi bị hủy giữa chừng
+        # (nếu trả sớm, request sau sẽ nhận nhầm reply của request trước)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, worker.request, op, size, shape)
+        future.add_done_callback(lambda _: self._idle.put_nowait(worker))
+        return await asyncio.shield(future)
+
+    async def analyze(self, image_bytes) -> Tuple[Optional[np.ndarray], Optional[Dict[str, float]]]:
+        size = len(image_bytes)
+        if size > INPUT_SIZE:
+            print(colorama.Fore.YELLOW + f"[FACE-WORKER] Frame too large ({size} bytes)" + colorama.Style.RESET_ALL)
+            return None, None
+
+        def write(buf):
+            buf[:size] = image_bytes
+        return await self._call(ANALYZE, write, size)
+
+    async def embed(self, image_bytes) -> Optional[np.ndarray]:
+        size = len(image_bytes)
+        if size > INPUT_SIZE:
+            return None
+
+        def write(buf):
+            buf[:size] = image_bytes
+        embedding, _ = await self._call(EMBED, write, size)
+        return embedding
+
+    async def emotion_scores(self, crop: np.ndarray) -> Optional[Dict[str, float]]:
+        crop = np.ascontiguousarray(crop, dtype=np.uint8)
+        if crop.nbytes > INPUT_SIZE:
+            return None
+
+        def write(buf):
+            np.ndarray(crop.shape, dtype=np.uint8, buffer=buf)[:] = crop
+        _, scores = await self._call(EMOTION, write, crop.nbytes, crop.shape)
+        return scores
+
+    async def emotion_scores_batch(self, faces: np.ndarray) -> List[Dict[str, float]]:
+        faces = np.ascontiguousarray(faces, dtype=np.uint8)
+
+        def write(buf):
+            np.ndarray(faces.shape, dtype=np.uint8, buffer=buf)[:] = faces
+        _, scores = await self._call(EMOTION_BATCH, write, faces.nbytes, faces.shape)
+        if scores is None:
+            raise RuntimeError("Emotion batch failed in face worker")
+        return scores
+
+    def warmup(self) -> Dict[str, Optional[float]]:
+        """Worker đã tự warm-up lúc start; trả về thời gian của worker chậm nhất cho từng model"""
+        timings = {}
+        for worker in self._workers:
+            for name, elapsed in worker.timings.items():
+                if elapsed is not None:
+                    timings[name] = max(timings.get(name) or 0.0, elapsed)
+        return timings
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+            worker.slot.close()
+            try:
+                worker.slot.unlink()
+            except FileNotFoundError:
+                pass
+        self._workers = []
+        self._executor.shutdown(wait=False)
+
+
+class LocalFaceInference:
+    """Chạy inference trong thread pool của server (FACE_WORKERS=0)"""
+
+    def __init__(self, detector):
+        self.detector = detector
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def analyze(self, image_bytes):
+        return await self._run(self.detector.analyze_face, image_bytes)
+
+    async def embed(self, image_bytes):
+        return await self._run(self.detector.extract_face_embedding, image_bytes)
+
+    async def emotion_scores(self, crop):
+        return await self._run(self.detector.emotion_scores, crop)
+
+    async def emotion_scores_batch(self, faces):
+        return await self._run(self.detector.emotion_scores_batch, faces)
+
+    def warmup(self) -> Dict[str, Optional[float]]:
+        return self.detector.warmup()
+
+    def close(self):
+        pass
+
+
+def create_face_inference(detector):
+    """FACE_WORKERS > 0: pool process; 0 (mặc định): thread pool trong process server"""
+    workers = int(os.getenv('FACE_WORKERS', '0'))
+    if workers > 0:
+        return FaceWorkerPool(workers)
+    return LocalFaceInference(detector)
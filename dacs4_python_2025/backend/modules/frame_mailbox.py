@@ -0,0 +1,54 @@
+"""
+Frame Mailbox - Hộp thư một ô cho video frame của một session
+Frame mới ghi đè frame cũ chưa xử lý (latest frame wins): bên nhận WebSocket không bao giờ phải chờ,
+bên xử lý luôn lấy được frame mới nhất. Frame bị ghi đè được đếm, không bao giờ bị decode.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+
+class FrameMailbox:
+    def __init__(self):
+        self._frame = None
+        self._ready = asyncio.Event()
+        self._closed = False
+
+        # Thống kê
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0  # Bị frame mới hơn ghi đè trước khi được lấy
+
+    def put(self, frame):
+        """Đặt frame mới (không block). Frame cũ chưa lấy bị bỏ"""
+        if self._closed:
+            return
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.received += 1
+        self._ready.set()
+
+    async def get(self) -> Optional[object]:
+        """Chờ và lấy frame mới nhất. None = mailbox đã đóng"""
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        frame, self._frame = self._frame, None
+        self.delivered += 1
+        return frame
+
+    def close(self):
+        """Báo bên xử lý dừng (frame đang chờ vẫn được lấy trước)"""
+        self._closed = True
+        self._ready.set()
+
+    def stats(self) -> Dict:
+        return {
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
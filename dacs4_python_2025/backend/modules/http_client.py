@@ -0,0 +1,137 @@
+"""
+HTTP Client - requests.Session dùng chung cho mọi API bên ngoài (Deepgram, Cloudflare Worker...)
+- Giữ kết nối keep-alive trong pool: mỗi lượt STT / LLM không phải mở lại TCP + TLS
+- Giới hạn số kết nối mỗi host (HTTP_POOL_MAXSIZE), số host giữ pool (HTTP_POOL_HOSTS)
+- warmup(): mở sẵn kết nối tới các API lúc khởi động server
+- Request gặp kết nối keep-alive đã bị server đóng được gửi lại một lần (HTTP_RETRIES), kể cả POST
+  -> chỉ dùng session này cho API không giữ trạng thái
+- stats(): số request / số kết nối đã mở -> tỉ lệ dùng lại kết nối
+
+    from modules import http_client
+    response = http_client.session().post(url, json=payload, timeout=10)
+"""
+
+import os
+import threading
+import colorama
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+# Bộ đếm của các pool đã bị pool manager bỏ (vượt HTTP_POOL_HOSTS), để stats() không bị tụt
+_retired = {'requests': 0, 'connections': 0}
+
+
+class _StaleConnectionRetry(Retry):
+    """
+    Retry lỗi kết nối + đúng một loại lỗi đọc: kết nối keep-alive đã bị server đóng khi đang rảnh.
+    Trường hợp này urllib3 báo là ProtocolError (RemoteDisconnected / connection reset) và tính là
+    lỗi đọc, nên cần read > 0. Read timeout thì không retry: server đã nhận request và đang xử lý chậm,
+    gửi lại chỉ làm chờ gấp đôi.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            return Retry.increment(self.new(read=False), method, url, response, error, _pool, _stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _create_session() -> requests.Session:
+    pool_hosts = int(os.getenv('HTTP_POOL_HOSTS', '10'))
+    pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+    # POST cũng được retry: mọi API dùng session này (Deepgram STT, Cloudflare Worker) không giữ trạng thái,
+    # gửi lại một request STT / LLM chỉ tốn thêm một lần gọi, không ghi trùng dữ liệu
+    attempts = int(os.getenv('HTTP_RETRIES', '1'))
+    retries = _StaleConnectionRetry(total=attempts, connect=None, read=attempts, status=0, redirect=3,
+                                    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'})
+
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize, max_retries=retries)
+    adapter.poolmanager.pools.dispose_func = _retire_pool
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _retire_pool(pool):
+    _retired['requests'] += pool.num_requests
+    _retired['connections'] += pool.num_connections
+    pool.close()
+
+
+def session() -> requests.Session:
+    """Session dùng chung (tạo khi gọi lần đầu)"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def _pools():
+    """{host: connection pool} đang được giữ"""
+    pools = {}
+    if _session is None:
+        return pools
+    for adapter in set(_session.adapters.values()):
+        manager = adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is not None:
+                pools[f"{key.key_scheme}://{key.key_host}"] = pool
+    return pools
+
+
+def stats() -> Dict:
+    """
+    Returns:
+        {'requests', 'connections', 'reuse_rate', 'hosts': {host: {...}}}
+        reuse_rate = phần request chạy trên kết nối đã mở sẵn (1 - kết nối mới / request)
+    """
+    hosts = {}
+    total_requests = _retired['requests']
+    total_connections = _retired['connections']
+    for host, pool in _pools().items():
+        hosts[host] = {
+            'requests': pool.num_requests,
+            'connections': pool.num_connections,
+            # Queue của urllib3 được lấp bằng None cho đủ maxsize -> chỉ đếm kết nối thật
+            'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+        }
+        total_requests += pool.num_requests
+        total_connections += pool.num_connections
+
+    reuse_rate = max(0.0, 1 - total_connections / total_requests) if total_requests else 0.0
+    return {
+        'requests': total_requests,
+        'connections': total_connections,
+        'reuse_rate': round(reuse_rate, 3),
+        'hosts': hosts,
+    }
+
+
+def warmup(urls: Iterable[str], timeout: float = 3.0) -> int:
+    """
+    Mở sẵn một kết nối (TCP + TLS) tới origin của mỗi URL bằng request HEAD;
+    status trả về không quan trọng, kết nối ở lại trong pool cho request thật đầu tiên
+
+    Returns:
+        Số origin kết nối được
+    """
+    origins = {f"{urlsplit(url).scheme}://{urlsplit(url).netloc}/" for url in urls if url}
+    connected = 0
+    for origin in origins:
+        try:
+            session().head(origin, timeout=timeout, allow_redirects=False)
+            connected += 1
+        except requests.exceptions.RequestException as e:
+            print(colorama.Fore.YELLOW + f"[HTTP] Warm-up {origin} failed: {e}" + colorama.Style.RESET_ALL)
+    return connected
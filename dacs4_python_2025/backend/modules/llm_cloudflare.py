@@ -6,9 +6,12 @@ Sử dụng model Phi-3-Mini đã fine-tune với LoRA adapter
 import colorama
 import time
 import os
-from typing import Optional
+import json
+from typing import Optional, Iterator
 import requests
 
+from modules import http_client
+
 class LLMCloudflareHandler:
     def __init__(self):
         """
@@ -80,48 +83,12 @@ You: "Ugh, work stress is the worst! Take a deep breath - you got this, seriousl
             start_time = time.time()
             print(f"[LLM] Calling Cloudflare Workers AI...", end='\r')
             
-            # Tạo system message
-            system_message = self.base_system_prompt
-            
-            # Thêm emotion context với phong cách vui vẻ
-            if user_emotion or user_name:
-                system_message += "\n\nCURRENT VIBE CHECK:\n"
-                if user_name:
-                    system_message += f"- Chatting with: {user_name} (use their name casually!)\n"
-                if user_emotion:
-                    emotion_hints = {
-                        'happy': "They're in a good mood - match that energy!",
-                        'sad': "They seem down - be supportive but keep it light",
-                        'angry': "They're frustrated - acknowledge it but help them chill",
-                        'stressed': "They're stressed - be encouraging and uplifting",
-                        'neutral': "Normal vibes - just be your fun self",
-                        'fear': "They're worried - reassure them with some humor",
-                        'surprise': "They're surprised - play along with the energy!"
-                    }
-                    hint = emotion_hints.get(user_emotion, "Just be yourself!")
-                    system_message += f"- User emotion: {user_emotion} ({hint})\n"
-            
-            # Tạo messages (OpenAI format)
-            messages = [
-                {"role": "system", "content": system_message}
-            ]
-            
-            # Thêm lịch sử (giữ 2 tin nhắn gần nhất thay vì 4)
-            if len(self.history) > 2:
-                self.history = self.history[-2:]
-            
-            messages.extend(self.history)
-            messages.append({"role": "user", "content": user_input})
+            messages = self._build_messages(user_input, user_emotion, user_name)
             
             # Gọi Cloudflare Worker
-            payload = {
-                "messages": messages,
-                "max_tokens": 40,  # Giảm từ 50 xuống 40 để nhanh hơn nữa
-                "temperature": 0.7,
-                "top_p": 0.9
-            }
+            payload = self._build_payload(messages)
             
-            response = requests.post(
+            response = http_client.session().post(
                 self.worker_url,
                 json=payload,
                 timeout=10  # Giảm timeout từ 15s xuống 10s
@@ -129,17 +96,7 @@ You: "Ugh, work stress is the worst! Take a deep breath - you got this, seriousl
             
             # Xử lý response
             if response.status_code == 200:
-                result = response.json()
-                
-                # Parse response từ Cloudflare Workers AI
-                if 'response' in result:
-                    ai_reply = result['response'].strip()
-                elif 'result' in result and 'response' in result['result']:
-                    ai_reply = result['result']['response'].strip()
-                elif 'choices' in result:
-                    ai_reply = result['choices'][0]['message']['content'].strip()
-                else:
-                    ai_reply = str(result).strip()
+                ai_reply = self._parse_reply(response.json())
                 
                 # Không cắt ngắn nữa vì đã giới hạn max_tokens
                 
@@ -174,6 +131,147 @@ You: "Ugh, work stress is the worst! Take a deep breath - you got this, seriousl
             traceback.print_exc()
             return "Sorry, I'm having trouble processing that. Please try again."
     
+    def chat_stream(self, user_input: str, style: Optional[str] = None, user_emotion: Optional[str] = None, user_name: Optional[str] = None) -> Iterator[str]:
+        """
+        Giống chat() nhưng trả về từng đoạn text ngay khi Worker sinh ra (SSE stream)
+        
+        Nếu Worker chưa hỗ trợ stream (trả JSON), yield toàn bộ câu trả lời một lần.
+        Lịch sử hội thoại được cập nhật sau khi stream kết thúc.
+        """
+        start_time = time.time()
+        first_token_time = None
+        parts = []
+        
+        try:
+            messages = self._build_messages(user_input, user_emotion, user_name)
+            payload = self._build_payload(messages)
+            payload["stream"] = True
+            
+            response = http_client.session().post(
+                self.worker_url,
+                json=payload,
+                timeout=10,
+                stream=True
+            )
+            
+            with response:
+                if response.status_code == 503:
+                    print(colorama.Fore.YELLOW + "[LLM] Worker đang khởi động..." + colorama.Style.RESET_ALL)
+                    yield "I'm waking up, please try again in a moment."
+                    return
+                
+                if response.status_code != 200:
+                    print(colorama.Fore.RED + f"[LLM] API Error {response.status_code}: {response.text[:200]}" + colorama.Style.RESET_ALL)
+                    yield "Sorry, I'm having trouble connecting. Please try again."
+                    return
+                
+                if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                    # Worker cũ: trả JSON một lần
+                    ai_reply = self._parse_reply(response.json())
+                    parts.append(ai_reply)
+                    first_token_time = time.time()
+                    yield ai_reply
+                else:
+                    # Server-Sent Events: "data: {...}" ... "data: [DONE]"
+                    # SSE luôn là UTF-8; header không có charset thì requests mặc định ISO-8859-1 cho text/*
+                    # -> token tiếng Việt bị lỗi font
+                    response.encoding = 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith('data:'):
+                            continue
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        
+                        token = json.loads(data).get('response', '')
+                        if token:
+                            if first_token_time is None:
+                                first_token_time = time.time()
+                            parts.append(token)
+                            yield token
+            
+            ai_reply = ''.join(parts).strip()
+            duration = time.time() - start_time
+            ttft = (first_token_time - start_time) if first_token_time else duration
+            print(colorama.Fore.GREEN + f"[LLM] ⏱️  {duration:.2f}s (first token {ttft:.2f}s) | {len(ai_reply)} chars" + colorama.Style.RESET_ALL)
+            
+            # Cập nhật lịch sử
+            self.history.append({"role": "user", "content": user_input})
+            self.history.append({"role": "assistant", "content": ai_reply})
+        
+        except requests.exceptions.Timeout:
+            print(colorama.Fore.RED + "[LLM] Request timeout" + colorama.Style.RESET_ALL)
+            if not parts:
+                yield "Sorry, the response took too long. Please try again."
+        
+        except requests.exceptions.RequestException as e:
+            print(colorama.Fore.RED + f"\n[LLM ERROR] Request error: {e}" + colorama.Style.RESET_ALL)
+            if not parts:
+                yield "Sorry, I'm having trouble connecting. Please try again."
+        
+        except Exception as e:
+            print(colorama.Fore.RED + f"\n[LLM ERROR] {type(e).__name__}: {e}" + colorama.Style.RESET_ALL)
+            import traceback
+            traceback.print_exc()
+            if not parts:
+                yield "Sorry, I'm having trouble processing that. Please try again."
+    
+    def _build_messages(self, user_input: str, user_emotion: Optional[str] = None, user_name: Optional[str] = None) -> list:
+        """Tạo danh sách messages (system prompt + emotion context + lịch sử + câu hỏi)"""
+        # Tạo system message
+        system_message = self.base_system_prompt
+        
+        # Thêm emotion context với phong cách vui vẻ
+        if user_emotion or user_name:
+            system_message += "\n\nCURRENT VIBE CHECK:\n"
+            if user_name:
+                system_message += f"- Chatting with: {user_name} (use their name casually!)\n"
+            if user_emotion:
+                emotion_hints = {
+                    'happy': "They're in a good mood - match that energy!",
+                    'sad': "They seem down - be supportive but keep it light",
+                    'angry': "They're frustrated - acknowledge it but help them chill",
+                    'stressed': "They're stressed - be encouraging and uplifting",
+                    'neutral': "Normal vibes - just be your fun self",
+                    'fear': "They're worried - reassure them with some humor",
+                    'surprise': "They're surprised - play along with the energy!"
+                }
+                hint = emotion_hints.get(user_emotion, "Just be yourself!")
+                system_message += f"- User emotion: {user_emotion} ({hint})\n"
+        
+        # Tạo messages (OpenAI format)
+        messages = [
+            {"role": "system", "content": system_message}
+        ]
+        
+        # Thêm lịch sử (giữ 2 tin nhắn gần nhất thay vì 4)
+        if len(self.history) > 2:
+            self.history = self.history[-2:]
+        
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": user_input})
+        return messages
+    
+    def _build_payload(self, messages: list) -> dict:
+        """Payload gửi Cloudflare Worker"""
+        return {
+            "messages": messages,
+            "max_tokens": 40,  # Giảm từ 50 xuống 40 để nhanh hơn nữa
+            "temperature": 0.7,
+            "top_p": 0.9
+        }
+    
+    def _parse_reply(self, result: dict) -> str:
+        """Parse response JSON từ Cloudflare Workers AI"""
+        if 'response' in result:
+            return result['response'].strip()
+        elif 'result' in result and 'response' in result['result']:
+            return result['result']['response'].strip()
+        elif 'choices' in result:
+            return result['choices'][0]['message']['content'].strip()
+        else:
+            return str(result).strip()
+    
     def reset_history(self):
         """Reset lịch sử hội thoại"""
         self.history = []
@@ -215,7 +313,7 @@ Title (3-5 words, no quotes):"""
                 "temperature": 0.7
             }
             
-            response = requests.post(self.worker_url, json=payload, timeout=8)
+            response = http_client.session().post(self.worker_url, json=payload, timeout=8)
             
             if response.status_code == 200:
                 result = response.json()
@@ -0,0 +1,72 @@
+"""
+Loop Lag Monitor - Đo độ trễ của event loop
+Một task ngủ đều đặn `interval` giây; thời gian thức dậy trễ hơn dự kiến chính là thời gian
+event loop bị chặn (truy vấn DB đồng bộ, inference chạy nhầm trên loop...).
+"""
+
+import asyncio
+import time
+import colorama
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, warn_threshold: float = 0.05, report_interval: float = 60.0):
+        """
+        Args:
+            interval: Chu kỳ đo (giây)
+            warn_threshold: Lag vượt mức này (giây) thì log cảnh báo
+            report_interval: Chu kỳ in thống kê (giây), 0 = không in
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.report_interval = report_interval
+        self._task = None
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.slow_ticks = 0
+
+    def stats(self) -> dict:
+        """Thống kê từ lần reset gần nhất (ms)"""
+        return {
+            'samples': self.samples,
+            'avg_lag_ms': round(self.total_lag / self.samples * 1000, 2) if self.samples else 0.0,
+            'max_lag_ms': round(self.max_lag * 1000, 2),
+            'slow_ticks': self.slow_ticks,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        last_report = time.monotonic()
+
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+
+            if lag > self.warn_threshold:
+                self.slow_ticks += 1
+                print(colorama.Fore.YELLOW + f"[LOOP] ⚠️ Event loop blocked {lag * 1000:.0f}ms" + colorama.Style.RESET_ALL)
+
+            if self.report_interval and now - last_report >= self.report_interval:
+                stats = self.stats()
+                print(colorama.Fore.CYAN + f"[LOOP] lag avg {stats['avg_lag_ms']}ms | max {stats['max_lag_ms']}ms | blocked ticks {stats['slow_ticks']}/{stats['samples']}" + colorama.Style.RESET_ALL)
+                self._reset()
+                last_report = now
@@ -0,0 +1,294 @@
+"""
+ONNX Backends - Chạy ArcFace, emotion model và Silero VAD bằng ONNX Runtime (CPU)
+- Model được convert + quantize int8 (dynamic) một lần bằng convert_to_onnx.py
+- Không cần TensorFlow / DeepFace trong process server: detect khuôn mặt bằng Haar cascade của OpenCV
+  (giống detector 'opencv' mặc định của DeepFace), tiền xử lý giống DeepFace.represent
+
+Bật bằng USE_ONNX=1. File model tìm trong ONNX_MODEL_DIR (mặc định data/onnx):
+    arcface.int8.onnx / arcface.onnx
+    emotion.int8.onnx / emotion.onnx
+    silero_vad.int8.onnx / silero_vad.onnx
+Thiếu file nào thì module tương ứng chạy backend cũ (DeepFace / torch.hub).
+"""
+
+import os
+import colorama
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+MODEL_NAMES = ('arcface', 'emotion', 'silero_vad')
+
+
+def onnx_enabled() -> bool:
+    return os.getenv('USE_ONNX', '0') != '0'
+
+
+def model_dir() -> str:
+    return os.getenv('ONNX_MODEL_DIR', os.path.join('data', 'onnx'))
+
+
+def model_paths(name: str, directory: Optional[str] = None) -> Tuple[str, str]:
+    """(bản fp32, bản int8) của một model"""
+    directory = directory or model_dir()
+    return os.path.join(directory, f'{name}.onnx'), os.path.join(directory, f'{name}.int8.onnx')
+
+
+def onnx_model_path(name: str) -> Optional[str]:
+    """
+    File ONNX sẽ dùng cho model `name`, None nếu USE_ONNX tắt hoặc chưa convert
+    Ưu tiên bản int8 trừ khi ONNX_QUANTIZED=0
+    """
+    if not onnx_enabled():
+        return None
+
+    fp32, int8 = model_paths(name)
+    candidates = [int8, fp32] if os.getenv('ONNX_QUANTIZED', '1') != '0' else [fp32]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+
+    print(colorama.Fore.YELLOW + f"[ONNX] {name}: no model in {model_dir()} (run convert_to_onnx.py), using default backend" + colorama.Style.RESET_ALL)
+    return None
+
+
+def create_session(path: str, threads: Optional[int] = None):
+    """InferenceSession CPU; threads mặc định lấy từ ONNX_THREADS (0 = để ONNX Runtime tự chọn)"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = threads if threads is not None else int(os.getenv('ONNX_THREADS', '0'))
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def _input_size(session, default: int) -> Tuple[int, int]:
+    """(h, w) từ shape NHWC của input, dùng default nếu là chiều động"""
+    shape = session.get_inputs()[0].shape
+    h, w = shape[1], shape[2]
+    return (h if isinstance(h, int) else default), (w if isinstance(w, int) else default)
+
+
+# ==================== FACE ====================
+
+def resize_with_padding(img: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Giống preprocessing.resize_image của DeepFace: giữ tỉ lệ, pad 0 cho đủ (h, w), scale về [0, 1]
+    """
+    target_h, target_w = size
+    h, w = img.shape[:2]
+    factor = min(target_h / h, target_w / w)
+    resized = cv2.resize(img, (max(1, int(w * factor)), max(1, int(h * factor))))
+
+    dh = target_h - resized.shape[0]
+    dw = target_w - resized.shape[1]
+    resized = np.pad(resized, ((dh // 2, dh - dh // 2), (dw // 2, dw - dw // 2), (0, 0)), 'constant')
+    if resized.shape[:2] != (target_h, target_w):
+        resized = cv2.resize(resized, (target_w, target_h))
+
+    resized = resized.astype(np.float32)
+    if resized.max() > 1:
+        resized /= 255.0
+    return resized
+
+
+class OpenCVFaceDetector:
+    """Haar cascade + căn thẳng theo hai mắt (như detector 'opencv' của DeepFace, không cần TensorFlow)"""
+
+    def __init__(self):
+        self._faces = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self._eyes = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+
+    def _align(self, face: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        eyes = self._eyes.detectMultiScale(gray[:gray.shape[0] // 2], 1.1, 10)
+        if len(eyes) < 2:
+            return face
+
+        # Hai mắt lớn nhất, trái -> phải
+        eyes = sorted(sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2], key=lambda e: e[0])
+        (lx, ly, lw, lh), (rx, ry, rw, rh) = eyes
+        left = (lx + lw / 2, ly + lh / 2)
+        right = (rx + rw / 2, ry + rh / 2)
+        angle = float(np.degrees(np.arctan2(right[1] - left[1], right[0] - left[0])))
+
+        h, w = face.shape[:2]
+        rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        return cv2.warpAffine(face, rotation, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+    def detect(self, img: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Crop BGR uint8 của khuôn mặt lớn nhất đã căn thẳng
+        (không thấy mặt thì trả về cả ảnh, giống enforce_detection=False)
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = self._faces.detectMultiScale(gray, 1.1, 10)
+        if len(faces) == 0:
+            return img
+
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        return np.ascontiguousarray(self._align(img[y:y + h, x:x + w]))
+
+
+class OnnxArcFace:
+    """ArcFace (convert từ model Keras của DeepFace), đầu vào NHWC RGB [0, 1]"""
+
+    def __init__(self, path: str):
+        self.session = create_session(path)
+        self._input = self.session.get_inputs()[0].name
+        self.size = _input_size(self.session, 112)
+
+    def preprocess(self, face: np.ndarray) -> np.ndarray:
+        """Crop BGR uint8 -> (1, h, w, 3) float32 (giống DeepFace.represent với detector 'skip')"""
+        return resize_with_padding(face[:, :, ::-1], self.size)[None]
+
+    def embed(self, face: np.ndarray) -> List[float]:
+        return self.session.run(None, {self._input: self.preprocess(face)})[0][0].tolist()
+
+
+class OnnxEmotion:
+    """Emotion model (FER-2013) của DeepFace, đầu vào (n, 48, 48, 1) grayscale [0, 1]"""
+
+    def __init__(self, path: str):
+        self.session = create_session(path)
+        self._input = self.session.get_inputs()[0].name
+
+    def predict(self, faces: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            faces: (n, 48, 48) uint8 grayscale (xem face_emotion.emotion_input)
+
+        Returns:
+            (n, 7) xác suất theo EMOTION_LABELS
+        """
+        x = faces.astype(np.float32)[..., None] / 255.0
+        return self.session.run(None, {self._input: x})[0]
+
+
+def create_face_backends() -> Dict[str, object]:
+    """
+    {'detector', 'arcface', 'emotion'} chạy bằng ONNX Runtime; key nào thiếu thì FaceEmotionDetector
+    dùng DeepFace cho phần đó. Rỗng khi USE_ONNX tắt.
+    """
+    if not onnx_enabled():
+        return {}
+
+    backends = {}
+    for name, cls in (('arcface', OnnxArcFace), ('emotion', OnnxEmotion)):
+        path = onnx_model_path(name)
+        if path:
+            try:
+                backends[name] = cls(path)
+                print(colorama.Fore.GREEN + f"[ONNX] {name} loaded from {path}" + colorama.Style.RESET_ALL)
+            except Exception as e:
+                print(colorama.Fore.YELLOW + f"[ONNX] {name}: cannot load {path} ({e}), using DeepFace" + colorama.Style.RESET_ALL)
+
+    # Chỉ bỏ được DeepFace (và TensorFlow) khi cả hai model đều chạy ONNX
+    if 'arcface' in backends and 'emotion' in backends:
+        backends['detector'] = OpenCVFaceDetector()
+    return backends
+
+
+# ==================== VAD ====================
+
+class OnnxSileroVAD:
+    """
+    Silero VAD chạy thẳng bằng ONNX Runtime, cùng interface với model của torch.hub:
+
+        prob = model(chunk, 16000).item()
+        model.reset_states()
+
+    Vòng lặp VAD (mỗi 32ms / stream) dùng process(pcm_bytes, 16000) -> float:
+    input, state, output đều là buffer cấp sẵn gắn vào IOBinding, PCM int16 được đổi sang float
+    thẳng vào buffer input, không tạo array / tensor mới cho mỗi chunk.
+
+    Session dùng chung được giữa nhiều instance (fork), trạng thái LSTM là của từng instance.
+    """
+
+    def __init__(self, path: Optional[str] = None, session=None):
+        self.session = session if session is not None else create_session(path, threads=1)
+        names = {i.name for i in self.session.get_inputs()}
+        self._v5 = 'state' in names  # v5: state (2, 1, 128) + 64 mẫu context; v4: h, c (2, 1, 64)
+        self._state_names = ['state'] if self._v5 else ['h', 'c']
+        self._output_names = [o.name for o in self.session.get_outputs()]  # prob, state mới
+        self._shape = None  # (số mẫu / chunk, sample rate) của các buffer hiện tại
+        self.reset_states()
+
+    def fork(self) -> 'OnnxSileroVAD':
+        """Instance mới (trạng thái riêng) dùng chung session - cho mỗi audio session"""
+        return OnnxSileroVAD(session=self.session)
+
+    def reset_states(self):
+        self._turn = 0
+        if self._shape is not None:
+            # Xóa tại chỗ, giữ nguyên buffer đã gắn vào IOBinding
+            for states in self._states:
+                for state in states:
+                    state.fill(0)
+            self._input.fill(0)
+            return
+        # Hai bộ state: chunk chẵn đọc bộ 0 ghi bộ 1, chunk lẻ ngược lại (không đọc/ghi cùng buffer)
+        shape = (2, 1, 128) if self._v5 else (2, 1, 64)
+        self._states = [[np.zeros(shape, dtype=np.float32) for _ in self._state_names] for _ in range(2)]
+
+    def _prepare(self, samples: int, sr: int):
+        """Cấp buffer + IOBinding cho kích thước chunk mới (chỉ chạy ở chunk đầu tiên)"""
+        import onnxruntime as ort
+
+        self._context_size = (64 if sr == 16000 else 32) if self._v5 else 0
+        self._input = np.zeros((1, self._context_size + samples), dtype=np.float32)
+        self._chunk = self._input[0, self._context_size:]  # View: audio của chunk hiện tại
+        self._sr = np.array(sr, dtype=np.int64)
+        self._out = np.zeros((1, 1), dtype=np.float32)
+        self._scale = np.float32(1.0 / 32768.0)
+
+        # Giữ OrtValue (trỏ vào chính các numpy buffer ở trên) sống cùng binding
+        self._ort_values = []
+
+        def value(array):
+            ort_value = ort.OrtValue.ortvalue_from_numpy(array)
+            self._ort_values.append(ort_value)
+            return ort_value
+
+        inputs = {'input': value(self._input), 'sr': value(self._sr)}
+        out = value(self._out)
+        self._bindings = []
+        for turn in range(2):
+            binding = self.session.io_binding()
+            for name, ort_value in inputs.items():
+                binding.bind_ortvalue_input(name, ort_value)
+            for name, state in zip(self._state_names, self._states[turn]):
+                binding.bind_ortvalue_input(name, value(state))
+            binding.bind_ortvalue_output(self._output_names[0], out)
+            for name, state in zip(self._output_names[1:], self._states[1 - turn]):
+                binding.bind_ortvalue_output(name, value(state))
+            self._bindings.append(binding)
+        self._shape = (samples, sr)
+
+    def _run(self) -> float:
+        self.session.run_with_iobinding(self._bindings[self._turn])
+        self._turn = 1 - self._turn
+        if self._context_size:
+            # Context cho chunk sau = 64 mẫu cuối của chunk này (copy trong cùng buffer)
+            self._input[0, :self._context_size] = self._input[0, -self._context_size:]
+        return float(self._out[0, 0])
+
+    def process(self, pcm: bytes, sr: int = 16000) -> float:
+        """Xác suất giọng nói của một chunk PCM int16 (bytes từ micro / WebSocket)"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if self._shape != (len(samples), sr):
+            self._prepare(len(samples), sr)
+        # Hai bước cùng buffer: nhân int16 với float trực tiếp thì numpy cấp buffer tạm để ép kiểu
+        np.copyto(self._chunk, samples, casting='unsafe')
+        np.multiply(self._chunk, self._scale, out=self._chunk)
+        return self._run()
+
+    def __call__(self, chunk, sr: int) -> np.ndarray:
+        x = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        if self._shape != (len(x), sr):
+            self._prepare(len(x), sr)
+        self._chunk[:] = x
+        return np.array([[self._run()]], dtype=np.float32)
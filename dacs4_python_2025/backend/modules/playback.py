@@ -0,0 +1,81 @@
+"""
+Playback Tracker - Theo dõi audio đang phát trên client
+Client gửi playback_started / playback_finished (kèm audio_id), server chờ ack thật
+thay vì đoán thời gian phát. Nếu client không ack thì dùng thời lượng đọc từ header audio.
+"""
+
+import asyncio
+import itertools
+import time
+import colorama
+from typing import Optional
+
+
+class PlaybackTracker:
+    def __init__(self, grace: float = 0.5):
+        """
+        Args:
+            grace: Thời gian chờ thêm sau thời điểm dự kiến phát xong trước khi bỏ qua ack
+        """
+        self.grace = grace
+        self._ids = itertools.count(1)
+        self._pending = {}  # audio_id -> thời lượng (giây), theo thứ tự gửi
+        self._expected_end = 0.0  # time.monotonic() dự kiến phát xong toàn bộ hàng đợi
+        self._changed = asyncio.Event()
+
+    @property
+    def is_playing(self) -> bool:
+        return bool(self._pending)
+
+    def register(self, duration: Optional[float]) -> int:
+        """Đăng ký một đoạn audio sắp gửi cho client, trả về audio_id"""
+        audio_id = next(self._ids)
+        duration = duration or 0.0
+
+        # Client phát tuần tự: đoạn mới bắt đầu sau khi hàng đợi phát xong
+        self._expected_end = max(time.monotonic(), self._expected_end) + duration
+        self._pending[audio_id] = duration
+        self._changed.set()
+        return audio_id
+
+    def started(self, audio_id: int):
+        """Client bắt đầu phát audio_id"""
+        if audio_id not in self._pending:
+            return
+
+        # Bỏ các đoạn trước đó (client đã phát qua) và tính lại thời điểm kết thúc
+        for earlier in [i for i in self._pending if i < audio_id]:
+            del self._pending[earlier]
+        self._expected_end = time.monotonic() + sum(self._pending.values())
+        self._changed.set()
+
+    def finished(self, audio_id: int):
+        """Client đã phát xong audio_id (và mọi đoạn trước nó)"""
+        for done in [i for i in self._pending if i <= audio_id]:
+            del self._pending[done]
+
+        self._expected_end = time.monotonic() + sum(self._pending.values())
+        self._changed.set()
+
+    def cancel(self):
+        """Hủy toàn bộ audio đang chờ (client đã dừng phát)"""
+        self._pending.clear()
+        self._expected_end = time.monotonic()
+        self._changed.set()
+
+    async def wait_idle(self):
+        """Chờ đến khi client phát xong mọi audio đã gửi"""
+        while self._pending:
+            remaining = self._expected_end + self.grace - time.monotonic()
+            if remaining <= 0:
+                # Client không ack (tab cũ / mất gói) -> tin vào thời lượng từ header
+                print(colorama.Fore.YELLOW + f"[PLAYBACK] No ack for audio {list(self._pending)}, using header duration" + colorama.Style.RESET_ALL)
+                self._pending.clear()
+                self._expected_end = time.monotonic()
+                break
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
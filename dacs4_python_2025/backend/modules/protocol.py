@@ -0,0 +1,72 @@
+"""
+Binary WebSocket Protocol - Khung nhị phân cho video frame, audio lên (mic) và audio xuống (TTS)
+
+Mỗi message nhị phân = header cố định 16 bytes + payload:
+
+    offset  size  field
+    0       1     version     (PROTOCOL_VERSION)
+    1       1     msg_type    (VIDEO_FRAME / AUDIO_UP / AUDIO_DOWN)
+    2       2     stream_id   (camera / mic / lượt trả lời)
+    4       4     seq         (số thứ tự; với AUDIO_DOWN là audio_id để client ack)
+    8       8     timestamp   (float64, giây - thời điểm bên gửi tạo frame)
+
+Tất cả little-endian (khớp DataView(..., true) bên frontend - xem frontend/src/protocol.ts).
+Payload được trả về dạng memoryview trỏ thẳng vào message gốc, không copy.
+"""
+
+import struct
+import time
+from typing import NamedTuple, Optional
+
+PROTOCOL_VERSION = 1
+
+# Loại message
+VIDEO_FRAME = 1  # client -> server: ảnh JPEG từ webcam
+AUDIO_UP = 2     # client -> server: PCM int16 16kHz từ mic
+AUDIO_DOWN = 3   # server -> client: audio TTS (MP3/WAV)
+
+MESSAGE_TYPES = {VIDEO_FRAME, AUDIO_UP, AUDIO_DOWN}
+
+HEADER = struct.Struct('<BBHId')
+HEADER_SIZE = HEADER.size  # 16 bytes
+
+
+class ProtocolError(ValueError):
+    """Message nhị phân không đúng định dạng"""
+
+
+class Frame(NamedTuple):
+    msg_type: int
+    stream_id: int
+    seq: int
+    timestamp: float
+    payload: memoryview
+
+
+def pack_frame(msg_type: int, payload: bytes, seq: int = 0, stream_id: int = 0,
+               timestamp: Optional[float] = None) -> bytes:
+    """Đóng gói header + payload thành một message nhị phân"""
+    if timestamp is None:
+        timestamp = time.time()
+    header = HEADER.pack(PROTOCOL_VERSION, msg_type, stream_id, seq & 0xFFFFFFFF, timestamp)
+    return header + payload
+
+
+def unpack_frame(message) -> Frame:
+    """
+    Đọc header của message nhị phân
+
+    Raises:
+        ProtocolError: Message quá ngắn, sai version hoặc loại message không hỗ trợ
+    """
+    view = memoryview(message)
+    if len(view) < HEADER_SIZE:
+        raise ProtocolError(f"Frame too short: {len(view)} bytes")
+
+    version, msg_type, stream_id, seq, timestamp = HEADER.unpack_from(view)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {version}")
+    if msg_type not in MESSAGE_TYPES:
+        raise ProtocolError(f"Unknown message type: {msg_type}")
+
+    return Frame(msg_type, stream_id, seq, timestamp, view[HEADER_SIZE:])
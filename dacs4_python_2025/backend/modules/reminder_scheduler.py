@@ -17,7 +17,7 @@ class ReminderScheduler:
         Initialize reminder scheduler
         
         Args:
-            database: Database instance
+            database: AsyncChatDatabase (truy vấn không chặn event loop)
             check_interval: How often to check for reminders (seconds)
         """
         self.database = database
@@ -39,7 +39,7 @@ class ReminderScheduler:
         while self.is_running:
             try:
                 # Check for pending reminders
-                pending = self.database.get_pending_reminders()
+                pending = await self.database.get_pending_reminders()
                 
                 if pending:
                     print(colorama.Fore.YELLOW + f"[REMINDER] Found {len(pending)} pending reminder(s)" + colorama.Style.RESET_ALL)
@@ -50,7 +50,7 @@ class ReminderScheduler:
                             await self.callback(reminder)
                         else:
                             # No callback set, mark as notified anyway
-                            self.database.mark_reminder_notified(reminder['id'])
+                            await self.database.mark_reminder_notified(reminder['id'])
                         
                         print(colorama.Fore.GREEN + 
                               f"[REMINDER] ✅ Triggered: {reminder['title']} for {reminder['username']}" + 
@@ -71,9 +71,10 @@ class ReminderScheduler:
 
 # Test
 if __name__ == "__main__":
-    from database import ChatDatabase
+    from modules.database import ChatDatabase
+    from modules.async_database import AsyncChatDatabase
     
-    db = ChatDatabase()
+    db = AsyncChatDatabase(ChatDatabase())
     scheduler = ReminderScheduler(db, check_interval=10)
     
     async def test_callback(reminder):
@@ -0,0 +1,58 @@
+"""
+Sentence Splitter - Tách text đang stream từ LLM thành từng câu/mệnh đề hoàn chỉnh
+để đưa sang TTS sớm nhất có thể
+"""
+
+import re
+from typing import List, Optional
+
+# Kết thúc câu: . ! ? … (có thể kèm dấu ngoặc/nháy) rồi khoảng trắng
+_SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+# Ngắt mệnh đề: , ; : — rồi khoảng trắng
+_CLAUSE_END = re.compile(r'[,;:—]\s+')
+
+
+class SentenceSplitter:
+    def __init__(self, min_chars: int = 12, clause_chars: int = 60):
+        """
+        Args:
+            min_chars: Độ dài tối thiểu của một đoạn gửi TTS (tránh request quá vụn)
+            clause_chars: Câu dài hơn mức này thì được cắt ở dấu phẩy/chấm phẩy
+        """
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Thêm token mới, trả về các câu/mệnh đề đã hoàn chỉnh"""
+        self.buffer += text
+        pieces = []
+
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            piece = self.buffer[:cut].strip()
+            self.buffer = self.buffer[cut:]
+            if piece:
+                pieces.append(piece)
+
+        return pieces
+
+    def flush(self) -> Optional[str]:
+        """Lấy phần text còn lại khi LLM đã sinh xong"""
+        piece = self.buffer.strip()
+        self.buffer = ""
+        return piece or None
+
+    def _find_cut(self) -> Optional[int]:
+        for match in _SENTENCE_END.finditer(self.buffer):
+            if match.end() >= self.min_chars:
+                return match.end()
+
+        if len(self.buffer) >= self.clause_chars:
+            for match in _CLAUSE_END.finditer(self.buffer):
+                if match.end() >= self.min_chars:
+                    return match.end()
+
+        return None
@@ -0,0 +1,40 @@
+"""
+Silence Trim - Cắt khoảng lặng khỏi câu nói trước khi gửi STT / voice emotion
+Dùng lại xác suất Silero của từng chunk (đã tính trong lúc VAD nghe, không chạy model lần nữa):
+chỉ giữ các đoạn có giọng nói, mỗi đoạn nới thêm `pad` chunk hai bên. Khoảng lặng cuối câu
+(SILENCE_DURATION), phần pre-buffer im lặng và các quãng ngập ngừng dài bị rút về 2 x pad.
+"""
+
+from typing import List, Sequence, Tuple
+
+
+def speech_regions(probs: Sequence[float], threshold: float, pad: int) -> List[Tuple[int, int]]:
+    """
+    Các đoạn [start, end) chunk có giọng nói (đã nới pad, gộp đoạn chồng nhau)
+
+    Args:
+        probs: Xác suất giọng nói của từng chunk
+        threshold: Ngưỡng nói của VAD; chunk >= threshold - 0.15 vẫn tính là giọng (đuôi âm nhỏ dần)
+        pad: Số chunk giữ thêm mỗi phía
+    """
+    keep = max(0.1, threshold - 0.15)
+    regions = []
+    for index, prob in enumerate(probs):
+        if prob < keep:
+            continue
+        start, end = max(0, index - pad), min(len(probs), index + pad + 1)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def trim_silence(frames: Sequence[bytes], probs: Sequence[float], threshold: float, pad: int) -> bytes:
+    """
+    Ghép lại các chunk thuộc đoạn có giọng nói
+
+    Returns:
+        PCM bytes đã cắt (b'' nếu không có chunk nào đủ ngưỡng)
+    """
+    return b''.join(b''.join(frames[start:end]) for start, end in speech_regions(probs, threshold, pad))
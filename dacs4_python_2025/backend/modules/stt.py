@@ -1,6 +1,7 @@
 """
 Speech to Text - Deepgram REST API
 Dùng REST API trực tiếp thay vì SDK v5 (quá nhiều bug)
+Streaming (live) trong lúc user đang nói: xem create_stream / modules/stt_stream.py
 """
 
 import colorama
@@ -10,6 +11,9 @@ import requests
 import os
 from pathlib import Path
 
+from modules import http_client
+from modules.stt_stream import StreamingTranscriber
+
 class SpeechToText:
     def __init__(self):
         print(colorama.Fore.CYAN + "[STT] Đang kết nối tới Deepgram (REST API)..." + colorama.Style.RESET_ALL)
@@ -34,6 +38,7 @@ class SpeechToText:
             raise ValueError("DEEPGRAM_API_KEY not found in environment or .env file")
         
         self.api_url = "https://api.deepgram.com/v1/listen"
+        self.stream_url = os.getenv('DEEPGRAM_STREAM_URL', "wss://api.deepgram.com/v1/listen")
         self.headers = {
             "Authorization": f"Token {self.api_key}",
             "Content-Type": "audio/wav"
@@ -41,6 +46,10 @@ class SpeechToText:
         
         print(colorama.Fore.GREEN + "[STT] ✅ Kết nối thành công!" + colorama.Style.RESET_ALL)
     
+    def create_stream(self, **kwargs) -> StreamingTranscriber:
+        """Kết nối live transcription riêng cho một audio session (gọi start() trên event loop)"""
+        return StreamingTranscriber(self.api_key, self.stream_url, **kwargs)
+    
     def recognize_audio(self, audio_data: bytes) -> str:
         """Nhận dạng giọng nói từ audio bytes"""
         
@@ -53,8 +62,9 @@ class SpeechToText:
             print(colorama.Fore.RED + "[STT ERROR] audio_data is empty!" + colorama.Style.RESET_ALL)
             return ""
         
-        # Bỏ qua nếu âm thanh quá ngắn (ít hơn ~0.8 giây ở 16kHz, 16-bit)
-        min_bytes = 25600  # ~0.8 giây (giảm từ 1s xuống 0.8s)
+        # Bỏ qua nếu âm thanh quá ngắn (ít hơn ~0.35 giây ở 16kHz, 16-bit)
+        # Audio từ VAD đã cắt khoảng lặng: câu ngắn như "yes" chỉ còn ~0.5s
+        min_bytes = 11200  # ~0.35 giây (trước đây 0.8s khi còn 1.5s im lặng cuối câu)
         if len(audio_data) < min_bytes:
             print(colorama.Fore.YELLOW + f"[STT] Audio quá ngắn: {len(audio_data)} bytes (tối thiểu: {min_bytes} bytes)" + colorama.Style.RESET_ALL)
             return ""
@@ -94,7 +104,7 @@ class SpeechToText:
                 "utterances": "false"
             }
             
-            response = requests.post(
+            response = http_client.session().post(
                 self.api_url,
                 headers=self.headers,
                 params=params,
@@ -0,0 +1,250 @@
+"""
+Streaming STT - Deepgram live transcription qua một WebSocket giữ mở suốt audio session
+- Audio được gửi ngay khi VAD bắt được giọng nói (cả pre-buffer), không chờ hết câu
+- Deepgram trả interim + final transcript trong lúc user vẫn đang nói
+- Khi VAD ngắt câu chỉ cần gửi Finalize: transcript cuối có gần như ngay lập tức
+- Giữa các câu: KeepAlive để không phải mở lại kết nối (TLS + handshake) cho mỗi câu
+
+Các hàm begin/audio/end/abort gọi được từ thread VAD (executor); kết nối chạy trên event loop.
+Lỗi / timeout -> result() trả về None để caller dùng REST (SpeechToText.recognize_audio) như cũ.
+"""
+
+import asyncio
+import collections
+import json
+import time
+import colorama
+import websockets
+from typing import Callable, Dict, Optional
+from urllib.parse import urlencode
+
+DEFAULT_PARAMS = {
+    'model': 'nova-2',
+    'language': 'en',
+    'smart_format': 'true',
+    'punctuate': 'true',
+    'encoding': 'linear16',
+    'sample_rate': 16000,
+    'channels': 1,
+    'interim_results': 'true',
+}
+
+
+class StreamingTranscriber:
+    def __init__(self, api_key: str, url: str = 'wss://api.deepgram.com/v1/listen',
+                 params: Optional[Dict] = None, keepalive: float = 5.0, idle_close: float = 60.0,
+                 finalize_timeout: float = 2.0, on_interim: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            api_key: Deepgram API key
+            url: Endpoint live (đổi sang fake server khi test, xem fake_deepgram_server.py)
+            keepalive: Gửi KeepAlive sau mỗi N giây không có audio (Deepgram đóng sau ~10s)
+            idle_close: Đóng kết nối nếu không có câu nói nào trong N giây (mở lại ở câu sau)
+            finalize_timeout: Chờ transcript cuối tối đa N giây sau khi ngắt câu
+            on_interim: Callback(text) với transcript tạm của cả câu đang nói, gọi mỗi khi có
+                kết quả mới (chạy trên event loop) - vd: AdaptiveEndpointer.hint
+        """
+        self.api_key = api_key
+        self.url = f"{url}?{urlencode({**DEFAULT_PARAMS, **(params or {})})}"
+        self.keepalive = keepalive
+        self.idle_close = idle_close
+        self.finalize_timeout = finalize_timeout
+        self.on_interim = on_interim
+
+        self.loop = None
+        self._queue = None
+        self._task = None
+        self._ws = None
+        self._receiver = None
+
+        self._segments = []  # Final transcript của câu đang nói
+        self._pending = collections.deque()  # Future chờ kết quả Finalize (None = câu bị hủy)
+        self._final = None  # Future của câu vừa ngắt (xem result)
+        self._active = False
+        self._last_activity = 0.0
+        self.interim = ''
+
+        # Thống kê
+        self.utterances = 0
+        self.connections = 0
+        self.fallbacks = 0
+
+    # ---------- Vòng đời ----------
+
+    def start(self):
+        """Gọi trên event loop (trước khi dùng)"""
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._sender())
+
+    def close(self):
+        if self._queue is not None:
+            self._post('close', None)
+
+    # ---------- API cho thread VAD ----------
+
+    def _post(self, kind: str, payload):
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, (kind, payload))
+
+    def begin(self, audio: bytes):
+        """Bắt đầu câu nói mới với audio đã có (pre-buffer + chunk đầu tiên)"""
+        self._post('begin', audio)
+
+    def audio(self, data: bytes):
+        self._post('audio', data)
+
+    def end(self):
+        """VAD đã ngắt câu -> xin transcript cuối (lấy bằng result())"""
+        self.loop.call_soon_threadsafe(self._end_on_loop)
+
+    def abort(self):
+        """Câu nói bị bỏ (mute / discard / tiếng động ngắn): vẫn Finalize nhưng không dùng kết quả"""
+        self._post('abort', None)
+
+    def _end_on_loop(self):
+        # Tạo future ngay (trước khi listen() trả về cho caller), gửi Finalize theo thứ tự audio
+        self._final = self.loop.create_future()
+        self._queue.put_nowait(('end', self._final))
+
+    # ---------- API cho event loop ----------
+
+    async def result(self) -> Optional[str]:
+        """Transcript của câu vừa ngắt, None nếu không có / lỗi / quá finalize_timeout"""
+        future, self._final = self._final, None
+        if future is None:
+            return None
+
+        try:
+            text = await asyncio.wait_for(asyncio.shield(future), self.finalize_timeout)
+        except asyncio.TimeoutError:
+            text = None
+            print(colorama.Fore.YELLOW + f"[STT-STREAM] No final transcript after {self.finalize_timeout}s, reconnecting next utterance" + colorama.Style.RESET_ALL)
+            # Không biết Finalize nào sẽ được trả lời -> bỏ kết nối để không ghép nhầm câu
+            await self._disconnect()
+
+        if text is None:
+            self.fallbacks += 1
+        return text
+
+    def stats(self) -> Dict:
+        return {
+            'utterances': self.utterances,
+            'connections': self.connections,
+            'fallbacks': self.fallbacks,
+        }
+
+    # ---------- Kết nối ----------
+
+    async def _connect(self):
+        # Deepgram nhận API key qua subprotocol -> không phụ thuộc tên tham số header của từng version websockets
+        self._ws = await websockets.connect(self.url, subprotocols=['token', self.api_key], max_size=None)
+        self._receiver = asyncio.create_task(self._receive(self._ws))
+        self.connections += 1
+
+    async def _disconnect(self):
+        ws, self._ws = self._ws, None
+        self._fail_pending()
+        if ws is not None:
+            try:
+                await ws.send(json.dumps({'type': 'CloseStream'}))
+                await ws.close()
+            except Exception:
+                pass
+
+    def _fail_pending(self):
+        self._segments = []
+        while self._pending:
+            future = self._pending.popleft()
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def _sender(self):
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(self._queue.get(), self.keepalive)
+            except asyncio.TimeoutError:
+                await self._idle()
+                continue
+
+            if kind == 'close':
+                break
+
+            try:
+                if kind == 'begin':
+                    if self._ws is None:
+                        start = time.time()
+                        await self._connect()
+                        print(colorama.Fore.CYAN + f"[STT-STREAM] Connected in {(time.time() - start) * 1000:.0f}ms" + colorama.Style.RESET_ALL)
+                    self._active = True
+                    self.interim = ''
+                    self.utterances += 1
+                    await self._ws.send(payload)
+                elif kind == 'audio':
+                    if self._active and self._ws is not None:
+                        await self._ws.send(payload)
+                elif kind in ('end', 'abort'):
+                    future = payload if kind == 'end' else None
+                    if not self._active or self._ws is None:
+                        if future is not None and not future.done():
+                            future.set_result(None)
+                        continue
+                    self._active = False
+                    self._pending.append(future)
+                    await self._ws.send(json.dumps({'type': 'Finalize'}))
+                self._last_activity = time.time()
+            except (websockets.exceptions.WebSocketException, OSError, asyncio.TimeoutError) as e:
+                print(colorama.Fore.YELLOW + f"[STT-STREAM] Connection error ({e}), falling back to REST" + colorama.Style.RESET_ALL)
+                self._active = False
+                if kind == 'end' and not payload.done():
+                    payload.set_result(None)
+                await self._disconnect()
+
+        self._active = False
+        await self._disconnect()
+
+    async def _idle(self):
+        """Không có audio: giữ kết nối bằng KeepAlive, hoặc đóng nếu đã lâu không ai nói"""
+        if self._ws is None or self._active:
+            return
+        if time.time() - self._last_activity > self.idle_close:
+            await self._disconnect()
+            return
+        try:
+            await self._ws.send(json.dumps({'type': 'KeepAlive'}))
+        except (websockets.exceptions.WebSocketException, OSError):
+            await self._disconnect()
+
+    async def _receive(self, ws):
+        try:
+            async for message in ws:
+                if isinstance(message, bytes):
+                    continue
+                data = json.loads(message)
+                if data.get('type') != 'Results':
+                    continue
+
+                alternatives = data.get('channel', {}).get('alternatives') or [{}]
+                text = alternatives[0].get('transcript', '').strip()
+                if data.get('is_final'):
+                    if text:
+                        self._segments.append(text)
+                elif text:
+                    self.interim = text
+                if self.on_interim and (text or data.get('is_final')):
+                    # Transcript của cả câu tới thời điểm này (các đoạn final + interim hiện tại)
+                    self.on_interim(' '.join(self._segments if data.get('is_final') else self._segments + [text]))
+
+                # Audio trước Finalize luôn được trả trước dấu from_finalize -> segments thuộc đúng câu
+                if data.get('from_finalize') and self._pending:
+                    future = self._pending.popleft()
+                    transcript = ' '.join(self._segments)
+                    self._segments = []
+                    if future is not None and not future.done():
+                        future.set_result(transcript)
+        except (websockets.exceptions.WebSocketException, OSError, ValueError) as e:
+            print(colorama.Fore.YELLOW + f"[STT-STREAM] Receive error: {e}" + colorama.Style.RESET_ALL)
+        finally:
+            if self._ws is ws:
+                self._ws = None
+                self._active = False
+                self._fail_pending()
@@ -32,23 +32,45 @@ class TextToSpeech:
             print(colorama.Fore.RED + f"[TTS ERROR] {e}" + colorama.Style.RESET_ALL)
             exit(1)
     
-    def generate_audio_bytes(self, text):
+    def generate_audio_bytes(self, text, previous_text=None, cancel=None):
+        """
+        Args:
+            text: Câu cần đọc
+            previous_text: Câu đã đọc ngay trước đó (khi stream theo từng câu),
+                giúp ElevenLabs giữ ngữ điệu liền mạch giữa các đoạn audio
+            cancel: threading.Event - khi được set (user nói chen) thì dừng đọc stream ElevenLabs
+        """
         if not text or len(text.strip()) < 2:
             return None
+        if cancel is not None and cancel.is_set():
+            return None
         try:
             start_time = time.time()
             print(f"[TTS] Generating audio for {len(text)} chars...")
             
+            extra = {}
+            if previous_text:
+                extra['previous_text'] = previous_text
+            
             # TỐI ƯU: Thêm optimize_streaming_latency
             audio_generator = self.client.text_to_speech.convert(
                 voice_id=self.voice_id, 
                 text=text, 
                 model_id=self.model_id, 
                 voice_settings=self.voice_settings,
-                optimize_streaming_latency=4  # 0-4, 4 = fastest
+                optimize_streaming_latency=4,  # 0-4, 4 = fastest
+                **extra
             )
             
-            audio_bytes = b"".join(audio_generator)
+            chunks = []
+            for chunk in audio_generator:
+                if cancel is not None and cancel.is_set():
+                    # Đóng stream HTTP, không tốn thêm ký tự cho audio không ai nghe
+                    audio_generator.close()
+                    print(colorama.Fore.YELLOW + "[TTS] Cancelled (barge-in)" + colorama.Style.RESET_ALL)
+                    return None
+                chunks.append(chunk)
+            audio_bytes = b"".join(chunks)
             
             if audio_bytes:
                 duration = time.time() - start_time
@@ -0,0 +1,73 @@
+"""
+Voice Turn State Machine
+idle -> listening -> transcribing -> thinking -> speaking -> idle
+Các task chờ chuyển trạng thái bằng asyncio.Condition thay vì sleep-polling
+"""
+
+import asyncio
+from typing import Iterable
+
+# Các trạng thái của một lượt hội thoại
+IDLE = 'idle'
+LISTENING = 'listening'
+TRANSCRIBING = 'transcribing'
+THINKING = 'thinking'
+SPEAKING = 'speaking'
+
+# Chuyển trạng thái hợp lệ
+# - LISTENING -> SPEAKING: lời chào (greeting) chen vào khi đang nghe
+# - X -> IDLE: hủy lượt (không nhận dạng được, response rỗng, lỗi...)
+TRANSITIONS = {
+    IDLE: {LISTENING, SPEAKING},
+    LISTENING: {IDLE, TRANSCRIBING, SPEAKING},
+    TRANSCRIBING: {IDLE, THINKING},
+    THINKING: {IDLE, SPEAKING},
+    SPEAKING: {IDLE},
+}
+
+
+class VoiceTurn:
+    def __init__(self):
+        self.state = IDLE
+        self.greeted = False  # Voice chat chỉ bắt đầu sau lời chào
+        self._changed = asyncio.Condition()
+
+    @property
+    def is_busy(self) -> bool:
+        """Đang xử lý một lượt (không nghe user)"""
+        return self.state in (TRANSCRIBING, THINKING, SPEAKING)
+
+    def _set(self, new_state: str):
+        if new_state not in TRANSITIONS[self.state]:
+            raise ValueError(f"Invalid turn transition: {self.state} -> {new_state}")
+        self.state = new_state
+        self._changed.notify_all()
+
+    async def begin(self, new_state: str, from_states: Iterable[str] = (IDLE,), require_greeted: bool = False):
+        """Chờ (không polling) đến khi ở một trong from_states rồi chuyển sang new_state"""
+        from_states = tuple(from_states)
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self.state in from_states and (self.greeted or not require_greeted)
+            )
+            self._set(new_state)
+
+    async def advance(self, from_state: str, new_state: str) -> bool:
+        """Chuyển trạng thái nếu đang ở from_state. Trả về False nếu task khác đã chiếm lượt"""
+        async with self._changed:
+            if self.state != from_state:
+                return False
+            self._set(new_state)
+            return True
+
+    async def finish(self):
+        """Kết thúc lượt hiện tại, quay về IDLE"""
+        async with self._changed:
+            if self.state != IDLE:
+                self._set(IDLE)
+
+    async def set_greeted(self, greeted: bool = True):
+        """Bật/tắt voice chat (sau lời chào / khi reset conversation)"""
+        async with self._changed:
+            self.greeted = greeted
+            self._changed.notify_all()
@@ -1,3 +1,4 @@
+import os
 import pyaudio
 import numpy as np
 import torch
@@ -5,22 +6,66 @@ import time
 import colorama
 import collections  # Thư viện để dùng bộ đệm vòng (deque)
 
+from modules.onnx_backends import OnnxSileroVAD, onnx_model_path
+from modules.silence_trim import trim_silence
+from modules.endpointing import create_endpointer
+
+
+def _hub_source():
+    """
+    Repo Silero trong cache của torch.hub (đã tải ở lần chạy đầu) -> load local,
+    không gọi GitHub mỗi lần khởi động / mỗi audio session
+    """
+    local_dir = os.getenv('SILERO_VAD_DIR') or os.path.join(torch.hub.get_dir(), 'snakers4_silero-vad_master')
+    if os.path.isdir(local_dir):
+        return local_dir, 'local'
+    return 'snakers4/silero-vad', 'github'
+
+
+def load_silero_model():
+    """Tải model Silero VAD (ONNX Runtime trực tiếp nếu USE_ONNX=1 và đã convert, không thì torch.hub)"""
+    start = time.time()
+    onnx_path = onnx_model_path('silero_vad')
+    if onnx_path:
+        model = OnnxSileroVAD(onnx_path)
+        print(colorama.Fore.CYAN + f"[VAD] Silero loaded from {onnx_path} in {time.time() - start:.2f}s" + colorama.Style.RESET_ALL)
+        return model
+
+    repo, source = _hub_source()
+    # Sử dụng onnx=True thường nhanh và ổn định hơn trên CPU
+    try:
+        model, utils = torch.hub.load(repo_or_dir=repo,
+                                      model='silero_vad',
+                                      source=source,
+                                      trust_repo=True,
+                                      onnx=True)
+    except:
+        # Fallback nếu không load được onnx
+        model, utils = torch.hub.load(repo_or_dir=repo,
+                                      model='silero_vad',
+                                      source=source,
+                                      trust_repo=True)
+    if getattr(model, 'session', None) is not None:
+        # Bản onnx của torch.hub chỉ bọc một InferenceSession -> gọi thẳng session đó (không qua tensor)
+        model = OnnxSileroVAD(session=model.session)
+    print(colorama.Fore.CYAN + f"[VAD] Silero loaded from {source} in {time.time() - start:.2f}s" + colorama.Style.RESET_ALL)
+    return model
+
+
+def speech_prob(model, pcm: bytes, rate: int) -> float:
+    """Xác suất giọng nói của một chunk PCM int16 (OnnxSileroVAD: buffer cấp sẵn, không cấp phát mỗi chunk)"""
+    if isinstance(model, OnnxSileroVAD):
+        return model.process(pcm, rate)
+    audio_chunk = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    with torch.no_grad():
+        # Sử dụng model(tensor, rate) là cách gọi chuẩn cho Silero
+        return model(torch.from_numpy(audio_chunk), rate).item()
+
 
 class VoiceDetector:
     def __init__(self):
         print(colorama.Fore.CYAN + "[VAD] Loading Silero VAD Model (Long Sentence Mode)..." + colorama.Style.RESET_ALL)
-        # Tải model Silero VAD
-        # Sử dụng onnx=True thường nhanh và ổn định hơn trên CPU
-        try:
-            self.model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                               model='silero_vad',
-                                               trust_repo=True,
-                                               onnx=True)
-        except:
-            # Fallback nếu không load được onnx
-            self.model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                               model='silero_vad',
-                                               trust_repo=True)
+        self.model = self._load_model()
 
         self.audio = pyaudio.PyAudio()
         self.stream = None
@@ -38,6 +83,7 @@ class VoiceDetector:
 
         # 1. Tăng thời gian chờ im lặng:
         # Cho phép ngập ngừng lên tới 1.5 giây giữa câu mà không bị cắt.
+        # ADAPTIVE_ENDPOINTING=1: thời gian chờ thay đổi theo từng câu (xem modules/endpointing.py)
         self.SILENCE_DURATION = 1.5
 
         # 2. Tăng thời gian nói tối đa:
@@ -45,16 +91,54 @@ class VoiceDetector:
         self.MAX_SPEECH_DURATION = 30.0
 
         self.PRE_BUFFER_DURATION = 0.5  # Giữ nguyên bộ đệm trước 0.5s để không mất âm đầu
+
+        # 3. Cắt khoảng lặng trước khi gửi STT (tắt bằng TRIM_SILENCE=0):
+        # chỉ giữ đoạn có giọng nói + TRIM_PADDING giây mỗi phía
+        self.TRIM_SILENCE = os.getenv('TRIM_SILENCE', '1') != '0'
+        self.TRIM_PADDING = 0.15
         # ======================================================================
 
         # Tính toán số lượng frame cho bộ đệm trước
         self.pre_buffer_frames = int((self.RATE * self.PRE_BUFFER_DURATION) / self.CHUNK)
+        self.trim_padding_frames = max(1, int((self.RATE * self.TRIM_PADDING) / self.CHUNK))
 
         # Index của Microphone ưu tiên (Thay đổi nếu cần)
         self.PREFERRED_MIC_INDEX = 1
         self.is_muted = False  # Thêm flag để kiểm soát mute/unmute
         self._init_stream()
 
+    def _load_model(self):
+        return load_silero_model()
+
+    def create_endpointer(self):
+        """Bộ quyết định ngắt câu cho một câu nói (chunk-based, dùng chung cho micro local và AudioSession)"""
+        return create_endpointer(self.CHUNK / self.RATE, self.SPEECH_THRESHOLD, self.SILENCE_DURATION)
+
+    def finish_utterance(self, frames, probs) -> bytes:
+        """Ghép câu nói; bỏ khoảng lặng (theo xác suất VAD đã tính của từng chunk) nếu TRIM_SILENCE"""
+        audio_data = b''.join(frames)
+        if not self.TRIM_SILENCE:
+            return audio_data
+
+        trimmed = trim_silence(frames, probs, self.SPEECH_THRESHOLD, self.trim_padding_frames)
+        if audio_data:
+            print(colorama.Fore.CYAN + f"\n[VAD] Trimmed silence: {len(audio_data)} -> {len(trimmed)} bytes (-{(1 - len(trimmed) / len(audio_data)) * 100:.0f}%)" + colorama.Style.RESET_ALL)
+        return trimmed
+
+    def warmup(self):
+        """Chạy thử model một lần (ONNX/JIT khởi tạo lười ở lần gọi đầu) rồi reset trạng thái"""
+        self.model(torch.zeros(self.CHUNK), self.RATE)
+        self.model.reset_states()
+
+    def create_stream_model(self):
+        """
+        Tạo model VAD riêng cho một audio session (client stream audio qua WebSocket).
+        Silero giữ trạng thái nội bộ giữa các chunk nên mỗi session cần instance riêng.
+        """
+        if isinstance(self.model, OnnxSileroVAD):
+            return self.model.fork()  # Dùng chung session ONNX, không load lại file
+        return self._load_model()
+
     def _init_stream(self):
         if self.stream:
             try:
@@ -111,10 +195,11 @@ class VoiceDetector:
         
         # frames: Danh sách chứa dữ liệu âm thanh chính thức của câu nói
         frames = []
-        # pre_buffer: Bộ đệm vòng để lưu âm thanh trước khi nói (tránh mất âm đầu)
+        probs = []  # Xác suất giọng nói của từng frame (dùng để cắt khoảng lặng)
+        # pre_buffer: Bộ đệm vòng để lưu âm thanh trước khi nói (tránh mất âm đầu), kèm xác suất
         pre_buffer = collections.deque(maxlen=self.pre_buffer_frames)
 
-        silence_start_time = None
+        endpointer = self.create_endpointer()
         speech_start_time = None
         is_speaking = False
 
@@ -129,13 +214,10 @@ class VoiceDetector:
                 # Đọc dữ liệu từ micro
                 data = self.stream.read(self.CHUNK, exception_on_overflow=False)
 
-                # Chuẩn bị dữ liệu cho model VAD (float32)
-                audio_chunk = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-
                 # Dự đoán xác suất giọng nói
-                with torch.no_grad():
-                    # Sử dụng model(tensor, rate) là cách gọi chuẩn cho Silero
-                    prob = self.model(torch.from_numpy(audio_chunk), self.RATE).item()
+                prob = speech_prob(self.model, data, self.RATE)
+
+                end_of_utterance = endpointer.update(prob)
 
                 if prob > self.SPEECH_THRESHOLD:
                     # --- PHÁT HIỆN ĐANG NÓI ---
@@ -146,36 +228,35 @@ class VoiceDetector:
                         # print(colorama.Fore.CYAN + "\n[VAD] >> Bắt đầu nói..." + colorama.Style.RESET_ALL)
 
                         # Thêm bộ đệm trước vào đầu danh sách frames
-                        frames.extend(pre_buffer)
+                        for buffered, buffered_prob in pre_buffer:
+                            frames.append(buffered)
+                            probs.append(buffered_prob)
                         pre_buffer.clear()
 
-                    # Reset thời gian tính im lặng vì đang nói
-                    silence_start_time = None
                     # Lưu frame hiện tại
                     frames.append(data)
+                    probs.append(prob)
 
                 else:
                     # --- PHÁT HIỆN IM LẶNG (HOẶC TIẾNG ỒN NHỎ) ---
                     if is_speaking:
                         # Đang trong trạng thái nói mà gặp im lặng
                         frames.append(data)  # Vẫn lưu khoảng lặng này vào câu
+                        probs.append(prob)
 
-                        if silence_start_time is None:
-                            silence_start_time = time.time()
-
-                        # ĐIỀU KIỆN 1: Ngắt câu nếu im lặng đủ lâu (SILENCE_DURATION)
-                        if time.time() - silence_start_time > self.SILENCE_DURATION:
-                            # print(colorama.Fore.GREEN + f"[VAD] >> Đã ngắt câu (Im lặng > {self.SILENCE_DURATION}s)" + colorama.Style.RESET_ALL)
-                            return b''.join(frames)
+                        # ĐIỀU KIỆN 1: Ngắt câu nếu im lặng đủ lâu (thời gian chờ do endpointer quyết định)
+                        if end_of_utterance:
+                            # print(colorama.Fore.GREEN + f"[VAD] >> Đã ngắt câu (Im lặng > {endpointer.timeout():.2f}s)" + colorama.Style.RESET_ALL)
+                            return self.finish_utterance(frames, probs)
                     else:
                         # Chưa nói gì, chỉ là tiếng ồn nền -> Lưu vào bộ đệm trước
-                        pre_buffer.append(data)
+                        pre_buffer.append((data, prob))
 
                 # ĐIỀU KIỆN 2: Ngắt cưỡng ép nếu nói quá dài (MAX_SPEECH_DURATION)
                 if is_speaking and speech_start_time and (time.time() - speech_start_time > self.MAX_SPEECH_DURATION):
                     print(
                         colorama.Fore.YELLOW + f"\n[VAD] >> Đã ngắt câu (Quá dài > {self.MAX_SPEECH_DURATION}s)" + colorama.Style.RESET_ALL)
-                    return b''.join(frames)
+                    return self.finish_utterance(frames, probs)
 
             except IOError as e:
                 # Lỗi thường gặp khi mic bị rút ra hoặc quá tải
@@ -185,7 +266,9 @@ class VoiceDetector:
                 time.sleep(0.5)
                 # Reset trạng thái để tránh lỗi logic
                 frames = []
+                probs = []
                 pre_buffer.clear()
+                endpointer.reset()
                 is_speaking = False
             except Exception as e:
                 print(colorama.Fore.RED + f"\n[VAD Critical Error] {e}" + colorama.Style.RESET_ALL)
@@ -8,6 +8,7 @@ import numpy as np
 import colorama
 from typing import Optional
 import io
+import wave
 
 
 class VoiceEmotionDetector:
@@ -15,6 +16,20 @@ class VoiceEmotionDetector:
         print(colorama.Fore.CYAN + "[VOICE EMOTION] Initializing..." + colorama.Style.RESET_ALL)
         print(colorama.Fore.GREEN + "[VOICE EMOTION] ✅ Ready!" + colorama.Style.RESET_ALL)
     
+    def warmup(self):
+        """
+        Chạy thử trên 1 giây nhiễu nhỏ: lần gọi đầu của librosa (yin, beat.tempo) phải
+        compile numba JIT, mất vài giây nếu để dành cho câu nói đầu tiên
+        """
+        samples = (np.random.default_rng(0).standard_normal(16000) * 1000).astype(np.int16)
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(samples.tobytes())
+        self.detect_emotion(buffer.getvalue())
+    
     def detect_emotion(self, audio_data: bytes) -> Optional[str]:
         """
         Phát hiện cảm xúc từ audio
@@ -0,0 +1,28 @@
+"""
+Warmup - Load + chạy thử model lúc khởi động server
+Nhiều model chỉ được build ở lần gọi đầu tiên (DeepFace, ONNX session, numba JIT của librosa...);
+chạy thử trước khi nhận kết nối để user đầu tiên sau khi deploy không phải chờ.
+"""
+
+import time
+import colorama
+from typing import Callable, Optional
+
+
+def warmup_step(tag: str, name: str, func: Callable) -> Optional[float]:
+    """
+    Chạy func một lần và log thời gian
+
+    Returns:
+        Số giây đã chạy, None nếu lỗi (server vẫn khởi động, model sẽ load lười như cũ)
+    """
+    start = time.time()
+    try:
+        func()
+    except Exception as e:
+        print(colorama.Fore.YELLOW + f"[{tag}] ⚠️ {name} warmup failed: {e}" + colorama.Style.RESET_ALL)
+        return None
+
+    elapsed = time.time() - start
+    print(colorama.Fore.GREEN + f"[{tag}] {name} ready in {elapsed:.2f}s" + colorama.Style.RESET_ALL)
+    return elapsed
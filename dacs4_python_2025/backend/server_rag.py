@@ -26,6 +26,8 @@ import websockets
 import json
 import traceback
 import time
+import threading
+import functools
 import numpy as np
 import os
 from dotenv import load_dotenv
@@ -34,13 +36,29 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from modules.vad import VoiceDetector
+from modules.audio_session import AudioSession
+from modules.turn_state import VoiceTurn, IDLE, LISTENING, TRANSCRIBING, THINKING, SPEAKING
 from modules.stt import SpeechToText
 from modules.llm_cloudflare import LLMCloudflareHandler
 from modules.tts import TextToSpeech
 from modules.face_emotion import FaceEmotionDetector
+from modules.face_tracker import FaceTracker
+from modules.face_workers import create_face_inference
+from modules.emotion_batcher import EmotionBatcher
+from modules.frame_mailbox import FrameMailbox
+from modules.warmup import warmup_step
+from modules import http_client
 from modules.voice_emotion import VoiceEmotionDetector
 from modules.database import ChatDatabase
+from modules.async_database import AsyncChatDatabase
+from modules.loop_monitor import LoopLagMonitor
 from modules.reminder_scheduler import ReminderScheduler
+from modules.sentence_splitter import SentenceSplitter
+from modules.playback import PlaybackTracker
+from modules.audio_utils import get_audio_duration
+from modules.dispatcher import CommandDispatcher, OPTIONAL, track_task
+from modules.connection import run_connection, close_session
+from modules.protocol import pack_frame, unpack_frame, ProtocolError, VIDEO_FRAME, AUDIO_UP, AUDIO_DOWN
 import base64
 import uuid
 
@@ -54,29 +72,53 @@ print(colorama.Fore.CYAN + "=" * 80 + colorama.Style.RESET_ALL)
 
 # Khởi tạo các module
 try:
-    print("\n[1/8] Khởi tạo Database (MySQL)...")
+    print("\n[1/9] Khởi tạo Database (MySQL)...")
     db = ChatDatabase()
+    adb = AsyncChatDatabase(db)  # Dùng trong coroutine: await adb.add_message(...)
     
-    print("\n[2/8] Khởi tạo VAD (Voice Activity Detection)...")
+    print("\n[2/9] Khởi tạo VAD (Voice Activity Detection)...")
     vad = VoiceDetector()
     
-    print("\n[3/8] Khởi tạo STT (Speech to Text)...")
+    print("\n[3/9] Khởi tạo STT (Speech to Text)...")
     stt = SpeechToText()
     
-    print("\n[4/8] Khởi tạo LLM (Cloudflare Workers AI - Llama 3.1)...")
+    print("\n[4/9] Khởi tạo LLM (Cloudflare Workers AI - Llama 3.1)...")
     llm = LLMCloudflareHandler()
     
-    print("\n[5/8] Khởi tạo TTS (ElevenLabs)...")
+    print("\n[5/9] Khởi tạo TTS (ElevenLabs)...")
     tts = TextToSpeech()
     
-    print("\n[6/8] Khởi tạo Face Recognition + Emotion (với Database)...")
+    print("\n[6/9] Khởi tạo Face Recognition + Emotion (với Database)...")
     face_detector = FaceEmotionDetector(database=db)
+    face_inference = create_face_inference(face_detector)  # FACE_WORKERS > 0: process riêng
     
-    print("\n[7/8] Khởi tạo Voice Emotion...")
+    # Gom emotion inference của mọi session thành batch (tắt bằng EMOTION_BATCH=0)
+    emotion_batcher = None
+    if os.getenv('EMOTION_BATCH', '1') != '0':
+        emotion_batcher = EmotionBatcher(
+            face_inference,
+            window=float(os.getenv('EMOTION_BATCH_WINDOW_MS', '15')) / 1000,
+            max_batch=int(os.getenv('EMOTION_BATCH_MAX', '16'))
+        )
+    
+    print("\n[7/9] Khởi tạo Voice Emotion...")
     voice_detector = VoiceEmotionDetector()
     
-    print("\n[8/8] Khởi tạo AI Reminder Scheduler...")
-    reminder_scheduler = ReminderScheduler(db, check_interval=30)
+    print("\n[8/9] Khởi tạo AI Reminder Scheduler...")
+    reminder_scheduler = ReminderScheduler(adb, check_interval=30)
+    
+    # Chạy thử mọi model trước khi báo sẵn sàng (tắt bằng WARMUP=0 khi dev)
+    if os.getenv('WARMUP', '1') != '0':
+        print("\n[9/9] Warm-up models...")
+        warmup_start = time.time()
+        warmup_step('VAD', "Silero VAD", vad.warmup)
+        face_inference.warmup()
+        warmup_step('VOICE EMOTION', "librosa features", voice_detector.warmup)
+        # Mở sẵn kết nối keep-alive tới Deepgram + Cloudflare Worker (lượt đầu không phải chờ TLS)
+        warmup_step('HTTP', "API connections", lambda: http_client.warmup([stt.api_url, llm.worker_url]))
+        print(colorama.Fore.GREEN + f"[WARMUP] ✅ All models warm in {time.time() - warmup_start:.1f}s" + colorama.Style.RESET_ALL)
+    else:
+        print("\n[9/9] Warm-up skipped (WARMUP=0)")
     
 except Exception as e:
     print(colorama.Fore.RED + f"\n[LỖI KHỞI TẠO] {e}" + colorama.Style.RESET_ALL)
@@ -90,9 +132,67 @@ print(colorama.Fore.GREEN + "=" * 80 + colorama.Style.RESET_ALL)
 # Global dict to track active WebSocket connections by user_id
 active_connections = {}
 
+# Streaming turn: LLM stream -> tách câu -> TTS từng câu (tắt bằng STREAMING_TURNS=0)
+STREAMING_TURNS = os.getenv('STREAMING_TURNS', '1') != '0'
+
+# STT streaming: gửi audio lên Deepgram live trong lúc user đang nói (tắt bằng STT_STREAMING=0)
+# Chỉ áp dụng cho audio stream từ browser; lỗi / timeout thì tự dùng REST như cũ
+STT_STREAMING = os.getenv('STT_STREAMING', '1') != '0'
+
+# Barge-in: user nói chen khi AI đang trả lời thì hủy lượt hiện tại (tắt bằng BARGE_IN=0)
+# Chỉ áp dụng cho audio stream từ browser (đã bật echoCancellation), micro server vẫn mute như cũ
+BARGE_IN = os.getenv('BARGE_IN', '1') != '0'
+
 
 # ==================== HELPER FUNCTIONS ====================
 
+def get_audio_input(state):
+    """Nguồn audio của session: AudioSession (client stream) hoặc micro local của server"""
+    return state.get('audio_session') or vad
+
+
+def mute_input(state):
+    """Tắt mic của session hiện tại"""
+    get_audio_input(state).mute()
+
+
+def unmute_input(state):
+    """Mở lại mic của session hiện tại"""
+    get_audio_input(state).unmute()
+
+
+async def send_audio(websocket, state, audio_bytes, text=""):
+    """Gửi một đoạn audio TTS cho client (kèm audio_id để client ack khi phát)"""
+    duration = get_audio_duration(audio_bytes)
+    if duration is None:
+        # Không đọc được header -> ước lượng theo ký tự (Turbo model: ~0.05s/ký tự)
+        duration = len(text) * 0.05
+    
+    audio_id = state['playback'].register(duration)
+    # Một frame nhị phân duy nhất: seq = audio_id để client ack
+    await websocket.send(pack_frame(AUDIO_DOWN, audio_bytes, seq=audio_id))
+    return audio_id
+
+
+async def speak_greeting(websocket, state, greeting):
+    """Phát lời chào bằng TTS và bật voice chat cho session"""
+    turn = state['turn']
+    loop = asyncio.get_running_loop()
+    
+    # Chờ lượt hiện tại (nếu có) xong, lời chào được chen vào khi đang nghe
+    await turn.begin(SPEAKING, from_states=(IDLE, LISTENING))
+    await turn.set_greeted(True)
+    
+    try:
+        wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, greeting)
+        if wav_bytes:
+            await send_audio(websocket, state, wav_bytes, greeting)
+            # Chờ client báo phát xong (playback_finished)
+            await state['playback'].wait_idle()
+    finally:
+        await turn.finish()
+
+
 def save_avatar(base64_data: str) -> str:
     """Save avatar from base64 and return URL"""
     try:
@@ -130,30 +230,37 @@ async def handle_user_registration(websocket, data, face_image_bytes, state):
         if data.get('avatar'):
             avatar_url = save_avatar(data['avatar'])
         
-        # Register user with face recognition
-        user_id = face_detector.register_new_user(
-            username=data['username'],
-            full_name=data['fullName'],
-            image_bytes=face_image_bytes,
-            gender=data.get('gender', 'other'),
-            birth_year=data.get('birthYear'),
-            age=data.get('age'),
-            avatar_url=avatar_url
-        )
+        # Register user with face recognition (DeepFace trong face worker, INSERT trong thread, ngoài event loop)
+        loop = asyncio.get_running_loop()
+        user_id = None
+        embedding = await face_inference.embed(face_image_bytes)
+        if embedding is None:
+            print(colorama.Fore.RED + "[FACE] No face detected" + colorama.Style.RESET_ALL)
+        else:
+            user_id = await loop.run_in_executor(None, functools.partial(
+                face_detector.register_new_user,
+                username=data['username'],
+                full_name=data['fullName'],
+                image_bytes=face_image_bytes,
+                gender=data.get('gender', 'other'),
+                birth_year=data.get('birthYear'),
+                age=data.get('age'),
+                avatar_url=avatar_url,
+                embedding=embedding
+            ))
         
         if user_id:
             # Get user data
-            user = db.get_user_by_id(user_id)
+            user = await adb.get_user_by_id(user_id)
             
             # Create first conversation
-            conv_id = db.create_conversation(user_id, "New Chat")
+            conv_id = await adb.create_conversation(user_id, "New Chat")
             
             # Update state
             state['current_user'] = user['username']
             state['current_user_id'] = user['id']
             state['current_conversation_id'] = conv_id
             state['user_checked'] = True
-            state['face_greeted'] = True  # ✅ IMPORTANT: Enable voice chat
             
             # Send success (with safe defaults for NULL fields)
             await websocket.send(json.dumps({
@@ -181,15 +288,8 @@ async def handle_user_registration(websocket, data, face_image_bytes, state):
                 'emotion': 'happy'
             }))
             
-            # TTS greeting
-            loop = asyncio.get_running_loop()
-            state['is_processing'] = True
-            wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, greeting)
-            if wav_bytes:
-                await websocket.send(json.dumps({"type": "audio", "content": "audio_data"}))
-                await websocket.send(wav_bytes)
-                await asyncio.sleep(len(greeting) * 0.08 + 0.5)
-            state['is_processing'] = False
+            # TTS greeting (✅ IMPORTANT: Enable voice chat)
+            await speak_greeting(websocket, state, greeting)
         else:
             await websocket.send(json.dumps({
                 'type': 'registration_failed',
@@ -208,14 +308,14 @@ async def handle_user_login(websocket, user):
     """Handle user auto-login"""
     try:
         # Update last login
-        db.update_last_login(user['id'])
+        await adb.update_last_login(user['id'])
         
         # Track user for reminders
         active_connections[user['id']] = websocket
         print(colorama.Fore.CYAN + f"[REMINDER] User #{user['id']} tracked for notifications" + colorama.Style.RESET_ALL)
         
         # Get conversations
-        conversations = db.get_conversations(user['id'], limit=50)
+        conversations = await adb.get_conversations(user['id'], limit=50)
         
         # Send login success (with safe defaults for NULL fields)
         await websocket.send(json.dumps({
@@ -228,20 +328,13 @@ async def handle_user_login(websocket, user):
                 'age': user.get('age') or 0,  # ✅ Default to 0 if NULL
                 'avatar_url': user.get('avatar_url')  # ✅ Can be None
             },
-            'conversations': [
-                {
-                    'id': c['id'],
-                    'title': c['title'],
-                    'updated_at': c['updated_at'].isoformat() if hasattr(c['updated_at'], 'isoformat') else str(c['updated_at'])
-                }
-                for c in conversations
-            ]
+            'conversations': format_conversations(conversations)
         }))
         
         print(colorama.Fore.GREEN + f"[USER] ✅ Logged in: {user['username']}" + colorama.Style.RESET_ALL)
         
         # Check for missed reminders
-        missed_reminders = db.get_missed_reminders(user['id'])
+        missed_reminders = await adb.get_missed_reminders(user['id'])
         if missed_reminders:
             print(colorama.Fore.YELLOW + f"[REMINDER] Found {len(missed_reminders)} missed reminder(s) for user #{user['id']}" + colorama.Style.RESET_ALL)
             
@@ -268,45 +361,318 @@ async def handle_user_login(websocket, user):
         print(colorama.Fore.RED + f"[LOGIN ERROR] {e}" + colorama.Style.RESET_ALL)
 
 
+async def stream_llm_to_tts(websocket, state, text, user_emotion, user_name, cancel):
+    """
+    Streaming turn: LLM sinh token -> tách câu -> TTS từng câu -> gửi audio ngay khi có
+    
+    Args:
+        cancel: threading.Event - set khi user nói chen, dừng stream LLM và các request TTS
+    
+    Returns:
+        (response, t_first_audio) - t_first_audio là None nếu không gửi được audio
+    """
+    loop = asyncio.get_running_loop()
+    turn = state['turn']
+    sentences = asyncio.Queue()
+    audio_jobs = asyncio.Queue()
+    
+    def produce_sentences():
+        # Chạy trong executor: đọc stream LLM, đẩy từng câu hoàn chỉnh về event loop
+        splitter = SentenceSplitter()
+        stream = llm.chat_stream(text, None, user_emotion, user_name)
+        try:
+            for token in stream:
+                if cancel.is_set():
+                    return
+                for sentence in splitter.feed(token):
+                    loop.call_soon_threadsafe(sentences.put_nowait, sentence)
+            tail = splitter.flush()
+            if tail:
+                loop.call_soon_threadsafe(sentences.put_nowait, tail)
+        finally:
+            # Đóng generator -> đóng luôn HTTP stream tới Worker
+            stream.close()
+            loop.call_soon_threadsafe(sentences.put_nowait, None)
+    
+    async def send_chunks():
+        # Gửi audio theo đúng thứ tự câu, câu nào xong TTS thì gửi ngay
+        t_first_audio = None
+        while True:
+            job = await audio_jobs.get()
+            if job is None:
+                return t_first_audio
+            
+            sentence, tts_future = job
+            audio_bytes = await tts_future
+            if not audio_bytes:
+                continue
+            
+            if t_first_audio is None:
+                t_first_audio = time.time()
+                await turn.advance(THINKING, SPEAKING)
+            
+            await send_audio(websocket, state, audio_bytes, sentence)
+    
+    producer = loop.run_in_executor(None, produce_sentences)
+    sender = asyncio.create_task(send_chunks())
+    parts = []
+    previous = None
+    
+    try:
+        while True:
+            sentence = await sentences.get()
+            if sentence is None:
+                break
+            
+            sentence = sentence.replace("\n", " ").replace("\r", "")
+            parts.append(sentence)
+            
+            # TTS các câu chạy song song, không chờ câu trước phát xong
+            tts_future = loop.run_in_executor(None, tts.generate_audio_bytes, sentence, previous, cancel)
+            await audio_jobs.put((sentence, tts_future))
+            previous = sentence
+        
+        await producer
+    except asyncio.CancelledError:
+        # Barge-in: dừng gửi audio, các job trong executor tự thoát nhờ cancel
+        cancel.set()
+        sender.cancel()
+        raise
+    finally:
+        await audio_jobs.put(None)
+    
+    t_first_audio = await sender
+    return ' '.join(parts), t_first_audio
+
+
+async def respond_to_user(websocket, state, text, combined_emotion, user_name, conversation_id, t_vad_end, t_stt_end, cancel):
+    """
+    Phần trả lời của một lượt: LLM -> lưu DB -> TTS -> chờ client phát xong
+    
+    Chạy thành task riêng để có thể hủy khi user nói chen (barge-in).
+    """
+    loop = asyncio.get_running_loop()
+    turn = state['turn']
+    
+    # 2. LLM (Cloudflare Workers AI - Llama 3.1)
+    if STREAMING_TURNS:
+        # Audio câu đầu tiên được gửi trước khi LLM sinh xong
+        response, t_first_audio = await stream_llm_to_tts(
+            websocket, state, text, combined_emotion, user_name, cancel
+        )
+    else:
+        response = await loop.run_in_executor(
+            None, 
+            llm.chat, 
+            text,
+            None,  # style (auto-detect)
+            combined_emotion,  # user_emotion
+            user_name  # user_name
+        )
+    t_llm_end = time.time()
+    
+    # ========== NEW: SAVE ASSISTANT MESSAGE ==========
+    if conversation_id:
+        await adb.add_message(
+            conversation_id=conversation_id,
+            role='assistant',
+            content=response
+        )
+        
+        # ========== AUTO-GENERATE TITLE AFTER 3 MESSAGES ==========
+        messages = await adb.get_messages(conversation_id)
+        
+        # Only generate title once when we have 3+ messages and title is still "New Chat"
+        if len(messages) >= 3:
+            # Check if title is still default
+            conversations = await adb.get_conversations(state.get('current_user_id'), limit=1)
+            current_conv = next((c for c in conversations if c['id'] == conversation_id), None)
+            
+            if current_conv and current_conv['title'] == 'New Chat':
+                print(colorama.Fore.CYAN + "[TITLE] Generating conversation title..." + colorama.Style.RESET_ALL)
+                
+                # Format messages for title generation (use first 4 messages)
+                message_list = [
+                    {"role": msg['role'], "content": msg['content']}
+                    for msg in messages[:4]
+                ]
+                
+                # Generate title
+                title = await loop.run_in_executor(
+                    None,
+                    llm.generate_conversation_title,
+                    message_list
+                )
+                
+                # Update conversation title
+                if title and title != "New Chat":
+                    await adb.update_conversation_title(conversation_id, title)
+                    print(colorama.Fore.GREEN + f"[TITLE] ✅ Updated: {title}" + colorama.Style.RESET_ALL)
+                    
+                    # Notify frontend to refresh conversations
+                    try:
+                        await websocket.send(json.dumps({
+                            'type': 'title_updated',
+                            'conversation_id': conversation_id,
+                            'title': title
+                        }))
+                    except:
+                        pass
+                    pass
+    
+    # Log AI response
+    print("\n" + colorama.Fore.MAGENTA + f"🤖 BRIDGE: {response}" + colorama.Style.RESET_ALL)
+    print("=" * 80 + "\n")
+    await websocket.send(json.dumps({"type": "log", "content": f"Bridge: {response}"}))
+    
+    # Gửi text response ngay lập tức
+    await websocket.send(json.dumps({
+        "type": "text",
+        "content": response
+    }))
+    
+    # 3. TTS (ElevenLabs)
+    clean_response = response.strip().replace("\n", " ").replace("\r", "")
+    
+    if not clean_response:
+        print(colorama.Fore.YELLOW + "[TTS] Response rỗng." + colorama.Style.RESET_ALL)
+        unmute_input(state)  # Nhớ unmute nếu response rỗng
+        return
+    
+    await turn.advance(THINKING, SPEAKING)
+    
+    if STREAMING_TURNS:
+        # Audio đã được gửi theo từng câu trong stream_llm_to_tts
+        audio_started = t_first_audio
+        if audio_started:
+            stt_time = t_stt_end - t_vad_end
+            first_audio_time = t_first_audio - t_stt_end
+            total_time = t_llm_end - t_vad_end
+            
+            print(
+                f"\r[HOÀN THÀNH] STT:{stt_time:.2f}s | First audio:{first_audio_time:.2f}s | Tổng:{total_time:.2f}s | HTTP reuse:{http_client.stats()['reuse_rate']:.0%}",
+                end='', flush=True
+            )
+            print()
+    else:
+        audio_started = None
+        wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, clean_response, None, cancel)
+        t_tts_end = time.time()
+        
+        if wav_bytes:
+            # Tính thời gian
+            stt_time = t_stt_end - t_vad_end
+            llm_time = t_llm_end - t_stt_end
+            tts_time = t_tts_end - t_llm_end
+            total_time = t_tts_end - t_vad_end
+            
+            print(
+                f"\r[HOÀN THÀNH] STT:{stt_time:.2f}s | LLM:{llm_time:.2f}s | TTS:{tts_time:.2f}s | Tổng:{total_time:.2f}s | HTTP reuse:{http_client.stats()['reuse_rate']:.0%}",
+                end='', flush=True
+            )
+            print()
+            
+            # Gửi audio response
+            await send_audio(websocket, state, wav_bytes, clean_response)
+            audio_started = time.time()
+    
+    if audio_started:
+        # Đợi client báo phát xong (playback_finished), fallback theo thời lượng header
+        await state['playback'].wait_idle()
+        
+        # MỞ LẠI MIC SAU KHI PHÁT XONG
+        unmute_input(state)
+    else:
+        print(colorama.Fore.RED + "[TTS] Không tạo được âm thanh." + colorama.Style.RESET_ALL)
+        # Vẫn phải unmute nếu TTS fail
+        unmute_input(state)
+
+
+async def respond_with_barge_in(websocket, state, audio_session, response, cancel):
+    """
+    Chạy phần trả lời, đồng thời nghe xem user có nói chen không
+    
+    Returns:
+        True nếu lượt bị hủy do user nói chen
+    """
+    # Lưu vào state['tasks']: client ngắt kết nối thì cancel_tasks hủy và chờ cả hai dừng hẳn
+    respond_task = track_task(state, response)
+    barge_in_task = track_task(state, audio_session.wait_for_speech())
+    
+    try:
+        await asyncio.wait({respond_task, barge_in_task}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # Task cha bị hủy (client ngắt kết nối): dừng LLM/TTS trong executor
+        cancel.set()
+        respond_task.cancel()
+        barge_in_task.cancel()
+        await asyncio.gather(respond_task, barge_in_task, return_exceptions=True)
+        raise
+    barge_in_task.cancel()
+    
+    if respond_task.done():
+        respond_task.result()  # Ném lại lỗi (nếu có) cho handle_voice_chat
+        return False
+    
+    # User nói chen: dừng LLM/TTS đang chạy và audio đang phát trên client
+    print(colorama.Fore.YELLOW + "\n[BARGE-IN] User started speaking, cancelling current response" + colorama.Style.RESET_ALL)
+    cancel.set()
+    respond_task.cancel()
+    await asyncio.gather(respond_task, return_exceptions=True)
+    
+    state['playback'].cancel()
+    await websocket.send(json.dumps({'type': 'stop_playback'}))
+    return True
+
+
 # ==================== WEBSOCKET HANDLERS ====================
 
-async def handle_face_recognition(websocket, state, image_queue):
+async def handle_face_recognition(websocket, state, frames):
     """Task riêng xử lý face recognition từ video frames - CHECK USER + EMOTION"""
     loop = asyncio.get_running_loop()
     
-    # Throttling: Chỉ xử lý 1 frame mỗi 0.5 giây
-    last_process_time = 0
-    PROCESS_INTERVAL = 0.5  # giây
+    # Tracker nhẹ (Haar + IoU) chạy mỗi frame; DeepFace chỉ chạy khi tracker cho phép:
+    # track mới / chưa nhận diện được, hoặc tới nhịp emotion (giãn dần khi cảm xúc không đổi)
+    tracker = FaceTracker()
+    last_track_time = 0
+    TRACK_INTERVAL = 0.2  # giây
     
     try:
         while True:
-            # Lấy image từ queue
-            image_data = await image_queue.get()
+            # Throttling: ngủ hết khoảng TRACK_INTERVAL rồi mới lấy frame -
+            # các frame tới trong lúc ngủ bị ghi đè trong mailbox, không decode
+            wait = TRACK_INTERVAL - (time.time() - last_track_time)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            
+            # Lấy frame mới nhất
+            image_data = await frames.get()
             
             if image_data is None:
                 break
+            last_track_time = time.time()
             
-            # Throttling - Skip frames nếu xử lý quá nhanh
-            current_time = time.time()
-            if current_time - last_process_time < PROCESS_INTERVAL:
-                continue  # Skip frame này
-            
-            last_process_time = current_time
-            print(f"[FACE] Processing image: {len(image_data)} bytes")
+            img, box = await loop.run_in_executor(None, tracker.process, image_data)
+            if box is None or not tracker.should_infer():
+                continue  # Không có mặt, hoặc track ổn định và chưa tới lượt chạy model
             
             # ========== CHECK USER LẦN ĐẦU ==========
             if not state.get('user_checked'):
-                # Analyze frame (recognize user + emotion)
+                print(f"[FACE] Processing image: {len(image_data)} bytes (track #{tracker.track_id})")
+                # Analyze frame: inference trong face worker, so khớp face index ngoài event loop
+                embedding, scores = await face_inference.analyze(image_data)
                 result = await loop.run_in_executor(
                     None,
-                    face_detector.analyze_frame,
-                    image_data
+                    face_detector.frame_result,
+                    embedding,
+                    scores
                 )
                 
                 user = result.get('user')
                 is_new_user = result.get('is_new_user', False)
                 detected_emotion = result.get('emotion')
                 greeting = result.get('greeting')
+                tracker.set_identity(user)
                 
                 if is_new_user:
                     # New user detected - show registration form
@@ -350,39 +716,32 @@ async def handle_face_recognition(websocket, state, image_queue):
                                 'user': user['username'],
                                 'emotion': detected_emotion
                             }))
-                            state['face_greeted'] = True
                             
                             # TTS greeting
-                            state['is_processing'] = True
-                            wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, greeting)
-                            if wav_bytes:
-                                await websocket.send(json.dumps({"type": "audio", "content": "audio_data"}))
-                                await websocket.send(wav_bytes)
-                                await asyncio.sleep(len(greeting) * 0.08 + 0.5)
-                            state['is_processing'] = False
+                            await speak_greeting(websocket, state, greeting)
                     except websockets.exceptions.ConnectionClosed:
                         print(colorama.Fore.YELLOW + "[FACE] WebSocket closed during login" + colorama.Style.RESET_ALL)
-                        state['is_processing'] = False
                         break
             
             # ========== EMOTION UPDATES (sau khi đã login) ==========
             else:
                 try:
-                    detected_emotion = await loop.run_in_executor(
-                        None,
-                        face_detector.detect_emotion,
-                        image_data
-                    )
+                    # Emotion model chạy trên crop của tracker, không detect lại
+                    crop = tracker.crop(img)
+                    if emotion_batcher:
+                        scores = await emotion_batcher.submit(crop)
+                    else:
+                        scores = await face_inference.emotion_scores(crop)
+                    changed = tracker.add_emotion(scores)
+                    state['face_emotion'] = tracker.emotion
                     
-                    # Cập nhật emotion vào state
-                    if detected_emotion:
-                        state['face_emotion'] = detected_emotion
-                        
-                        # Gửi emotion update
+                    # Chỉ gửi khi cảm xúc (đã làm mượt) thay đổi
+                    if changed:
+                        print(colorama.Fore.CYAN + f"[EMOTION] {changed} (track #{tracker.track_id}, next check in {tracker.stats()['interval']}s)" + colorama.Style.RESET_ALL)
                         try:
                             await websocket.send(json.dumps({
                                 "type": "emotion_update",
-                                "emotion": detected_emotion,
+                                "emotion": changed,
                                 "user": state.get('current_user', 'Unknown')
                             }))
                         except websockets.exceptions.ConnectionClosed:
@@ -397,33 +756,35 @@ async def handle_face_recognition(websocket, state, image_queue):
         if "ConnectionClosed" not in str(type(e).__name__):
             print(colorama.Fore.RED + f"[FACE] Error: {e}" + colorama.Style.RESET_ALL)
             traceback.print_exc()
+    finally:
+        stats = tracker.stats()
+        mailbox = frames.stats()
+        print(colorama.Fore.CYAN + f"[FACE] Session video: {mailbox['received']} frames received, {mailbox['dropped']} dropped, {stats['frames']} tracked, {stats['inferences']} model runs, {stats['track_id']} track(s)" + colorama.Style.RESET_ALL)
 
 
 async def handle_voice_chat(websocket, state):
     """Task riêng xử lý voice chat (VAD + STT + LLM + TTS)"""
     loop = asyncio.get_running_loop()
+    turn = state['turn']
     
     status_text = "Đang chờ..."
     last_vol = 0
     
     try:
         while True:
-            # CHỜ ĐẾN KHI ĐÃ CHÀO HỎI
-            if not state.get('face_greeted'):
-                await asyncio.sleep(0.5)
-                continue
-            
-            # Nếu đang xử lý voice thì không nghe
-            if state['is_processing']:
-                await asyncio.sleep(0.1)
-                continue
+            # CHỜ ĐẾN KHI ĐÃ CHÀO HỎI VÀ KHÔNG CÒN LƯỢT NÀO ĐANG XỬ LÝ
+            # (asyncio.Condition - không polling, session rảnh không tốn CPU)
+            await turn.begin(LISTENING, require_greeted=True)
             
             # Bắt đầu nghe
             t_start_listen = time.time()
             status_text = "Đang nghe..."
+            audio_session = state.get('audio_session')
             
             # Lấy chunk âm thanh để vẽ thanh mic
-            if vad.stream and vad.stream.is_active():
+            if audio_session:
+                last_vol = audio_session.last_volume
+            elif vad.stream and vad.stream.is_active():
                 try:
                     data_chunk = vad.stream.read(vad.CHUNK, exception_on_overflow=False)
                     last_vol = np.abs(np.frombuffer(data_chunk, dtype=np.int16)).mean()
@@ -435,38 +796,54 @@ async def handle_voice_chat(websocket, state):
             print(f"\r[MIC] {bar[:20]:<20} | {status_text:<30}", end='', flush=True)
             
             # Gọi VAD để nghe
-            audio_data = await loop.run_in_executor(None, vad.listen)
+            if audio_session:
+                # Audio do browser stream lên (ring buffer + VAD riêng của session)
+                audio_data = await audio_session.listen()
+            else:
+                # Micro local của server
+                audio_data = await loop.run_in_executor(None, vad.listen)
             
             if audio_data is None:
-                await asyncio.sleep(0.01)
+                await turn.advance(LISTENING, IDLE)
                 continue
             
-            # Kiểm tra độ dài audio (tối thiểu ~0.5 giây ở 16kHz, 16-bit)
-            min_audio_bytes = 16000  # ~0.5 giây
+            # Kiểm tra độ dài audio (tối thiểu ~0.35 giây ở 16kHz, 16-bit)
+            # Audio đã được cắt khoảng lặng (chỉ còn giọng nói + padding) nên ngưỡng thấp hơn trước;
+            # một chunk tiếng động (~32ms + padding 2 x 0.15s) vẫn bị loại
+            min_audio_bytes = 11200  # ~0.35 giây
             if len(audio_data) < min_audio_bytes:
                 print(colorama.Fore.YELLOW + f"[VAD] Audio quá ngắn: {len(audio_data)} bytes, bỏ qua..." + colorama.Style.RESET_ALL)
+                await turn.advance(LISTENING, IDLE)
                 continue
             
             # Log thông tin audio nhận được
             duration_seconds = len(audio_data) / (16000 * 2)  # 16kHz, 16-bit = 2 bytes/sample
             print(colorama.Fore.CYAN + f"\n[VAD] ✅ Đã ngắt câu. Audio: {len(audio_data)} bytes (~{duration_seconds:.2f}s)" + colorama.Style.RESET_ALL)
             
-            # Bắt đầu xử lý
-            state['is_processing'] = True
+            # Bắt đầu xử lý (bỏ qua nếu lời chào đã chen vào trong lúc nghe)
+            if not await turn.advance(LISTENING, TRANSCRIBING):
+                continue
             t_vad_end = time.time()
             
             try:
                 # 1. STT (Deepgram)
                 status_text = "Đang nhận dạng giọng nói (Deepgram)..."
-                t_stt_end = 0; t_llm_end = 0; t_tts_end = 0
+                t_stt_end = 0
                 
-                print(colorama.Fore.CYAN + f"[STT] Đang gửi {len(audio_data)} bytes đến Deepgram API..." + colorama.Style.RESET_ALL)
-                text = await loop.run_in_executor(None, stt.recognize_audio, audio_data)
+                text = None
+                if audio_session and audio_session.transcriber:
+                    # Audio đã được gửi trong lúc nói -> chỉ chờ transcript cuối
+                    text = await audio_session.transcriber.result()
+                    if text is not None:
+                        print(colorama.Fore.GREEN + f"[STT] ⚡ Streaming transcript in {(time.time() - t_vad_end) * 1000:.0f}ms: '{text}'" + colorama.Style.RESET_ALL)
+                if text is None:
+                    print(colorama.Fore.CYAN + f"[STT] Đang gửi {len(audio_data)} bytes đến Deepgram API..." + colorama.Style.RESET_ALL)
+                    text = await loop.run_in_executor(None, stt.recognize_audio, audio_data)
                 t_stt_end = time.time()
                 
                 if not text:
                     print(colorama.Fore.YELLOW + "[STT] ⚠️ Không nhận dạng được text từ audio." + colorama.Style.RESET_ALL)
-                    state['is_processing'] = False
+                    await turn.finish()
                     status_text = "Đang chờ..."
                     continue
                 
@@ -483,7 +860,7 @@ async def handle_voice_chat(websocket, state):
                 # ========== NEW: SAVE USER MESSAGE ==========
                 conversation_id = state.get('current_conversation_id')
                 if conversation_id:
-                    db.add_message(
+                    await adb.add_message(
                         conversation_id=conversation_id,
                         role='user',
                         content=text,
@@ -514,140 +891,41 @@ async def handle_voice_chat(websocket, state):
                     "content": text
                 }))
                 
-                # 2. LLM (Cloudflare Workers AI - Llama 3.1)
+                # 2. LLM (Cloudflare Workers AI - Llama 3.1) + 3. TTS (ElevenLabs)
                 status_text = "AI đang suy nghĩ (Cloudflare)..."
+                await turn.advance(TRANSCRIBING, THINKING)
                 
-                # TẮT MIC NGAY KHI BẮT ĐẦU XỬ LÝ LLM (để tránh feedback)
-                vad.mute()
-                
-                response = await loop.run_in_executor(
-                    None, 
-                    llm.chat, 
-                    text,
-                    None,  # style (auto-detect)
-                    combined_emotion,  # user_emotion
-                    user_name  # user_name
+                cancel = threading.Event()
+                response = respond_to_user(
+                    websocket, state, text, combined_emotion, user_name,
+                    conversation_id, t_vad_end, t_stt_end, cancel
                 )
-                t_llm_end = time.time()
+                audio_session = state.get('audio_session')
                 
-                # ========== NEW: SAVE ASSISTANT MESSAGE ==========
-                if conversation_id:
-                    db.add_message(
-                        conversation_id=conversation_id,
-                        role='assistant',
-                        content=response
-                    )
-                    
-                    # ========== AUTO-GENERATE TITLE AFTER 3 MESSAGES ==========
-                    messages = db.get_messages(conversation_id)
-                    
-                    # Only generate title once when we have 3+ messages and title is still "New Chat"
-                    if len(messages) >= 3:
-                        # Check if title is still default
-                        conversations = db.get_conversations(state.get('current_user_id'), limit=1)
-                        current_conv = next((c for c in conversations if c['id'] == conversation_id), None)
-                        
-                        if current_conv and current_conv['title'] == 'New Chat':
-                            print(colorama.Fore.CYAN + "[TITLE] Generating conversation title..." + colorama.Style.RESET_ALL)
-                            
-                            # Format messages for title generation (use first 4 messages)
-                            message_list = [
-                                {"role": msg['role'], "content": msg['content']}
-                                for msg in messages[:4]
-                            ]
-                            
-                            # Generate title
-                            title = await loop.run_in_executor(
-                                None,
-                                llm.generate_conversation_title,
-                                message_list
-                            )
-                            
-                            # Update conversation title
-                            if title and title != "New Chat":
-                                db.update_conversation_title(conversation_id, title)
-                                print(colorama.Fore.GREEN + f"[TITLE] ✅ Updated: {title}" + colorama.Style.RESET_ALL)
-                                
-                                # Notify frontend to refresh conversations
-                                try:
-                                    await websocket.send(json.dumps({
-                                        'type': 'title_updated',
-                                        'conversation_id': conversation_id,
-                                        'title': title
-                                    }))
-                                except:
-                                    pass
-                                pass
-                
-                # Log AI response
-                print("\n" + colorama.Fore.MAGENTA + f"🤖 BRIDGE: {response}" + colorama.Style.RESET_ALL)
-                print("=" * 80 + "\n")
-                await websocket.send(json.dumps({"type": "log", "content": f"Bridge: {response}"}))
-                
-                # Gửi text response ngay lập tức
-                await websocket.send(json.dumps({
-                    "type": "text",
-                    "content": response
-                }))
-                
-                # 3. TTS (ElevenLabs) - Đã mute mic từ trước
-                status_text = "Đang tạo giọng nói (ElevenLabs)..."
-                clean_response = response.strip().replace("\n", " ").replace("\r", "")
-                
-                if not clean_response:
-                    print(colorama.Fore.YELLOW + "[TTS] Response rỗng." + colorama.Style.RESET_ALL)
-                    state['is_processing'] = False
-                    status_text = "Đang chờ..."
-                    vad.unmute()  # Nhớ unmute nếu response rỗng
-                    continue
-                
-                # Mic đã được mute từ trước (khi bắt đầu LLM)
-                
-                wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, clean_response)
-                t_tts_end = time.time()
-                
-                if wav_bytes:
-                    # Tính thời gian
-                    stt_time = t_stt_end - t_vad_end
-                    llm_time = t_llm_end - t_stt_end
-                    tts_time = t_tts_end - t_llm_end
-                    total_time = t_tts_end - t_vad_end
-                    
-                    print(
-                        f"\r[HOÀN THÀNH] STT:{stt_time:.2f}s | LLM:{llm_time:.2f}s | TTS:{tts_time:.2f}s | Tổng:{total_time:.2f}s",
-                        end='', flush=True
-                    )
-                    print()
-                    
-                    # Gửi audio response
-                    await websocket.send(json.dumps({
-                        "type": "audio",
-                        "content": "audio_data"
-                    }))
-                    await websocket.send(wav_bytes)
-                    
-                    # Ước lượng thời gian phát audio
-                    # Turbo model: ~0.05s/ký tự
-                    estimated_duration = len(clean_response) * 0.05
-                    
-                    # Đợi audio phát xong
-                    await asyncio.sleep(estimated_duration)
-                    
-                    # MỞ LẠI MIC SAU KHI PHÁT XONG
-                    vad.unmute()
+                if BARGE_IN and audio_session:
+                    # Giữ mic mở để phát hiện user nói chen (bỏ audio nhận được trong lúc STT)
+                    audio_session.discard()
+                    await respond_with_barge_in(websocket, state, audio_session, response, cancel)
                 else:
-                    print(colorama.Fore.RED + "[TTS] Không tạo được âm thanh." + colorama.Style.RESET_ALL)
-                    # Vẫn phải unmute nếu TTS fail
-                    vad.unmute()
+                    # TẮT MIC NGAY KHI BẮT ĐẦU XỬ LÝ LLM (để tránh feedback)
+                    mute_input(state)
+                    try:
+                        await response
+                    except asyncio.CancelledError:
+                        cancel.set()  # Client ngắt kết nối: dừng LLM/TTS đang chạy trong executor
+                        raise
             
+            except websockets.exceptions.ConnectionClosed:
+                # Client đã đi: thoát vòng lặp (CancelledError không phải Exception nên tự đi qua)
+                raise
             except Exception as e:
                 print(colorama.Fore.RED + f"\n[LỖI XỬ LÝ] {e}" + colorama.Style.RESET_ALL)
                 traceback.print_exc()
                 # Đảm bảo unmute ngay cả khi có lỗi
-                vad.unmute()
+                unmute_input(state)
             
             # Kết thúc xử lý
-            state['is_processing'] = False
+            await turn.finish()
             status_text = "Đang chờ..."
             print(colorama.Fore.GREEN + "[SYSTEM] ✅ Sẵn sàng nghe tiếp." + colorama.Style.RESET_ALL)
     
@@ -658,277 +936,343 @@ async def handle_voice_chat(websocket, state):
         traceback.print_exc()
 
 
-async def handle_websocket_messages(websocket, image_queue, state):
-    """Task riêng để nhận messages từ WebSocket (video frames + commands)"""
+# ==================== COMMAND HANDLERS ====================
+
+dispatcher = CommandDispatcher()
+
+# conversation_id / reminder_id có thể là số hoặc chuỗi tùy client
+ID = (int, str)
+
+
+def format_conversations(conversations):
+    return [
+        {
+            'id': c['id'],
+            'title': c['title'],
+            'updated_at': c['updated_at'].isoformat() if hasattr(c['updated_at'], 'isoformat') else str(c['updated_at'])
+        }
+        for c in conversations
+    ]
+
+
+def format_reminders(reminders):
+    return [
+        {
+            'id': r['id'],
+            'title': r['title'],
+            'description': r['description'],
+            'reminder_time': r['reminder_time'].isoformat() if hasattr(r['reminder_time'], 'isoformat') else str(r['reminder_time']),
+            'is_completed': r['is_completed']
+        }
+        for r in reminders
+    ]
+
+
+# ========== USER REGISTRATION ==========
+@dispatcher.command('register_user', schema={'username': str, 'fullName': str}, spawn=True)
+async def cmd_register_user(websocket, state, data):
+    last_face_image = state.get('last_face_image')
+    if last_face_image:
+        await handle_user_registration(websocket, data, last_face_image, state)
+    else:
+        await websocket.send(json.dumps({
+            'type': 'registration_failed',
+            'message': 'No face image captured. Please try again.'
+        }))
+
+
+# ========== CONVERSATIONS ==========
+@dispatcher.command('get_conversations', spawn=True)
+async def cmd_get_conversations(websocket, state, data):
+    user_id = state.get('current_user_id')
+    if user_id:
+        conversations = await adb.get_conversations(user_id, limit=50)
+        await websocket.send(json.dumps({
+            'type': 'conversations',
+            'conversations': format_conversations(conversations)
+        }))
+
+
+@dispatcher.command('create_conversation', spawn=True)
+async def cmd_create_conversation(websocket, state, data):
+    user_id = state.get('current_user_id')
+    if user_id:
+        # Create new conversation
+        conv_id = await adb.create_conversation(user_id, "New Chat")
+        state['current_conversation_id'] = conv_id
+        
+        # Send success and refresh conversations
+        await websocket.send(json.dumps({
+            'type': 'conversation_created',
+            'conversation_id': conv_id
+        }))
+        
+        # Send updated conversations list
+        conversations = await adb.get_conversations(user_id, limit=50)
+        await websocket.send(json.dumps({
+            'type': 'conversations',
+            'conversations': format_conversations(conversations)
+        }))
+        
+        print(colorama.Fore.GREEN + f"[CONV] Created new conversation #{conv_id}" + colorama.Style.RESET_ALL)
+
+
+@dispatcher.command('new_conversation', spawn=True)
+async def cmd_new_conversation(websocket, state, data):
+    user_id = state.get('current_user_id')
+    if user_id:
+        conv_id = await adb.create_conversation(user_id, "New Chat")
+        await websocket.send(json.dumps({
+            'type': 'conversation_created',
+            'conversation_id': conv_id
+        }))
+        state['current_conversation_id'] = conv_id
+
+
+@dispatcher.command('get_messages', schema={'conversation_id': ID}, spawn=True)
+async def cmd_get_messages(websocket, state, data):
+    conv_id = data['conversation_id']
+    messages = await adb.get_messages(conv_id)
+    await websocket.send(json.dumps({
+        'type': 'messages',
+        'messages': [
+            {
+                'role': m['role'],
+                'content': m['content'],
+                'timestamp': m['created_at'].isoformat() if hasattr(m['created_at'], 'isoformat') else str(m['created_at'])
+            }
+            for m in messages
+        ]
+    }))
+    state['current_conversation_id'] = conv_id
+
+
+@dispatcher.command('generate_title', schema={'conversation_id': ID}, spawn=True)
+async def cmd_generate_title(websocket, state, data):
+    conv_id = data['conversation_id']
+    messages = await adb.get_messages(conv_id)
+    if len(messages) >= 2:
+        message_list = [
+            {"role": msg['role'], "content": msg['content']}
+            for msg in messages[:4]
+        ]
+        
+        loop = asyncio.get_running_loop()
+        title = await loop.run_in_executor(
+            None,
+            llm.generate_conversation_title,
+            message_list
+        )
+        
+        if title and title != "New Chat":
+            await adb.update_conversation_title(conv_id, title)
+            await websocket.send(json.dumps({
+                'type': 'title_updated',
+                'conversation_id': conv_id,
+                'title': title
+            }))
+            print(colorama.Fore.GREEN + f"[TITLE] Generated: {title}" + colorama.Style.RESET_ALL)
+
+
+# ========== RESET GREETING STATE ==========
+@dispatcher.command('reset_greeting', spawn=True)
+async def cmd_reset_greeting(websocket, state, data):
+    # Reset greeting state to allow new greeting
+    await state['turn'].set_greeted(False)
+    print(colorama.Fore.YELLOW + "[STATE] Greeting state reset - voice chat paused" + colorama.Style.RESET_ALL)
     
-    # Store face image for registration
-    last_face_image = None
+    # Send greeting for new conversation
+    user_name = state.get('current_user')
+    if user_name:
+        greeting = f"Ready for a new chat, {user_name}! What's on your mind?"
+        
+        await websocket.send(json.dumps({
+            'type': 'greeting',
+            'content': greeting,
+            'user': user_name
+        }))
+        
+        # TTS greeting (bật lại voice chat)
+        await speak_greeting(websocket, state, greeting)
+
+
+# ========== Register face (old method - keep for compatibility) ==========
+@dispatcher.command('register_user_old', schema={'name': str})
+async def cmd_register_user_old(websocket, state, data):
+    user_name = data['name']
+    state['register_name'] = user_name
+    state['register_mode'] = True
+    await websocket.send(json.dumps({
+        "type": "log",
+        "content": f"📸 Registration mode ON. Capturing face for '{user_name}'..."
+    }))
+    print(colorama.Fore.YELLOW + f"[REGISTER] Waiting for face capture: {user_name}" + colorama.Style.RESET_ALL)
+
+
+# ========== REMINDER MANAGEMENT ==========
+@dispatcher.command('create_reminder', schema={'title': str, 'reminder_time': str, 'description': (str, OPTIONAL)}, spawn=True)
+async def cmd_create_reminder(websocket, state, data):
+    user_id = state.get('current_user_id')
+    if user_id:
+        title = data['title']
+        description = data.get('description', '')
+        reminder_time = data['reminder_time']
+        
+        reminder_id = await adb.create_reminder(user_id, title, reminder_time, description)
+        
+        if reminder_id:
+            await websocket.send(json.dumps({
+                'type': 'reminder_created',
+                'reminder_id': reminder_id
+            }))
+            
+            # Send updated reminders list
+            reminders = await adb.get_reminders(user_id)
+            await websocket.send(json.dumps({
+                'type': 'reminders',
+                'reminders': format_reminders(reminders)
+            }))
+
+
+@dispatcher.command('get_reminders', spawn=True)
+async def cmd_get_reminders(websocket, state, data):
+    user_id = state.get('current_user_id')
+    if user_id:
+        reminders = await adb.get_reminders(user_id)
+        await websocket.send(json.dumps({
+            'type': 'reminders',
+            'reminders': format_reminders(reminders)
+        }))
+
+
+@dispatcher.command('complete_reminder', schema={'reminder_id': ID}, spawn=True)
+async def cmd_complete_reminder(websocket, state, data):
+    reminder_id = data['reminder_id']
+    await adb.complete_reminder(reminder_id)
+    await websocket.send(json.dumps({
+        'type': 'reminder_completed',
+        'reminder_id': reminder_id
+    }))
+
+
+@dispatcher.command('delete_reminder', schema={'reminder_id': ID}, spawn=True)
+async def cmd_delete_reminder(websocket, state, data):
+    reminder_id = data['reminder_id']
+    await adb.delete_reminder(reminder_id)
+    await websocket.send(json.dumps({
+        'type': 'reminder_deleted',
+        'reminder_id': reminder_id
+    }))
+
+
+# ========== MIC CONTROL ==========
+@dispatcher.command('mute_mic')
+async def cmd_mute_mic(websocket, state, data):
+    mute_input(state)
+    print(colorama.Fore.YELLOW + "[MIC] 🔇 Muted by user" + colorama.Style.RESET_ALL)
+
+
+@dispatcher.command('unmute_mic')
+async def cmd_unmute_mic(websocket, state, data):
+    unmute_input(state)
+    print(colorama.Fore.GREEN + "[MIC] 🔊 Unmuted by user" + colorama.Style.RESET_ALL)
+
+
+# ========== PLAYBACK ACK ==========
+@dispatcher.command('playback_started', schema={'audio_id': int})
+async def cmd_playback_started(websocket, state, data):
+    state['playback'].started(data['audio_id'])
+
+
+@dispatcher.command('playback_finished', schema={'audio_id': int})
+async def cmd_playback_finished(websocket, state, data):
+    state['playback'].finished(data['audio_id'])
+
+
+# ========== CLIENT AUDIO STREAM ==========
+@dispatcher.command('audio_stream_start', schema={'sample_rate': (int, OPTIONAL)}, spawn=True)
+async def cmd_audio_stream_start(websocket, state, data):
+    sample_rate = data.get('sample_rate', 16000)
+    if sample_rate != vad.RATE:
+        await websocket.send(json.dumps({
+            'type': 'audio_stream_error',
+            'message': f'Unsupported sample rate {sample_rate}, expected {vad.RATE}'
+        }))
+        return
+    
+    # Chạy thành task: chặn lệnh start lặp lại trong lúc đang tải model
+    if state.get('audio_session') or state.get('audio_session_loading'):
+        return
+    state['audio_session_loading'] = True
+    
+    try:
+        # Model VAD riêng cho session (tải trong executor vì khá chậm)
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(None, vad.create_stream_model)
+        transcriber = None
+        if STT_STREAMING:
+            transcriber = stt.create_stream()
+            transcriber.start()
+        state['audio_session'] = AudioSession(
+            model,
+            transcriber=transcriber,
+            rate=vad.RATE,
+            chunk=vad.CHUNK,
+            speech_threshold=vad.SPEECH_THRESHOLD,
+            silence_duration=vad.SILENCE_DURATION,
+            max_speech_duration=vad.MAX_SPEECH_DURATION,
+            pre_buffer_duration=vad.PRE_BUFFER_DURATION,
+            trim_padding=vad.TRIM_PADDING if vad.TRIM_SILENCE else None,
+            endpointer=vad.create_endpointer()
+        )
+    finally:
+        state['audio_session_loading'] = False
+    
+    await websocket.send(json.dumps({'type': 'audio_stream_ready'}))
+    print(colorama.Fore.GREEN + "[MIC] 🎙️ Client audio stream started" + colorama.Style.RESET_ALL)
+
+
+@dispatcher.command('audio_stream_stop')
+async def cmd_audio_stream_stop(websocket, state, data):
+    audio_session = state.pop('audio_session', None)
+    if audio_session:
+        audio_session.close()
+        print(colorama.Fore.YELLOW + f"[MIC] Client audio stream stopped (dropped {audio_session.dropped_chunks} chunks)" + colorama.Style.RESET_ALL)
+
+
+async def handle_websocket_messages(websocket, frames, state):
+    """Task riêng để nhận messages từ WebSocket (video frames + commands)"""
     
     try:
         async for message in websocket:
-            # 1. Xử lý JSON commands
+            # 1. Xử lý JSON commands (xem dispatcher ở trên)
             if isinstance(message, str):
                 try:
                     data = json.loads(message)
-                    cmd_type = data.get('type')
-                    
-                    # ========== NEW: USER REGISTRATION ==========
-                    if cmd_type == 'register_user':
-                        if last_face_image:
-                            await handle_user_registration(websocket, data, last_face_image, state)
-                        else:
-                            await websocket.send(json.dumps({
-                                'type': 'registration_failed',
-                                'message': 'No face image captured. Please try again.'
-                            }))
-                    
-                    # ========== NEW: GET CONVERSATIONS ==========
-                    elif cmd_type == 'get_conversations':
-                        user_id = state.get('current_user_id')
-                        if user_id:
-                            conversations = db.get_conversations(user_id, limit=50)
-                            await websocket.send(json.dumps({
-                                'type': 'conversations',
-                                'conversations': [
-                                    {
-                                        'id': c['id'],
-                                        'title': c['title'],
-                                        'updated_at': c['updated_at'].isoformat() if hasattr(c['updated_at'], 'isoformat') else str(c['updated_at'])
-                                    }
-                                    for c in conversations
-                                ]
-                            }))
-                    
-                    # ========== NEW: CREATE NEW CONVERSATION ==========
-                    elif cmd_type == 'create_conversation':
-                        user_id = state.get('current_user_id')
-                        if user_id:
-                            # Create new conversation
-                            conv_id = db.create_conversation(user_id, "New Chat")
-                            state['current_conversation_id'] = conv_id
-                            
-                            # Send success and refresh conversations
-                            await websocket.send(json.dumps({
-                                'type': 'conversation_created',
-                                'conversation_id': conv_id
-                            }))
-                            
-                            # Send updated conversations list
-                            conversations = db.get_conversations(user_id, limit=50)
-                            await websocket.send(json.dumps({
-                                'type': 'conversations',
-                                'conversations': [
-                                    {
-                                        'id': c['id'],
-                                        'title': c['title'],
-                                        'updated_at': c['updated_at'].isoformat() if hasattr(c['updated_at'], 'isoformat') else str(c['updated_at'])
-                                    }
-                                    for c in conversations
-                                ]
-                            }))
-                            
-                            print(colorama.Fore.GREEN + f"[CONV] Created new conversation #{conv_id}" + colorama.Style.RESET_ALL)
-                    
-                    # ========== NEW: RESET GREETING STATE ==========
-                    elif cmd_type == 'reset_greeting':
-                        # Reset greeting state to allow new greeting
-                        state['face_greeted'] = False
-                        print(colorama.Fore.YELLOW + "[STATE] Greeting state reset - voice chat paused" + colorama.Style.RESET_ALL)
-                        
-                        # Send greeting for new conversation
-                        user_name = state.get('current_user')
-                        if user_name:
-                            greeting = f"Ready for a new chat, {user_name}! What's on your mind?"
-                            
-                            await websocket.send(json.dumps({
-                                'type': 'greeting',
-                                'content': greeting,
-                                'user': user_name
-                            }))
-                            
-                            # TTS greeting
-                            loop = asyncio.get_running_loop()
-                            state['is_processing'] = True
-                            wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, greeting)
-                            if wav_bytes:
-                                await websocket.send(json.dumps({"type": "audio", "content": "audio_data"}))
-                                await websocket.send(wav_bytes)
-                                await asyncio.sleep(len(greeting) * 0.08 + 0.5)
-                            state['is_processing'] = False
-                            state['face_greeted'] = True
-                    
-                    # ========== NEW: GET MESSAGES ==========
-                    elif cmd_type == 'get_messages':
-                        conv_id = data.get('conversation_id')
-                        if conv_id:
-                            messages = db.get_messages(conv_id)
-                            await websocket.send(json.dumps({
-                                'type': 'messages',
-                                'messages': [
-                                    {
-                                        'role': m['role'],
-                                        'content': m['content'],
-                                        'timestamp': m['created_at'].isoformat() if hasattr(m['created_at'], 'isoformat') else str(m['created_at'])
-                                    }
-                                    for m in messages
-                                ]
-                            }))
-                            state['current_conversation_id'] = conv_id
-                    
-                    # ========== NEW: GET MESSAGES ==========
-                    elif cmd_type == 'get_messages':
-                        conversation_id = data.get('conversation_id')
-                        if conversation_id:
-                            messages = db.get_messages(conversation_id)
-                            await websocket.send(json.dumps({
-                                'type': 'messages',
-                                'messages': [
-                                    {
-                                        'role': m['role'],
-                                        'content': m['content'],
-                                        'created_at': m['created_at'].isoformat() if hasattr(m['created_at'], 'isoformat') else str(m['created_at'])
-                                    }
-                                    for m in messages
-                                ]
-                            }))
-                    
-                    # ========== NEW: NEW CONVERSATION ==========
-                    elif cmd_type == 'new_conversation':
-                        user_id = state.get('current_user_id')
-                        if user_id:
-                            conv_id = db.create_conversation(user_id, "New Chat")
-                            await websocket.send(json.dumps({
-                                'type': 'conversation_created',
-                                'conversation_id': conv_id
-                            }))
-                            state['current_conversation_id'] = conv_id
-                    
-                    # ========== EXISTING: Register face (old method - keep for compatibility) ==========
-                    elif cmd_type == 'register_user_old':
-                        user_name = data.get('name')
-                        if user_name:
-                            state['register_name'] = user_name
-                            state['register_mode'] = True
-                            await websocket.send(json.dumps({
-                                "type": "log",
-                                "content": f"📸 Registration mode ON. Capturing face for '{user_name}'..."
-                            }))
-                            print(colorama.Fore.YELLOW + f"[REGISTER] Waiting for face capture: {user_name}" + colorama.Style.RESET_ALL)
-                    
-                    # ========== REMINDER MANAGEMENT ==========
-                    elif cmd_type == 'create_reminder':
-                        user_id = state.get('current_user_id')
-                        if user_id:
-                            title = data.get('title')
-                            description = data.get('description', '')
-                            reminder_time = data.get('reminder_time')
-                            
-                            reminder_id = db.create_reminder(user_id, title, reminder_time, description)
-                            
-                            if reminder_id:
-                                await websocket.send(json.dumps({
-                                    'type': 'reminder_created',
-                                    'reminder_id': reminder_id
-                                }))
-                                
-                                # Send updated reminders list
-                                reminders = db.get_reminders(user_id)
-                                await websocket.send(json.dumps({
-                                    'type': 'reminders',
-                                    'reminders': [
-                                        {
-                                            'id': r['id'],
-                                            'title': r['title'],
-                                            'description': r['description'],
-                                            'reminder_time': r['reminder_time'].isoformat() if hasattr(r['reminder_time'], 'isoformat') else str(r['reminder_time']),
-                                            'is_completed': r['is_completed']
-                                        }
-                                        for r in reminders
-                                    ]
-                                }))
-                    
-                    elif cmd_type == 'get_reminders':
-                        user_id = state.get('current_user_id')
-                        if user_id:
-                            reminders = db.get_reminders(user_id)
-                            await websocket.send(json.dumps({
-                                'type': 'reminders',
-                                'reminders': [
-                                    {
-                                        'id': r['id'],
-                                        'title': r['title'],
-                                        'description': r['description'],
-                                        'reminder_time': r['reminder_time'].isoformat() if hasattr(r['reminder_time'], 'isoformat') else str(r['reminder_time']),
-                                        'is_completed': r['is_completed']
-                                    }
-                                    for r in reminders
-                                ]
-                            }))
-                    
-                    elif cmd_type == 'complete_reminder':
-                        reminder_id = data.get('reminder_id')
-                        if reminder_id:
-                            db.complete_reminder(reminder_id)
-                            await websocket.send(json.dumps({
-                                'type': 'reminder_completed',
-                                'reminder_id': reminder_id
-                            }))
-                    
-                    elif cmd_type == 'delete_reminder':
-                        reminder_id = data.get('reminder_id')
-                        if reminder_id:
-                            db.delete_reminder(reminder_id)
-                            await websocket.send(json.dumps({
-                                'type': 'reminder_deleted',
-                                'reminder_id': reminder_id
-                            }))
-                    
-                    # ========== TITLE GENERATION ==========
-                    elif cmd_type == 'generate_title':
-                        conv_id = data.get('conversation_id')
-                        if conv_id:
-                            messages = db.get_messages(conv_id)
-                            if len(messages) >= 2:
-                                message_list = [
-                                    {"role": msg['role'], "content": msg['content']}
-                                    for msg in messages[:4]
-                                ]
-                                
-                                loop = asyncio.get_running_loop()
-                                title = await loop.run_in_executor(
-                                    None,
-                                    llm.generate_conversation_title,
-                                    message_list
-                                )
-                                
-                                if title and title != "New Chat":
-                                    db.update_conversation_title(conv_id, title)
-                                    await websocket.send(json.dumps({
-                                        'type': 'title_updated',
-                                        'conversation_id': conv_id,
-                                        'title': title
-                                    }))
-                                    print(colorama.Fore.GREEN + f"[TITLE] Generated: {title}" + colorama.Style.RESET_ALL)
-                    
-                    # ========== MIC CONTROL ==========
-                    elif cmd_type == 'mute_mic':
-                        vad.mute()
-                        print(colorama.Fore.YELLOW + "[MIC] 🔇 Muted by user" + colorama.Style.RESET_ALL)
-                    
-                    elif cmd_type == 'unmute_mic':
-                        vad.unmute()
-                        print(colorama.Fore.GREEN + "[MIC] 🔊 Unmuted by user" + colorama.Style.RESET_ALL)
-                            
                 except json.JSONDecodeError:
-                    pass
+                    continue
+                
+                if isinstance(data, dict):
+                    await dispatcher.dispatch(websocket, state, data)
             
-            # 2. Xử lý image frames (bytes lớn hơn 5KB)
-            elif isinstance(message, bytes) and len(message) > 5000:
-                # Store for potential registration
-                last_face_image = message
+            # 2. Frame nhị phân (header + payload, payload là memoryview không copy)
+            elif isinstance(message, bytes):
+                try:
+                    frame = unpack_frame(message)
+                except ProtocolError as e:
+                    print(colorama.Fore.YELLOW + f"[WS] Bỏ qua frame lỗi: {e}" + colorama.Style.RESET_ALL)
+                    continue
                 
-                # Đẩy vào queue để face_recognition xử lý
-                await image_queue.put(message)
+                if frame.msg_type == VIDEO_FRAME:
+                    # Store for potential registration
+                    state['last_face_image'] = frame.payload
+                    
+                    # Ghi đè frame cũ chưa xử lý, không bao giờ chặn vòng nhận message
+                    frames.put(frame.payload)
+                
+                # PCM audio từ browser (16kHz int16)
+                elif frame.msg_type == AUDIO_UP and state.get('audio_session'):
+                    state['audio_session'].feed(frame.payload)
                 
     except websockets.exceptions.ConnectionClosed:
         print(colorama.Fore.YELLOW + "[WS] Connection closed" + colorama.Style.RESET_ALL)
@@ -937,7 +1281,7 @@ async def handle_websocket_messages(websocket, image_queue, state):
         traceback.print_exc()
     finally:
         # Signal face recognition to stop
-        await image_queue.put(None)
+        frames.close()
 
 
 # ==================== REMINDER CALLBACK ====================
@@ -949,7 +1293,7 @@ async def reminder_callback(reminder):
     print(colorama.Fore.CYAN + f"[REMINDER] Callback triggered for user #{user_id}: {reminder['title']}" + colorama.Style.RESET_ALL)
     
     # Mark as notified immediately (so it won't trigger again)
-    db.mark_reminder_notified(reminder['id'])
+    await adb.mark_reminder_notified(reminder['id'])
     
     # Check if user is connected
     if user_id in active_connections:
@@ -980,8 +1324,8 @@ async def reminder_callback(reminder):
                 wav_bytes = await loop.run_in_executor(None, tts.generate_audio_bytes, message)
                 
                 if wav_bytes:
-                    await websocket.send(json.dumps({"type": "audio", "content": "audio_data"}))
-                    await websocket.send(wav_bytes)
+                    # seq = 0: không cần client ack (không thuộc lượt hội thoại nào)
+                    await websocket.send(pack_frame(AUDIO_DOWN, wav_bytes))
                     print(colorama.Fore.GREEN + f"[REMINDER] ✅ TTS sent to user #{user_id}" + colorama.Style.RESET_ALL)
                 else:
                     print(colorama.Fore.YELLOW + f"[REMINDER] ⚠️ TTS unavailable" + colorama.Style.RESET_ALL)
@@ -1013,27 +1357,30 @@ async def socket_handler(websocket):
         'current_conversation_id': None,  # NEW
         'user_checked': False,  # NEW
         'is_new_user': False,  # NEW
-        'face_greeted': False,
-        'is_processing': False,
+        'turn': VoiceTurn(),  # Trạng thái lượt hội thoại (idle/listening/.../speaking)
+        'playback': PlaybackTracker(),  # Audio đang phát trên client (ack từ frontend)
         'face_emotion': None,  # Cảm xúc từ khuôn mặt
         'voice_emotion': None,  # Cảm xúc từ giọng nói
         'register_mode': False,  # Chế độ đăng ký user mới
-        'register_name': None  # Tên user đang đăng ký
+        'register_name': None,  # Tên user đang đăng ký
+        'audio_session': None,  # Audio stream từ browser (None = dùng micro server)
+        'last_face_image': None,  # Frame webcam gần nhất (dùng khi đăng ký user)
+        'tasks': set()  # Các lệnh đang chạy nền (xem CommandDispatcher)
     }
     
     # Queue để truyền image frames từ WebSocket đến face recognition
-    image_queue = asyncio.Queue(maxsize=2)  # Giới hạn 2 frames để tránh lag
+    frames = FrameMailbox()  # Chỉ giữ frame mới nhất
     
     try:
         # Chạy song song 3 tasks:
         # 1. Nhận WebSocket messages (video frames + commands)
         # 2. Xử lý face recognition
         # 3. Xử lý voice chat (VAD)
-        await asyncio.gather(
-            handle_websocket_messages(websocket, image_queue, state),
-            handle_face_recognition(websocket, state, image_queue),
-            handle_voice_chat(websocket, state),
-            return_exceptions=True
+        # Task 1 kết thúc (client ngắt kết nối) -> hủy task 2, 3 rồi mới dọn dẹp session
+        await run_connection(
+            handle_websocket_messages(websocket, frames, state),
+            handle_face_recognition(websocket, state, frames),
+            handle_voice_chat(websocket, state)
         )
         
     except websockets.exceptions.ConnectionClosed:
@@ -1042,6 +1389,9 @@ async def socket_handler(websocket):
         print(colorama.Fore.RED + f"\n[SERVER LỖI] {e}" + colorama.Style.RESET_ALL)
         traceback.print_exc()
     finally:
+        # Hủy các lệnh còn chạy nền (DB, title, greeting...) + đóng audio stream / STT streaming
+        await close_session(state)
+        
         # Remove from active connections
         user_id = state.get('current_user_id')
         if user_id and user_id in active_connections:
@@ -1053,6 +1403,10 @@ async def main():
     """Main server function"""
     print(colorama.Fore.CYAN + "\n[Server] Starting WebSocket Server on ws://localhost:8765..." + colorama.Style.RESET_ALL)
     
+    # Đo độ trễ event loop (DB / inference chạy nhầm trên loop sẽ hiện ở đây)
+    if os.getenv('LOOP_LAG_MONITOR', '1') != '0':
+        LoopLagMonitor().start()
+    
     # Set reminder callback
     reminder_scheduler.set_callback(reminder_callback)
     
@@ -0,0 +1,132 @@
+"""
+Test ChatDatabase khi server MySQL đóng connection rảnh (wait_timeout) - không cần MySQL thật
+mysql.connector.connect được thay bằng server giả: connection rảnh quá WAIT_TIMEOUT giây bị "đóng",
+câu lệnh tiếp theo trên nó lỗi như connector thật:
+- MySQL < 8.0.24: InterfaceError 2013 (EOF khi đọc kết quả)
+- MySQL 8.0.24+: DatabaseError 4031 (ER_CLIENT_INTERACTION_TIMEOUT)
+Phải: INSERT đầu tiên sau khi rảnh vẫn được ghi đúng một dòng; còn 2013 giữa chừng trên connection
+đang dùng (INSERT có thể đã ghi) thì không chạy lại.
+
+    python test_db_reconnect.py
+"""
+
+import os
+import sys
+import time
+import colorama
+import mysql.connector
+from mysql.connector import errors
+
+from modules.database import ChatDatabase
+
+colorama.init()
+
+WAIT_TIMEOUT = 0.2
+
+
+class FakeServer:
+    def __init__(self, mysql_8024=False):
+        self.mysql_8024 = mysql_8024
+        self.rows = []
+        self.fail_next_write = False  # 2013 sau khi INSERT đã được ghi
+
+    def connect(self, **config):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def _check(self):
+        if self.closed:
+            raise errors.OperationalError(msg="MySQL Connection not available", errno=2006)
+        if time.monotonic() - self.last_used > WAIT_TIMEOUT:
+            self.closed = True
+            if self.server.mysql_8024:
+                raise errors.DatabaseError(msg="The client was disconnected by the server because of inactivity", errno=4031)
+            raise errors.InterfaceError(msg="Lost connection to MySQL server during query", errno=2013)
+        self.last_used = time.monotonic()
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        try:
+            self._check()
+        except errors.Error:
+            raise errors.InterfaceError("Connection to MySQL is not available")
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.row = None
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        self.conn._check()
+        if query.startswith("INSERT"):
+            self.conn.server.rows.append(params)
+            self.lastrowid = len(self.conn.server.rows)
+            if self.conn.server.fail_next_write:
+                self.conn.server.fail_next_write = False
+                self.conn.closed = True
+                raise errors.InterfaceError(msg="Lost connection to MySQL server during query", errno=2013)
+        elif "wait_timeout" in query:
+            self.row = {'wait_timeout': 28800}
+        else:
+            self.row = {'n': 1}
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+def run_case(name, server, recycle, check):
+    mysql.connector.connect = server.connect
+    os.environ['MYSQL_POOL_RECYCLE'] = str(recycle)
+    db = ChatDatabase()
+
+    ok = check(db, server)
+    color = colorama.Fore.GREEN if ok else colorama.Fore.RED
+    print(color + f"  [{'PASS' if ok else 'FAIL'}] {name} (rows={len(server.rows)}, stats={db.stats()})" + colorama.Style.RESET_ALL)
+    return ok
+
+
+def insert_after_idle(db, server):
+    db.add_message(1, 'user', 'before idle')
+    time.sleep(WAIT_TIMEOUT * 2)
+    return db.add_message(1, 'user', 'after idle') and len(server.rows) == 2
+
+
+def lost_mid_write(db, server):
+    db.add_message(1, 'user', 'hello')
+    server.fail_next_write = True
+    # INSERT đã ghi nhưng client mất kết quả -> không chạy lại (sẽ thành 2 dòng)
+    return not db.add_message(1, 'user', 'maybe applied') and len(server.rows) == 2
+
+
+def main():
+    print(colorama.Fore.CYAN + "\n🔌 DB reconnect test (fake MySQL, wait_timeout={}s)".format(WAIT_TIMEOUT) + colorama.Style.RESET_ALL)
+    results = [
+        # Pool ping connection rảnh lâu hơn recycle -> bỏ connection chết trước khi INSERT
+        run_case("INSERT after idle, server closed connection (2013), pre-ping", FakeServer(), WAIT_TIMEOUT / 2, insert_after_idle),
+        # Không ping (recycle lớn): 4031 nghĩa là query chưa chạy -> INSERT được chạy lại
+        run_case("INSERT after idle, MySQL 8.0.24+ (4031), no pre-ping", FakeServer(mysql_8024=True), 3600, insert_after_idle),
+        run_case("2013 mid-write on a hot connection is not retried", FakeServer(), 3600, lost_mid_write),
+    ]
+    if not all(results):
+        sys.exit(1)
+    print(colorama.Fore.GREEN + "✅ All reconnect cases passed" + colorama.Style.RESET_ALL)
+
+
+if __name__ == "__main__":
+    main()
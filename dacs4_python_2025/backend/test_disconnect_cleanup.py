@@ -0,0 +1,105 @@
+"""
+Test dọn dẹp khi client ngắt kết nối (không cần API key / mạng)
+Server WebSocket ghép các task giống socket_handler (run_connection + close_session):
+- Voice task chặn trong AudioSession.listen() và nuốt mọi Exception như handle_voice_chat
+- Đã mở kết nối Deepgram live (fake server) + có một lệnh đang chạy nền trong state['tasks']
+Client ngắt kết nối -> phải: voice task dừng, lệnh nền bị hủy, transcriber.close() được gọi,
+kết nối Deepgram live được đóng.
+
+    python test_disconnect_cleanup.py
+"""
+
+import asyncio
+import sys
+import colorama
+import websockets
+
+from fake_deepgram_server import serve
+from modules.audio_session import AudioSession
+from modules.connection import close_session, run_connection
+from modules.dispatcher import track_task
+from modules.stt_stream import StreamingTranscriber
+
+colorama.init()
+
+DEEPGRAM_PORT = 8767
+SERVER_PORT = 8768
+
+
+async def run():
+    result = {}
+    cleaned = asyncio.Event()
+
+    async def receive(websocket):
+        try:
+            async for _ in websocket:
+                pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def voice(state):
+        # Giống handle_voice_chat: lỗi của một lượt chỉ được log rồi nghe tiếp
+        while True:
+            try:
+                await state['audio_session'].listen()
+            except Exception as e:
+                print(f"  voice error swallowed: {e}")
+
+    async def handler(websocket, *_):
+        transcriber = StreamingTranscriber('test-key', url=f'ws://localhost:{DEEPGRAM_PORT}/v1/listen', keepalive=0.5)
+        transcriber.start()
+        close = transcriber.close
+
+        def recording_close():
+            result['close_called'] = True
+            close()
+        transcriber.close = recording_close
+
+        # Model VAD không được dùng: không có audio nào tới session
+        state = {'tasks': set(), 'audio_session': AudioSession(None, transcriber=transcriber)}
+        transcriber.begin(b'\x00' * 1024)  # Câu nói đang dở -> kết nối Deepgram đang mở
+        background = track_task(state, asyncio.sleep(3600))  # Lệnh chạy nền (DB, LLM...)
+        result['transcriber'] = transcriber
+
+        try:
+            await run_connection(receive(websocket), voice(state))
+        finally:
+            await close_session(state)
+            result['background_cancelled'] = background.cancelled()
+            cleaned.set()
+
+    passed = True
+    async with serve(DEEPGRAM_PORT):
+        async with websockets.serve(handler, 'localhost', SERVER_PORT):
+            client = await websockets.connect(f'ws://localhost:{SERVER_PORT}')
+            await asyncio.sleep(0.5)
+            connected = result['transcriber'].stats()['connections'] == 1
+            await client.close()
+
+            try:
+                await asyncio.wait_for(cleaned.wait(), 3)
+                cleanup_ran = True
+            except asyncio.TimeoutError:
+                cleanup_ran = False
+            await asyncio.sleep(0.3)  # transcriber gửi CloseStream trên event loop
+
+            checks = [
+                ("Deepgram live connected before disconnect", connected),
+                ("socket handler cleanup ran", cleanup_ran),
+                ("background task cancelled", result.get('background_cancelled', False)),
+                ("transcriber.close() called", result.get('close_called', False)),
+                ("Deepgram live socket closed", result['transcriber']._ws is None),
+            ]
+            for name, good in checks:
+                passed &= bool(good)
+                print(f"  {name}: {'PASS' if good else 'FAIL'}")
+
+    if passed:
+        print(colorama.Fore.GREEN + "\n✅ Disconnect cleanup OK" + colorama.Style.RESET_ALL)
+    else:
+        print(colorama.Fore.RED + "\n❌ Disconnect cleanup test failed" + colorama.Style.RESET_ALL)
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run()) else 1)
@@ -0,0 +1,91 @@
+"""
+Test STT streaming với fake Deepgram server (không cần API key / mạng)
+- Gửi audio theo tốc độ thật từ một thread (giống thread VAD), nhiều câu trên cùng một kết nối
+- Đo thời gian từ lúc ngắt câu đến khi có transcript cuối
+- Kiểm tra fallback khi server chết giữa câu
+
+    python test_stt_stream.py [--utterances 3] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import colorama
+import numpy as np
+
+from fake_deepgram_server import WORD_SECONDS, serve
+from modules.stt_stream import StreamingTranscriber
+
+colorama.init()
+
+CHUNK = 512
+RATE = 16000
+
+
+def speak(transcriber, seconds, realtime=True):
+    """Giả lập thread VAD: begin -> audio từng chunk 32ms -> end"""
+    samples = (np.random.default_rng(0).standard_normal(int(seconds * RATE)) * 3000).astype(np.int16)
+    chunks = [samples[i:i + CHUNK].tobytes() for i in range(0, len(samples), CHUNK)]
+    transcriber.begin(b''.join(chunks[:16]))  # Pre-buffer ~0.5s
+    for chunk in chunks[16:]:
+        transcriber.audio(chunk)
+        if realtime:
+            time.sleep(CHUNK / RATE)
+    transcriber.end()
+    return time.time()
+
+
+async def run(args):
+    port = 8766
+    interims = []
+    passed = True
+
+    async with serve(port, args.latency) as server:
+        transcriber = StreamingTranscriber('test-key', url=f'ws://localhost:{port}/v1/listen',
+                                           keepalive=0.5, on_interim=interims.append)
+        transcriber.start()
+        loop = asyncio.get_running_loop()
+
+        print(colorama.Fore.CYAN + f"\n[1/2] {args.utterances} utterances on one connection" + colorama.Style.RESET_ALL)
+        for n in range(args.utterances):
+            seconds = 1.0 + n
+            t_end = await loop.run_in_executor(None, speak, transcriber, seconds)
+            text = await transcriber.result()
+            latency = (time.time() - t_end) * 1000
+            words = len(text.split()) if text else 0
+            expected = int(seconds / WORD_SECONDS)
+            good = text is not None and abs(words - expected) <= 1
+            passed &= good
+            print(f"  {seconds:.1f}s audio -> {words} words (expected ~{expected}) | final transcript {latency:.0f}ms after endpoint | {'PASS' if good else 'FAIL'}")
+            await asyncio.sleep(1.2)  # Khoảng nghỉ giữa các câu: chỉ có KeepAlive
+
+        stats = transcriber.stats()
+        good = stats['connections'] == 1
+        passed &= good
+        print(f"  interim transcripts: {len(interims)}, connections: {stats['connections']} | {'PASS' if good else 'FAIL'}")
+
+        print(colorama.Fore.CYAN + "\n[2/2] Server dies mid-utterance -> result() is None (REST fallback)" + colorama.Style.RESET_ALL)
+        transcriber.begin(b'\x00' * CHUNK * 2)
+        await asyncio.sleep(0.1)
+        server.close()
+        await server.wait_closed()
+        await loop.run_in_executor(None, speak, transcriber, 0.5, False)
+        text = await transcriber.result()
+        good = text is None
+        passed &= good
+        print(f"  result: {text!r} | {'PASS' if good else 'FAIL'}")
+        transcriber.close()
+
+    if passed:
+        print(colorama.Fore.GREEN + "\n✅ STT streaming OK" + colorama.Style.RESET_ALL)
+    else:
+        print(colorama.Fore.RED + "\n❌ STT streaming test failed" + colorama.Style.RESET_ALL)
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test STT streaming against the fake Deepgram server")
+    parser.add_argument('--utterances', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help="Thời gian fake server xử lý Finalize")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
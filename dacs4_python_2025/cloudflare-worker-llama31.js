@@ -24,7 +24,7 @@ export default {
 
     try {
       const body = await request.json();
-      const { messages, max_tokens = 100, temperature = 0.7 } = body;
+      const { messages, max_tokens = 100, temperature = 0.7, stream = false } = body;
 
       if (!messages || !Array.isArray(messages)) {
         return new Response(JSON.stringify({ 
@@ -35,6 +35,24 @@ export default {
         });
       }
 
+      // Stream từng token (Server-Sent Events) để backend đọc câu đầu tiên sớm
+      if (stream) {
+        const eventStream = await env.AI.run('@cf/meta/llama-3.1-8b-instruct', {
+          messages: messages,
+          max_tokens: max_tokens,
+          temperature: temperature,
+          stream: true
+        });
+
+        return new Response(eventStream, {
+          headers: {
+            ...corsHeaders,
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache'
+          }
+        });
+      }
+
       // Llama 3.1 8B Instruct - Model tốt nhất trên Cloudflare
       const response = await env.AI.run('@cf/meta/llama-3.1-8b-instruct', {
         messages: messages,
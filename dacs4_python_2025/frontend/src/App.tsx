@@ -4,6 +4,8 @@ import SettingsModal from './components/SettingsModal';
 import FaceScanOverlay from './components/FaceScanOverlay';
 import ReminderModal from './components/ReminderModal';
 import ReminderNotification from './components/ReminderNotification';
+import { packVideoFrame, allocAudioFrame, readHeader, HEADER_SIZE, MSG_AUDIO_DOWN } from './protocol';
+import { createDownsampler, MIC_SAMPLE_RATE } from './downsample';
 
 interface Conversation {
   id: number;
@@ -67,9 +69,17 @@ function App() {
   const analyserRef = useRef<AnalyserNode | null>(null);
   const animationFrameRef = useRef<number>(0);
 
-  // Hàng đợi âm thanh
-  const audioQueueRef = useRef<AudioBuffer[]>([]);
+  // Refs quản lý Mic stream lên server
+  const micStreamRef = useRef<MediaStream | null>(null);
+  const micContextRef = useRef<AudioContext | null>(null);
+
+  // Hàng đợi âm thanh (audioId dùng để báo server khi phát xong)
+  const audioQueueRef = useRef<{ buffer: AudioBuffer; audioId: number | null }[]>([]);
   const isPlayingRef = useRef(false);
+  const lastAudioIdRef = useRef<number | null>(null);
+  const currentSourceRef = useRef<AudioBufferSourceNode | null>(null);
+  const playbackEpochRef = useRef(0); // Tăng khi server yêu cầu dừng phát (barge-in)
+  const decodeChainRef = useRef<Promise<void>>(Promise.resolve()); // Đưa audio vào hàng đợi theo thứ tự nhận
 
   // Visualizer loop
   const animateOrb = useCallback(() => {
@@ -93,16 +103,24 @@ function App() {
     animationFrameRef.current = requestAnimationFrame(animateOrb);
   }, []);
 
+  // Báo server trạng thái phát audio (playback_started / playback_finished)
+  const sendPlaybackEvent = (type: string, audioId: number | null) => {
+    if (audioId === null) return;
+    if (socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
+      socketRef.current.send(JSON.stringify({ type, audio_id: audioId }));
+    }
+  };
+
   // Process audio queue
   const processAudioQueue = async () => {
     if (isPlayingRef.current || (audioQueueRef.current?.length || 0) === 0 || !audioContextRef.current) return;
 
     isPlayingRef.current = true;
-    const buffer = audioQueueRef.current?.shift();
+    const item = audioQueueRef.current?.shift();
 
-    if (buffer) {
+    if (item) {
       const source = audioContextRef.current.createBufferSource();
-      source.buffer = buffer;
+      source.buffer = item.buffer;
 
       if (analyserRef.current) {
         source.connect(analyserRef.current);
@@ -110,12 +128,29 @@ function App() {
       source.connect(audioContextRef.current.destination);
 
       source.onended = () => {
+        currentSourceRef.current = null;
         isPlayingRef.current = false;
+        sendPlaybackEvent('playback_finished', item.audioId);
         processAudioQueue();
       };
 
+      currentSourceRef.current = source;
       source.start(0);
+      sendPlaybackEvent('playback_started', item.audioId);
+    }
+  };
+
+  // Dừng ngay audio đang phát và bỏ hàng đợi (user nói chen)
+  const stopPlayback = () => {
+    playbackEpochRef.current += 1;
+    audioQueueRef.current = [];
+    const source = currentSourceRef.current;
+    currentSourceRef.current = null;
+    if (source) {
+      source.onended = null;
+      try { source.stop(); } catch (e) {}
     }
+    isPlayingRef.current = false;
   };
 
   // Initialize system
@@ -153,9 +188,14 @@ function App() {
         
         // Audio stream for mic
         const audioStream = await navigator.mediaDevices.getUserMedia({
-          audio: true,
+          audio: {
+            channelCount: 1,
+            echoCancellation: true,
+            noiseSuppression: true
+          },
           video: false
         });
+        micStreamRef.current = audioStream;
         
         const micSource = audioCtx.createMediaStreamSource(audioStream);
         micSource.connect(analyser);
@@ -189,6 +229,7 @@ function App() {
     document.body.appendChild(video);
 
     let recognitionAttempts = 0;
+    let frameSeq = 0;
     const maxAttempts = 5; // Try 5 times (10 seconds)
 
     const intervalId = setInterval(() => {
@@ -218,7 +259,7 @@ function App() {
       canvas.toBlob((blob) => {
         if (blob && socketRef.current) {
           console.log(`[FACE] Sending image attempt ${recognitionAttempts + 1}/${maxAttempts}...`);
-          socketRef.current.send(blob);
+          socketRef.current.send(packVideoFrame(blob, frameSeq++));
           recognitionAttempts++;
           setFaceScanMessage(`Scanning... (${recognitionAttempts}/${maxAttempts})`);
         }
@@ -226,6 +267,42 @@ function App() {
     }, 2000);
   };
 
+  // Stream mic lên server (PCM 16kHz, 16-bit) - mỗi tab có VAD riêng trên server
+  const startMicStreaming = (ws: WebSocket) => {
+    const stream = micStreamRef.current;
+    if (!stream || micContextRef.current) return;
+
+    // Context ở sample rate của thiết bị (Firefox không nối được mic vào context 16 kHz),
+    // hạ xuống 16 kHz trước khi gửi
+    const micCtx = new AudioContext();
+    micContextRef.current = micCtx;
+
+    const source = micCtx.createMediaStreamSource(stream);
+    const processor = micCtx.createScriptProcessor(1024, 1, 1);  // ~21ms ở 48 kHz
+    const downsample = createDownsampler(micCtx.sampleRate, MIC_SAMPLE_RATE);
+    let chunkSeq = 0;
+
+    processor.onaudioprocess = (e) => {
+      if (ws.readyState !== WebSocket.OPEN) return;
+
+      const input = downsample(e.inputBuffer.getChannelData(0));
+      if (input.length === 0) return;
+
+      // PCM ghi thẳng vào buffer sau header (không copy thêm)
+      const { buffer, pcm } = allocAudioFrame(input.length, chunkSeq++);
+      for (let i = 0; i < input.length; i++) {
+        const sample = Math.max(-1, Math.min(1, input[i]));
+        pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7fff;
+      }
+      ws.send(buffer);
+    };
+
+    source.connect(processor);
+    processor.connect(micCtx.destination);
+
+    ws.send(JSON.stringify({ type: 'audio_stream_start', sample_rate: MIC_SAMPLE_RATE }));
+  };
+
   // WebSocket connection
   const connectWebSocket = (audioCtx: AudioContext) => {
     const wsUrl = 'ws://localhost:8765';
@@ -235,6 +312,7 @@ function App() {
 
     ws.onopen = () => {
       console.log("✅ Đã kết nối tới Brain!");
+      startMicStreaming(ws);
       // Don't load conversations here - will be loaded after login
     };
     
@@ -295,6 +373,9 @@ function App() {
           } else if (data.type === 'emotion_update') {
             if (data.emotion) setUserEmotion(data.emotion);
             if (data.user) setUserName(data.user);
+          } else if (data.type === 'stop_playback') {
+            // Server đã hủy lượt trả lời (barge-in), không cần ack
+            stopPlayback();
           } else if (data.type === 'user_text') {
             addMessage('user', data.content);
           } else if (data.type === 'text') {
@@ -341,13 +422,29 @@ function App() {
           }
         } catch(e) {}
       } else if (event.data instanceof ArrayBuffer) {
-        try {
-          const audioBuffer = await audioCtx.decodeAudioData(event.data);
-          audioQueueRef.current.push(audioBuffer);
-          processAudioQueue();
-        } catch (err) {
-          console.error("Lỗi decode audio:", err);
-        }
+        // Frame nhị phân: header (msgType, seq = audio_id) + audio TTS
+        const header = readHeader(event.data);
+        if (!header || header.msgType !== MSG_AUDIO_DOWN) return;
+        const audioId = header.seq > 0 ? header.seq : null;  // seq 0 = không cần ack
+        if (audioId !== null) lastAudioIdRef.current = audioId;
+        const epoch = playbackEpochRef.current;
+        // Decode song song nhưng vào hàng đợi đúng thứ tự nhận: câu ngắn phía sau decode xong trước
+        // không được phát trước câu dài phía trước (playback_finished của audio_id sẽ sai)
+        const decoding = audioCtx.decodeAudioData(event.data.slice(HEADER_SIZE));
+        decoding.catch(() => {});  // Lỗi được xử lý trong chuỗi bên dưới
+        decodeChainRef.current = decodeChainRef.current.then(async () => {
+          try {
+            const audioBuffer = await decoding;
+            // Audio của lượt đã bị hủy trong lúc đang decode -> bỏ
+            if (epoch !== playbackEpochRef.current) return;
+            audioQueueRef.current.push({ buffer: audioBuffer, audioId });
+            processAudioQueue();
+          } catch (err) {
+            console.error("Lỗi decode audio:", err);
+            // Không phát được -> báo server để không phải chờ
+            sendPlaybackEvent('playback_finished', audioId);
+          }
+        });
       }
     };
   };
@@ -386,8 +483,8 @@ function App() {
       }
       
       // Stop any ongoing audio playback
-      audioQueueRef.current = [];
-      isPlayingRef.current = false;
+      stopPlayback();
+      sendPlaybackEvent('playback_finished', lastAudioIdRef.current);
       
       // Clear messages and reset state
       setMessages([]);
@@ -460,6 +557,7 @@ function App() {
     return () => {
       if (socketRef.current) socketRef.current.close();
       if (audioContextRef.current) audioContextRef.current.close();
+      if (micContextRef.current) micContextRef.current.close();
       if (animationFrameRef.current) cancelAnimationFrame(animationFrameRef.current);
     };
   }, []);
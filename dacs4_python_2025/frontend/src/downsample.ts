@@ -0,0 +1,37 @@
+// Hạ sample rate của mic (48 kHz / 44.1 kHz...) xuống 16 kHz cho VAD + STT trên server
+// AudioContext phải chạy ở sample rate của thiết bị: Firefox không cho nối MediaStreamSource
+// vào context có sample rate khác
+
+export const MIC_SAMPLE_RATE = 16000;
+
+// Trả về hàm xử lý từng buffer input; trạng thái (mẫu dư, vị trí lẻ) được giữ giữa các lần gọi
+// để ghép liền mạch. Mỗi mẫu output là trung bình các mẫu input nó phủ (lọc chống aliasing đơn giản).
+// Kết quả là view trên buffer dùng lại - đọc xong trước lần gọi sau.
+export const createDownsampler = (inputRate: number, outputRate = MIC_SAMPLE_RATE) => {
+  const ratio = inputRate / outputRate;
+  let next = ratio;  // Vị trí (tính từ đầu buffer hiện tại) kết thúc mẫu output tiếp theo
+  let sum = 0;
+  let count = 0;
+  let last = 0;
+  let output = new Float32Array(0);
+
+  return (input: Float32Array): Float32Array => {
+    const maxSamples = Math.ceil(input.length / ratio) + 1;
+    if (output.length < maxSamples) output = new Float32Array(maxSamples);
+
+    let n = 0;
+    for (let i = 0; i < input.length; i++) {
+      sum += input[i];
+      count++;
+      while (i + 1 >= next) {
+        last = count ? sum / count : last;  // ratio < 1 (mic 8 kHz): lặp lại mẫu trước
+        output[n++] = last;
+        sum = 0;
+        count = 0;
+        next += ratio;
+      }
+    }
+    next -= input.length;
+    return output.subarray(0, n);
+  };
+};
@@ -0,0 +1,52 @@
+// Binary WebSocket protocol - khớp với backend/modules/protocol.py
+// Header 16 bytes (little-endian): version u8 | msgType u8 | streamId u16 | seq u32 | timestamp f64
+
+export const PROTOCOL_VERSION = 1;
+export const HEADER_SIZE = 16;
+
+export const MSG_VIDEO_FRAME = 1;
+export const MSG_AUDIO_UP = 2;
+export const MSG_AUDIO_DOWN = 3;
+
+export interface FrameHeader {
+  msgType: number;
+  streamId: number;
+  seq: number;
+  timestamp: number;
+}
+
+// Ghi header vào đầu buffer (buffer đã chừa sẵn HEADER_SIZE bytes)
+export const writeHeader = (buffer: ArrayBuffer, msgType: number, seq: number, streamId = 0) => {
+  const view = new DataView(buffer, 0, HEADER_SIZE);
+  view.setUint8(0, PROTOCOL_VERSION);
+  view.setUint8(1, msgType);
+  view.setUint16(2, streamId, true);
+  view.setUint32(4, seq >>> 0, true);
+  view.setFloat64(8, Date.now() / 1000, true);
+};
+
+// Đóng gói ảnh webcam: header + JPEG blob (Blob ghép, không copy dữ liệu ảnh)
+export const packVideoFrame = (jpeg: Blob, seq: number): Blob => {
+  const header = new ArrayBuffer(HEADER_SIZE);
+  writeHeader(header, MSG_VIDEO_FRAME, seq);
+  return new Blob([header, jpeg]);
+};
+
+// Cấp phát buffer cho một chunk mic: header + PCM int16 (ghi PCM thẳng vào view trả về)
+export const allocAudioFrame = (samples: number, seq: number): { buffer: ArrayBuffer; pcm: Int16Array } => {
+  const buffer = new ArrayBuffer(HEADER_SIZE + samples * 2);
+  writeHeader(buffer, MSG_AUDIO_UP, seq);
+  return { buffer, pcm: new Int16Array(buffer, HEADER_SIZE, samples) };
+};
+
+export const readHeader = (buffer: ArrayBuffer): FrameHeader | null => {
+  if (buffer.byteLength < HEADER_SIZE) return null;
+  const view = new DataView(buffer, 0, HEADER_SIZE);
+  if (view.getUint8(0) !== PROTOCOL_VERSION) return null;
+  return {
+    msgType: view.getUint8(1),
+    streamId: view.getUint16(2, true),
+    seq: view.getUint32(4, true),
+    timestamp: view.getFloat64(8, true),
+  };
+};